@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Size and CPU cost of compressing typical API responses.
+
+Encodes an expanded ``/records/`` page of ``--records`` records and the
+``/currencies/`` payload as the API does, then compresses them with every
+available encoding at a few levels, ``--repeat`` times each.
+
+    $ python benchmarks/compression.py --records 100 --repeat 100
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('SERVER_NAME', 'localhost')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ.setdefault('DB_URI', 'sqlite://')
+
+
+def payloads(records):
+    import pycountry
+
+    from monetario.extensions import json_encoder
+
+    page = {
+        'objects': [record.to_json().data for record in records],
+        'meta': {'page': 1, 'per_page': len(records), 'total': len(records), 'pages': 1},
+    }
+    currencies = {'currencies': [
+        {'symbol': currency.letter, 'name': currency.name}
+        for currency in pycountry.currencies.objects
+    ]}
+
+    yield '/records/', json_encoder.dumps(page).encode('utf-8')
+    yield '/currencies/', json_encoder.dumps(currencies).encode('utf-8')
+
+
+def settings():
+    from monetario import compression
+
+    for level in (1, 6, 9):
+        yield 'gzip', 'COMPRESS_LEVEL', level
+    yield 'deflate', 'COMPRESS_LEVEL', 6
+    if compression.brotli is not None:
+        for quality in (1, 4, 11):
+            yield 'br', 'COMPRESS_BROTLI_QUALITY', quality
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    from records_page import load_records
+
+    from monetario.app import create_app
+    from monetario.compression import Compress
+    from monetario.extensions import db
+
+    handle, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(handle)
+
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+
+    with app.app_context():
+        db.create_all()
+
+        for name, data in payloads(load_records(args.records)):
+            print('{:<12} {:>8} bytes'.format(name, len(data)))
+
+            for encoding, setting, level in settings():
+                app.config[setting] = level
+                compress = Compress()
+                compress.init_app(app)
+
+                def run():
+                    compressor = compress.compressor(encoding)
+                    return compressor.compress(data) + compressor.finish()
+
+                seconds = timeit.timeit(run, number=args.repeat) / args.repeat
+                size = len(run())
+                print('  {:<8} {:>2} {:>8} bytes {:>6.1f}% {:>8.3f} ms'.format(
+                    encoding, level, size, 100.0 * size / len(data), seconds * 1000
+                ))
+
+    os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+Login throughput versus latency of concurrent authenticated GETs.
+
+Every scenario runs ``--logins`` threads hammering ``POST /API/v1/token/``
+and one thread timing ``GET /API/v1/users/current/`` for ``--seconds``
+seconds against a throwaway SQLite database. The ``unbounded`` scenario
+lets every login hash at once, ``bounded`` uses the password hashing pool
+as configured (``PASSWORD_HASH_WORKERS`` / ``PASSWORD_HASH_QUEUE_SIZE``).
+
+    $ python benchmarks/login_throughput.py --logins 8 --seconds 10
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('SERVER_NAME', 'localhost')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ.setdefault('DB_URI', 'sqlite://')
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def run(scenario, logins, seconds, hash_workers, hash_queue):
+    from monetario.app import create_app
+    from monetario.extensions import db, password_hasher
+    from monetario.models import App, Group, Token, User
+
+    handle, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(handle)
+
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:50000'
+    app.config['PASSWORD_HASH_WORKERS'] = hash_workers
+    app.config['PASSWORD_HASH_QUEUE_SIZE'] = hash_queue
+    password_hasher.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+
+        group = Group(name='benchmark')
+        user = User(email='benchmark@example.com', first_name='Bench', password='111', group=group)
+        api_app = App(name='benchmark', user=user)
+        db.session.add_all([group, user, api_app])
+        db.session.commit()
+
+        api_app.secret = api_app.generate_auth_token()
+        token = Token(app=api_app, user=user)
+        db.session.add(token)
+        db.session.commit()
+        token.issue(expires_in=3600)
+        db.session.commit()
+
+        secret, auth_token = api_app.secret, token.token
+        login_body = json.dumps({'email': user.email, 'password': '111', 'secret': secret})
+
+    stop = threading.Event()
+    results = {'logins': 0, 'rejected': 0, 'latencies': []}
+    lock = threading.Lock()
+
+    def login():
+        client = app.test_client()
+        while not stop.is_set():
+            with app.app_context():
+                response = client.post('/API/v1/token/', data=login_body,
+                                       content_type='application/json')
+            with lock:
+                if response.status_code == 200:
+                    results['logins'] += 1
+                elif response.status_code == 503:
+                    results['rejected'] += 1
+
+    def get():
+        client = app.test_client()
+        while not stop.is_set():
+            started = time.time()
+            with app.app_context():
+                client.get('/API/v1/users/current/', headers={'Authentication-Token': auth_token})
+            results['latencies'].append((time.time() - started) * 1000)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=login) for x in range(logins)]
+    threads.append(threading.Thread(target=get))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    os.unlink(path)
+
+    latencies = results['latencies']
+    print('{:<10} logins/s {:>7.1f}   503/s {:>7.1f}   GET p50 {:>7.1f} ms   p95 {:>7.1f} ms'.format(
+        scenario,
+        results['logins'] / float(seconds),
+        results['rejected'] / float(seconds),
+        percentile(latencies, 50),
+        percentile(latencies, 95),
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--logins', type=int, default=8, help='concurrent login threads')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--hash-workers', type=int, default=2)
+    parser.add_argument('--hash-queue', type=int, default=2)
+    args = parser.parse_args()
+
+    run('unbounded', args.logins, args.seconds, args.logins, 0)
+    run('bounded', args.logins, args.seconds, args.hash_workers, args.hash_queue)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+"""
+Query plans of the records and balance endpoints before and after the
+composite indexes of the record table.
+
+Seeds ``--users`` users with ``--records`` records each, spread over two
+years and a few categories, calls the endpoints as one of them and prints
+the plan of every query they run on the record table, first with the
+single-column indexes only (``before``) and then with the indexes of the
+models (``after``). Runs on a throwaway SQLite database unless ``--db``
+names another one (which gets its tables created and dropped).
+
+    $ python benchmarks/record_indexes.py --users 20 --records 2000
+    $ python benchmarks/record_indexes.py --db postgresql://localhost/monetario_bench
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('SERVER_NAME', 'localhost')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ.setdefault('DB_URI', 'sqlite://')
+
+
+URLS = (
+    '/API/v1/records/?sort=date,desc&per_page=20',
+    '/API/v1/records/?filter=category_id,eq,{category}&sort=date,desc&per_page=20',
+    '/API/v1/balance/2015/6/',
+    '/API/v1/cash_flows/?date_from=2015-01-01&date_to=2016-01-01',
+    '/API/v1/incomes/?date_from=2015-01-01&date_to=2016-01-01',
+    '/API/v1/expenses/?date_from=2015-01-01&date_to=2016-01-01',
+)
+
+# the indexes of the record table added along with this script
+NEW_INDEXES = (
+    'ix_record_user_id_date',
+    'ix_record_user_id_category_id_date',
+    'ix_record_date_brin',
+)
+
+
+def seed(users, records):
+    from monetario import rollups
+    from monetario.extensions import db
+    from monetario.models import Account, App, Group, GroupCategory, GroupCurrency
+    from monetario.models import Record, Token, User
+
+    group = Group(name='benchmark')
+    currency = GroupCurrency(name='US Dollar', symbol='USD', group=group)
+    categories = [
+        GroupCategory(name='Category {}'.format(x), colour='red', logo='x.png', group=group,
+                      category_type=GroupCategory.CATEGORY_TYPE_EXPENSE)
+        for x in range(10)
+    ]
+    owners = [
+        User(email='user{}@example.com'.format(x), first_name='Bench', password='111',
+             group=group)
+        for x in range(users)
+    ]
+    accounts = [Account(name='Cash', user=user, currency=currency) for user in owners]
+    db.session.add_all([group, currency] + categories + owners + accounts)
+    db.session.commit()
+
+    random.seed(0)
+    start = datetime.datetime(2014, 7, 1, tzinfo=datetime.timezone.utc)
+
+    for user, account in zip(owners, accounts):
+        db.session.execute(Record.__table__.insert(), [
+            {
+                'amount': round(random.uniform(1, 500), 2),
+                'description': 'Record {}'.format(x),
+                'record_type': random.choice((Record.RECORD_TYPE_INCOME,
+                                              Record.RECORD_TYPE_EXPENSE)),
+                'payment_method': Record.PAYMENT_METHOD_CASH,
+                'date': start + datetime.timedelta(minutes=x * 730 * 24 * 60 // records),
+                'user_id': user.id,
+                'account_id': account.id,
+                'currency_id': currency.id,
+                'category_id': random.choice(categories).id,
+            }
+            for x in range(records)
+        ])
+    # the bulk inserts bypass the session, and so the rollups
+    rollups.rebuild()
+    db.session.commit()
+
+    user = owners[0]
+    api_app = App(name='benchmark', user=user)
+    db.session.add(api_app)
+    db.session.commit()
+
+    api_app.secret = api_app.generate_auth_token()
+    token = Token(app=api_app, user=user)
+    db.session.add(token)
+    db.session.commit()
+    token.issue(expires_in=3600)
+    db.session.commit()
+
+    return token.token, categories[0].id
+
+
+def explain(connection, statement, parameters):
+    if connection.dialect.name == 'postgresql':
+        rows = connection.execute('EXPLAIN ' + statement, parameters)
+        return [row[0] for row in rows]
+
+    # through the DBAPI cursor, pysqlite describes no columns for EXPLAIN
+    cursor = connection.connection.cursor()
+    cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+    return [row[-1] for row in cursor.fetchall()]
+
+
+def plans(app, token, category):
+    from sqlalchemy import event
+
+    from monetario.extensions import db
+
+    statements = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        # but the change markers of the ETags
+        if 'FROM record' in statement and 'max(' not in statement:
+            statements.append((statement, parameters))
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', capture)
+    client = app.test_client()
+
+    for url in URLS:
+        url = url.format(category=category)
+        del statements[:]
+
+        try:
+            client.get(url, headers={'Authentication-Token': token})
+        except Exception as e:
+            print('{}\n    failed: {}'.format(url, str(e).splitlines()[0]))
+            continue
+
+        print(url)
+        with engine.connect() as connection:
+            for statement, parameters in statements:
+                for line in explain(connection, statement, parameters):
+                    print('    ' + line)
+                print()
+
+    event.remove(engine, 'before_cursor_execute', capture)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--records', type=int, default=2000, help='records per user')
+    parser.add_argument('--db', help='database URI, a throwaway SQLite database by default')
+    args = parser.parse_args()
+
+    from monetario.app import create_app
+    from monetario.extensions import db
+
+    path = None
+    if args.db is None:
+        handle, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(handle)
+        args.db = 'sqlite:///' + path
+
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.db
+
+    with app.app_context():
+        db.create_all()
+        token, category = seed(args.users, args.records)
+
+        for name in NEW_INDEXES:
+            db.session.execute('DROP INDEX IF EXISTS {}'.format(name))
+        db.session.execute('CREATE INDEX ix_record_user_id ON record (user_id)')
+        db.session.execute('ANALYZE')
+        db.session.commit()
+
+        print('== before\n')
+        plans(app, token, category)
+
+        db.session.execute('DROP INDEX ix_record_user_id')
+        db.session.commit()
+        db.drop_all()
+        db.create_all()
+        token, category = seed(args.users, args.records)
+        db.session.execute('ANALYZE')
+        db.session.commit()
+
+        print('== after\n')
+        plans(app, token, category)
+
+        db.drop_all()
+
+    if path is not None:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
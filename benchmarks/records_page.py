@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Cost of rendering one expanded ``/records/`` page.
+
+Loads ``--records`` records (each with its account, currency, category and
+transaction) from a throwaway SQLite database and times every stage of
+rendering them, ``--repeat`` times each: dumping the records and encoding
+the page with Flask's pretty-printed ``jsonify`` and with every installed
+backend of ``monetario.encoders``.
+
+    $ python benchmarks/records_page.py --records 100 --repeat 200
+"""
+
+import argparse
+import datetime
+import decimal
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('SERVER_NAME', 'localhost')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ.setdefault('DB_URI', 'sqlite://')
+
+
+def load_records(count):
+    from monetario.extensions import db
+    from monetario.models import Account, Group, GroupCategory, GroupCurrency
+    from monetario.models import Record, Transaction, User
+
+    group = Group(name='benchmark')
+    user = User(email='benchmark@example.com', first_name='Bench', password='111', group=group)
+    currency = GroupCurrency(name='US Dollar', symbol='USD', group=group)
+    account = Account(name='Cash', user=user, currency=currency)
+    target = Account(name='Bank', user=user, currency=currency)
+    category = GroupCategory(name='Food', colour='red', logo='food.png', group=group,
+                             category_type=GroupCategory.CATEGORY_TYPE_EXPENSE)
+    db.session.add_all([group, user, currency, account, target, category])
+
+    date = datetime.datetime(2015, 1, 1, tzinfo=datetime.timezone.utc)
+    for x in range(count):
+        transaction = Transaction(
+            source_account=account, target_account=target, user=user, currency=currency,
+            amount=decimal.Decimal('12.3400'), description='Transfer', date=date
+        )
+        db.session.add(Record(
+            amount=decimal.Decimal('12.3400') + x, description='Record {}'.format(x),
+            record_type=Record.RECORD_TYPE_EXPENSE, payment_method=Record.PAYMENT_METHOD_CASH,
+            date=date, user=user, account=account, currency=currency, category=category,
+            transaction=transaction
+        ))
+    db.session.commit()
+    db.session.expunge_all()
+
+    records = Record.query.order_by(Record.id).all()
+    for record in records:
+        record.to_json()  # load every relationship up front
+    return records
+
+
+def stages(app, records):
+    from flask import json
+
+    from monetario import encoders
+    from monetario.serializers import RecordSchema
+
+    yield 'marshmallow dump', lambda: [RecordSchema().dump(record).data for record in records]
+    yield 'compiled dump', lambda: [record.to_json().data for record in records]
+
+    page = {
+        'objects': [record.to_json().data for record in records],
+        'meta': {'page': 1, 'per_page': len(records), 'total': len(records), 'pages': 1},
+    }
+
+    yield 'flask jsonify', lambda: json.dumps(page, indent=2)
+
+    for name, module, factory in encoders.BACKENDS:
+        if module() is not None:
+            encode = factory(app.config['JSON_SORT_KEYS'])
+            yield '{} encoder'.format(name), lambda encode=encode: encode(page)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    from monetario.app import create_app
+    from monetario.extensions import db
+
+    handle, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(handle)
+
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+
+    with app.app_context():
+        db.create_all()
+        records = load_records(args.records)
+
+        for name, stage in stages(app, records):
+            seconds = timeit.timeit(stage, number=args.repeat) / args.repeat
+            print('{:<20} {:>8.2f} ms / {} records'.format(name, seconds * 1000, args.records))
+
+    os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,13 +3,22 @@
 import os
 import sys
 
+from datetime import datetime
+
 from flask.ext.script import Manager, prompt, Shell
 from flask.ext.migrate import Migrate, MigrateCommand
 
+from monetario import rollups
+from monetario.advisor import migration_stub
 from monetario.app import create_app
 from monetario.models import App
+from monetario.models import Record
+from monetario.models import SigningKey
+from monetario.models import Transaction
 from monetario.models import User
 from monetario.extensions import db
+from monetario.extensions import exchange_rates
+from monetario.extensions import index_advisor
 
 app = create_app()
 manager = Manager(app)
@@ -97,5 +106,96 @@ def insert_api_apps():
     db.session.commit()
 
 
+@manager.command
+def rotate_signing_key():
+    """
+    Create a new signing key and make it the active one. Older keys keep
+    verifying the tokens they have signed until they are retired.
+    """
+
+    key = SigningKey.generate()
+    db.session.add(key)
+    db.session.commit()
+
+    sys.exit('\nSigning key "{}" is now active'.format(key.kid))
+
+
+@manager.command
+def retire_signing_key(kid):
+    """
+    Stop accepting tokens signed with the given key.
+    """
+
+    key = SigningKey.query.filter(SigningKey.kid == kid).first()
+
+    if not key:
+        sys.exit('\nSigning key "{}" does not exist'.format(kid))
+
+    key.date_retired = datetime.now()
+    db.session.add(key)
+    db.session.commit()
+
+    sys.exit('\nSigning key "{}" was retired'.format(kid))
+
+
+@manager.command
+def index_advice(migration=False):
+    """
+    Report the shapes of collection queries which lack an index, most time
+    spent first. With --migration, write a migration creating them.
+    """
+
+    index_advisor.flush()
+    missing = index_advisor.missing_indexes()
+
+    if not missing:
+        sys.exit('\nEvery recorded query shape has an index')
+
+    print('{:<16} {:>8} {:>10} {:>10}  {}'.format('table', 'count', 'avg ms', 'max ms', 'index'))
+    for shape, columns in missing:
+        print('{:<16} {:>8} {:>10.1f} {:>10.1f}  ({})'.format(
+            shape.table_name, shape.count, shape.total_time / shape.count, shape.max_time,
+            ', '.join(columns)
+        ))
+
+    if migration:
+        indexes = []
+        for shape, columns in missing:
+            if (shape.table_name, columns) not in indexes:
+                indexes.append((shape.table_name, columns))
+
+        path = migration_stub(app.extensions['migrate'].directory, indexes)
+        sys.exit('\nMigration written to "{}", review it before upgrading'.format(path))
+
+
+@manager.command
+def rebuild_rollups(user_id=None):
+    """
+    Recompute the monthly rollups of records, of every user or of one.
+    """
+
+    months = rollups.rebuild(int(user_id) if user_id is not None else None)
+    db.session.commit()
+
+    sys.exit('\n{} monthly rollups rebuilt'.format(months))
+
+
+@manager.command
+def backfill_amount_base(chunk_size=1000, pause=0.1):
+    """
+    Convert the records and transactions without an amount in the base
+    currency, in chunks of ids with a pause after each. Safe to stop and
+    run again, which only reads the rows still without one.
+    """
+
+    for model in (Record, Transaction):
+        total = 0
+        for last_id, converted in exchange_rates.backfill(model, int(chunk_size), float(pause)):
+            total += converted
+            print('{} up to id {}: {} converted'.format(model.__tablename__, last_id, total))
+
+    sys.exit('\nDone')
+
+
 if __name__ == '__main__':
     manager.run()
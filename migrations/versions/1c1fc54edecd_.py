@@ -0,0 +1,27 @@
+"""Make token rows unique per app and user
+
+Revision ID: 1c1fc54edecd
+Revises: a25fe17cf209
+Create Date: 2026-10-18 12:21:05.611902
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1c1fc54edecd'
+down_revision = 'a25fe17cf209'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # keep the newest token of every app/user pair
+    op.execute(
+        'DELETE FROM token WHERE id NOT IN '
+        '(SELECT max(id) FROM token GROUP BY app_id, user_id)'
+    )
+    op.create_unique_constraint('uq_token_app_id_user_id', 'token', ['app_id', 'user_id'])
+
+
+def downgrade():
+    op.drop_constraint('uq_token_app_id_user_id', 'token', type_='unique')
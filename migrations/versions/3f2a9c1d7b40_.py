@@ -0,0 +1,24 @@
+"""Add per-app login throttle limits
+
+Revision ID: 3f2a9c1d7b40
+Revises: 1c1fc54edecd
+Create Date: 2026-10-18 13:02:44.120417
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7b40'
+down_revision = '1c1fc54edecd'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('app', sa.Column('login_limit', sa.Integer(), nullable=True))
+    op.add_column('app', sa.Column('login_limit_period', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('app', 'login_limit_period')
+    op.drop_column('app', 'login_limit')
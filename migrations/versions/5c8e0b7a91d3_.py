@@ -0,0 +1,53 @@
+"""Store token digests instead of signed tokens
+
+Revision ID: 5c8e0b7a91d3
+Revises: 3f2a9c1d7b40
+Create Date: 2026-10-18 13:41:09.538112
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5c8e0b7a91d3'
+down_revision = '3f2a9c1d7b40'
+
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+token = sa.table(
+    'token',
+    sa.column('id', sa.Integer),
+    sa.column('token', sa.String),
+    sa.column('token_digest', sa.LargeBinary),
+)
+
+
+def upgrade():
+    op.add_column('token', sa.Column('token_digest', sa.LargeBinary(length=32), nullable=True))
+
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select([token.c.id, token.c.token]).where(token.c.token.isnot(None))
+    ).fetchall()
+
+    for id, value in rows:
+        connection.execute(
+            token.update()
+            .where(token.c.id == id)
+            .values(token_digest=hashlib.sha256(value.encode('utf-8')).digest())
+        )
+
+    op.create_index(op.f('ix_token_token_digest'), 'token', ['token_digest'], unique=False)
+    op.drop_index(op.f('ix_token_token'), table_name='token')
+    op.drop_column('token', 'token')
+
+
+def downgrade():
+    # signed tokens can not be recovered from their digests, clients have
+    # to log in again
+    op.add_column('token', sa.Column('token', sa.String(length=255), nullable=True))
+    op.create_index(op.f('ix_token_token'), 'token', ['token'], unique=False)
+    op.drop_index(op.f('ix_token_token_digest'), table_name='token')
+    op.drop_column('token', 'token_digest')
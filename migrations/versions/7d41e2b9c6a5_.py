@@ -0,0 +1,38 @@
+"""Add date_modified to record, account and group_category
+
+Revision ID: 7d41e2b9c6a5
+Revises: 5c8e0b7a91d3
+Create Date: 2026-10-18 15:12:37.204518
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7d41e2b9c6a5'
+down_revision = '5c8e0b7a91d3'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# existing rows are left NULL, which max(date_modified) skips, so adding
+# the columns does not rewrite the tables
+TABLES = (
+    ('record', 'user_id'),
+    ('account', 'user_id'),
+    ('group_category', 'group_id'),
+)
+
+
+def upgrade():
+    for table, owner in TABLES:
+        op.add_column(table, sa.Column('date_modified', sa.DateTime(), nullable=True))
+        op.create_index(
+            'ix_{}_{}_date_modified'.format(table, owner), table, [owner, 'date_modified'],
+            unique=False
+        )
+
+
+def downgrade():
+    for table, owner in TABLES:
+        op.drop_index('ix_{}_{}_date_modified'.format(table, owner), table_name=table)
+        op.drop_column(table, 'date_modified')
@@ -0,0 +1,63 @@
+"""Add full-text search indexes of record and transaction descriptions
+
+Revision ID: 8a3f6c2d1e57
+Revises: 7d41e2b9c6a5
+Create Date: 2026-10-18 16:05:52.811430
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8a3f6c2d1e57'
+down_revision = '7d41e2b9c6a5'
+
+from alembic import op
+
+
+TABLES = ('record', 'transaction')
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    for table in TABLES:
+        if dialect == 'postgresql':
+            op.execute(
+                "CREATE INDEX ix_{0}_description_search ON \"{0}\" "
+                "USING gin (to_tsvector('simple', coalesce(description, '')))".format(table)
+            )
+        elif dialect == 'sqlite':
+            op.execute(
+                "CREATE VIRTUAL TABLE {0}_search "
+                "USING fts5(description, content='{0}', content_rowid='id')".format(table)
+            )
+            op.execute(
+                "CREATE TRIGGER {0}_search_insert AFTER INSERT ON \"{0}\" BEGIN "
+                "INSERT INTO {0}_search(rowid, description) "
+                "VALUES (new.id, new.description); END".format(table)
+            )
+            op.execute(
+                "CREATE TRIGGER {0}_search_delete AFTER DELETE ON \"{0}\" BEGIN "
+                "INSERT INTO {0}_search({0}_search, rowid, description) "
+                "VALUES ('delete', old.id, old.description); END".format(table)
+            )
+            op.execute(
+                "CREATE TRIGGER {0}_search_update AFTER UPDATE OF description ON \"{0}\" BEGIN "
+                "INSERT INTO {0}_search({0}_search, rowid, description) "
+                "VALUES ('delete', old.id, old.description); "
+                "INSERT INTO {0}_search(rowid, description) "
+                "VALUES (new.id, new.description); END".format(table)
+            )
+            # index the existing rows
+            op.execute("INSERT INTO {0}_search({0}_search) VALUES ('rebuild')".format(table))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+
+    for table in TABLES:
+        if dialect == 'postgresql':
+            op.execute('DROP INDEX ix_{}_description_search'.format(table))
+        elif dialect == 'sqlite':
+            for trigger in ('insert', 'delete', 'update'):
+                op.execute('DROP TRIGGER {}_search_{}'.format(table, trigger))
+            op.execute('DROP TABLE {}_search'.format(table))
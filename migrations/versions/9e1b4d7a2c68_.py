@@ -0,0 +1,40 @@
+"""Add composite indexes of record by user and date
+
+Revision ID: 9e1b4d7a2c68
+Revises: 8a3f6c2d1e57
+Create Date: 2026-10-18 16:48:20.372915
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9e1b4d7a2c68'
+down_revision = '8a3f6c2d1e57'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index(
+        'ix_record_user_id_date', 'record',
+        ['user_id', 'date', 'record_type', 'category_id', 'amount'], unique=False
+    )
+    op.create_index(
+        'ix_record_user_id_category_id_date', 'record', ['user_id', 'category_id', 'date'],
+        unique=False
+    )
+    # user_id leads both indexes
+    op.drop_index('ix_record_user_id', table_name='record')
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.create_index(
+            'ix_record_date_brin', 'record', ['date'], unique=False, postgresql_using='brin'
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_record_date_brin', table_name='record')
+
+    op.create_index('ix_record_user_id', 'record', ['user_id'], unique=False)
+    op.drop_index('ix_record_user_id_category_id_date', table_name='record')
+    op.drop_index('ix_record_user_id_date', table_name='record')
@@ -0,0 +1,33 @@
+"""Add signing_key table for the signing keyring
+
+Revision ID: a25fe17cf209
+Revises: a2bfcdd8ff25
+Create Date: 2026-10-18 11:02:47.918364
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a25fe17cf209'
+down_revision = 'a2bfcdd8ff25'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('signing_key',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kid', sa.String(length=32), nullable=False),
+    sa.Column('secret', sa.String(length=128), nullable=False),
+    sa.Column('date_created', sa.DateTime(), nullable=True),
+    sa.Column('date_retired', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_signing_key_kid'), 'signing_key', ['kid'], unique=True)
+    op.create_index(op.f('ix_signing_key_date_retired'), 'signing_key', ['date_retired'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_signing_key_date_retired'), table_name='signing_key')
+    op.drop_index(op.f('ix_signing_key_kid'), table_name='signing_key')
+    op.drop_table('signing_key')
@@ -0,0 +1,24 @@
+"""Add token generation for stateless tokens
+
+Revision ID: a2bfcdd8ff25
+Revises: 4ec51163fa6
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a2bfcdd8ff25'
+down_revision = '4ec51163fa6'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('token', sa.Column('generation', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('token', sa.Column('date_modified', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('token', 'date_modified')
+    op.drop_column('token', 'generation')
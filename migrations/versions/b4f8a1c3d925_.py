@@ -0,0 +1,34 @@
+"""Add query_shape table for the index advisor
+
+Revision ID: b4f8a1c3d925
+Revises: 9e1b4d7a2c68
+Create Date: 2026-10-18 17:31:06.104582
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b4f8a1c3d925'
+down_revision = '9e1b4d7a2c68'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('query_shape',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('table_name', sa.String(length=64), nullable=False),
+    sa.Column('equality', sa.String(length=255), nullable=False),
+    sa.Column('ranges', sa.String(length=255), nullable=False),
+    sa.Column('sort', sa.String(length=255), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('total_time', sa.Float(), nullable=False),
+    sa.Column('max_time', sa.Float(), nullable=False),
+    sa.Column('date_modified', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('table_name', 'equality', 'ranges', 'sort')
+    )
+
+
+def downgrade():
+    op.drop_table('query_shape')
@@ -0,0 +1,99 @@
+"""Add record_month table of monthly rollups of records
+
+Revision ID: c2d7e9a4f613
+Revises: b4f8a1c3d925
+Create Date: 2026-10-18 18:12:44.690273
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c2d7e9a4f613'
+down_revision = 'b4f8a1c3d925'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+record = sa.table(
+    'record',
+    sa.column('user_id', sa.Integer),
+    sa.column('account_id', sa.Integer),
+    sa.column('currency_id', sa.Integer),
+    sa.column('date', sa.DateTime),
+    sa.column('amount', sa.Numeric),
+    sa.column('record_type', sa.Integer),
+)
+
+record_month = sa.table(
+    'record_month',
+    sa.column('user_id', sa.Integer),
+    sa.column('account_id', sa.Integer),
+    sa.column('currency_id', sa.Integer),
+    sa.column('month', sa.Date),
+    sa.column('income', sa.Numeric),
+    sa.column('expense', sa.Numeric),
+    sa.column('count', sa.Integer),
+)
+
+RECORD_TYPE_INCOME, RECORD_TYPE_EXPENSE = range(2)
+
+
+def month_of_date(dialect):
+    # the first day of the month of a record in UTC, as monetario.rollups
+    # takes it
+    # literals, not parameters, for the expression to match in GROUP BY
+    if dialect == 'postgresql':
+        return sa.cast(sa.func.date_trunc(
+            sa.literal_column("'month'"),
+            sa.func.timezone(sa.literal_column("'UTC'"), record.c.date)
+        ), sa.Date)
+    return sa.func.date(record.c.date, sa.literal_column("'start of month'"))
+
+
+def sum_of(record_type):
+    return sa.func.coalesce(sa.func.sum(
+        sa.case([(record.c.record_type == record_type, record.c.amount)], else_=0)
+    ), 0)
+
+
+def upgrade():
+    op.create_table('record_month',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('account_id', sa.Integer(), nullable=True),
+    sa.Column('currency_id', sa.Integer(), nullable=True),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('income', sa.Numeric(precision=15, scale=4), nullable=False),
+    sa.Column('expense', sa.Numeric(precision=15, scale=4), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['account_id'], ['account.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['currency_id'], ['group_currency.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_record_month_user_id_month', 'record_month', ['user_id', 'month'], unique=False)
+    op.create_index(op.f('ix_record_month_account_id'), 'record_month', ['account_id'], unique=False)
+    op.create_index(op.f('ix_record_month_currency_id'), 'record_month', ['currency_id'], unique=False)
+    op.execute(
+        'CREATE UNIQUE INDEX ix_record_month_key ON record_month '
+        '(coalesce(user_id, 0), coalesce(account_id, 0), coalesce(currency_id, 0), month)'
+    )
+
+    month = month_of_date(op.get_bind().dialect.name)
+    op.execute(record_month.insert().from_select(
+        ['user_id', 'account_id', 'currency_id', 'month', 'income', 'expense', 'count'],
+        sa.select([
+            record.c.user_id, record.c.account_id, record.c.currency_id, month,
+            sum_of(RECORD_TYPE_INCOME), sum_of(RECORD_TYPE_EXPENSE), sa.func.count(),
+        ]).where(
+            record.c.date.isnot(None)
+        ).group_by(record.c.user_id, record.c.account_id, record.c.currency_id, month)
+    ))
+
+
+def downgrade():
+    op.drop_index('ix_record_month_key', table_name='record_month')
+    op.drop_index(op.f('ix_record_month_currency_id'), table_name='record_month')
+    op.drop_index(op.f('ix_record_month_account_id'), table_name='record_month')
+    op.drop_index('ix_record_month_user_id_month', table_name='record_month')
+    op.drop_table('record_month')
@@ -0,0 +1,54 @@
+"""Add balance checkpoints to record_month
+
+Revision ID: d5a2f8c1b736
+Revises: c2d7e9a4f613
+Create Date: 2026-10-18 19:02:17.418305
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd5a2f8c1b736'
+down_revision = 'c2d7e9a4f613'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+record_month = sa.table(
+    'record_month',
+    sa.column('user_id', sa.Integer),
+    sa.column('account_id', sa.Integer),
+    sa.column('currency_id', sa.Integer),
+    sa.column('month', sa.Date),
+    sa.column('income', sa.Numeric),
+    sa.column('expense', sa.Numeric),
+    sa.column('balance', sa.Numeric),
+)
+
+
+def upgrade():
+    op.add_column('record_month', sa.Column(
+        'balance', sa.Numeric(precision=15, scale=4), nullable=False, server_default='0'
+    ))
+
+    # the sums of the earlier months of every account and currency
+    earlier = record_month.alias('earlier')
+    op.execute(record_month.update().values(balance=sa.select([
+        sa.func.coalesce(sa.func.sum(earlier.c.income + earlier.c.expense), 0)
+    ]).where(sa.and_(*[
+        sa.func.coalesce(earlier.c[name], 0) == sa.func.coalesce(record_month.c[name], 0)
+        for name in ('user_id', 'account_id', 'currency_id')
+    ] + [earlier.c.month < record_month.c.month])).as_scalar()))
+
+    op.create_index(
+        'ix_record_month_account_id_currency_id_month', 'record_month',
+        ['account_id', 'currency_id', 'month'], unique=False
+    )
+    # account_id leads the new index
+    op.drop_index('ix_record_month_account_id', table_name='record_month')
+
+
+def downgrade():
+    op.create_index('ix_record_month_account_id', 'record_month', ['account_id'], unique=False)
+    op.drop_index('ix_record_month_account_id_currency_id_month', table_name='record_month')
+    op.drop_column('record_month', 'balance')
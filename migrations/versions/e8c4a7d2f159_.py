@@ -0,0 +1,24 @@
+"""Add balance_version to account
+
+Revision ID: e8c4a7d2f159
+Revises: d5a2f8c1b736
+Create Date: 2026-10-18 19:41:06.208517
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e8c4a7d2f159'
+down_revision = 'd5a2f8c1b736'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('account', sa.Column(
+        'balance_version', sa.Integer(), nullable=False, server_default='0'
+    ))
+
+
+def downgrade():
+    op.drop_column('account', 'balance_version')
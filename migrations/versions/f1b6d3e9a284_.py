@@ -0,0 +1,29 @@
+"""Add amount_base and base_rate to record and transaction
+
+Revision ID: f1b6d3e9a284
+Revises: e8c4a7d2f159
+Create Date: 2026-10-18 20:37:52.106394
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'f1b6d3e9a284'
+down_revision = 'e8c4a7d2f159'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# the existing rows are converted with `manage.py backfill_amount_base`
+def upgrade():
+    op.add_column('record', sa.Column('amount_base', sa.Numeric(precision=15, scale=4), nullable=True))
+    op.add_column('record', sa.Column('base_rate', sa.Numeric(precision=18, scale=8), nullable=True))
+    op.add_column('transaction', sa.Column('amount_base', sa.Numeric(precision=15, scale=4), nullable=True))
+    op.add_column('transaction', sa.Column('base_rate', sa.Numeric(precision=18, scale=8), nullable=True))
+
+
+def downgrade():
+    op.drop_column('transaction', 'base_rate')
+    op.drop_column('transaction', 'amount_base')
+    op.drop_column('record', 'base_rate')
+    op.drop_column('record', 'amount_base')
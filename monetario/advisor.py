@@ -0,0 +1,274 @@
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app
+
+from sqlalchemy import and_
+from sqlalchemy import case
+from sqlalchemy import Column
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import ColumnProperty
+from sqlalchemy.sql import operators
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.expression import BinaryExpression
+
+
+EQUALITY_OPERATORS = ('eq', 'in')
+RANGE_OPERATORS = ('lt', 'le', 'gt', 'ge', 'like')
+
+
+def _column_names(model, names):
+    columns = []
+
+    for name in names:
+        prop = model.__mapper__.attrs.get(name)
+        if isinstance(prop, ColumnProperty) and prop.columns[0].table is model.__table__:
+            column = prop.columns[0].name
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+def _scope_columns(model, query):
+    # the columns the collection query itself compares to a value, such as
+    # the user_id of the current user
+    columns = []
+
+    whereclause = query.whereclause
+    if whereclause is None:
+        return columns
+
+    for element in visitors.iterate(whereclause, {}):
+        if (isinstance(element, BinaryExpression) and element.operator is operators.eq and
+                isinstance(element.left, Column) and element.left.table is model.__table__ and
+                not isinstance(element.right, Column)):
+            if element.left.name not in columns:
+                columns.append(element.left.name)
+    return columns
+
+
+def query_shape(model, query, filter_spec, sort_spec):
+    """
+    The shape of a collection query: its table, the columns compared to a
+    value (by the collection or with ``eq``/``in`` filters), the columns
+    filtered by range and the sort columns, in order.
+    """
+    terms = [x.split(',') for x in (filter_spec or '').split(';') if x.count(',') >= 2]
+
+    equality = _scope_columns(model, query)
+    for column in _column_names(model, [x[0] for x in terms if x[1] in EQUALITY_OPERATORS]):
+        if column not in equality:
+            equality.append(column)
+
+    ranges = [
+        column for column in _column_names(model, [x[0] for x in terms if x[1] in RANGE_OPERATORS])
+        if column not in equality
+    ]
+    sort = _column_names(model, [x.split(',')[0] for x in (sort_spec or '').split(';') if x])
+
+    return (model.__tablename__, tuple(equality), tuple(ranges), tuple(sort))
+
+
+def suggested_index(equality, ranges, sort):
+    """
+    The columns of the index serving a shape: the compared columns, then
+    the sort columns or else the first range column. ``None`` when the
+    shape does not narrow nor order the rows.
+    """
+    rest = list(sort) if sort else list(ranges[:1])
+    columns = list(equality) + [x for x in rest if x not in equality]
+    return columns or None
+
+
+def is_supported(columns, equality, indexes):
+    """
+    Whether one of ``indexes`` (lists of column names) starts with
+    ``columns``, the compared columns of which may come in any order.
+    """
+    head, tail = columns[:len(equality)], columns[len(equality):]
+
+    for index in indexes:
+        if (set(index[:len(head)]) == set(head) and
+                index[len(head):len(head) + len(tail)] == tail):
+            return True
+    return False
+
+
+def table_indexes(bind, table):
+    inspector = inspect(bind)
+
+    indexes = [x['column_names'] for x in inspector.get_indexes(table)]
+    primary_key = inspector.get_pk_constraint(table)['constrained_columns']
+    if primary_key:
+        indexes.append(primary_key)
+    return indexes
+
+
+class IndexAdvisor(object):
+    """
+    Records the shapes of the collection queries (see :func:`query_shape`)
+    with their count and latency, and tells which ones lack an index.
+
+    Shapes are kept in memory, at most ``INDEX_ADVISOR_SIZE`` of them (the
+    least recently seen are dropped first, 0 disables the advisor), and
+    added to the ``query_shape`` table every
+    ``INDEX_ADVISOR_FLUSH_INTERVAL`` seconds, after a request.
+    """
+
+    def __init__(self, app=None):
+        self.maxsize = 1000
+        self.flush_interval = 60
+        self._shapes = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_flush = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('INDEX_ADVISOR_SIZE', self.maxsize)
+        self.flush_interval = app.config.get('INDEX_ADVISOR_FLUSH_INTERVAL', self.flush_interval)
+        self.clear()
+        self._next_flush = time.time() + self.flush_interval
+
+        app.after_request(self.after_request)
+
+    def record(self, model, query, filter_spec, sort_spec, seconds):
+        if not self.maxsize:
+            return
+
+        shape = query_shape(model, query, filter_spec, sort_spec)
+        milliseconds = seconds * 1000
+
+        with self._lock:
+            count, total, maximum = self._shapes.pop(shape, (0, 0.0, 0.0))
+            self._shapes[shape] = (count + 1, total + milliseconds, max(maximum, milliseconds))
+
+            while len(self._shapes) > self.maxsize:
+                self._shapes.popitem(last=False)
+
+    def after_request(self, response):
+        if self._shapes and time.time() >= self._next_flush:
+            try:
+                self.flush()
+            except SQLAlchemyError:
+                # statistics, not worth failing the request they follow
+                current_app.logger.exception('Could not flush the query shapes')
+        return response
+
+    def flush(self):
+        """
+        Add the recorded shapes to the ``query_shape`` table.
+        """
+        from monetario.models import db, QueryShape
+
+        with self._lock:
+            shapes, self._shapes = self._shapes, OrderedDict()
+            self._next_flush = time.time() + self.flush_interval
+
+        if not shapes:
+            return
+
+        table = QueryShape.__table__
+        now = datetime.utcnow()
+
+        for (name, equality, ranges, sort), (count, total, maximum) in shapes.items():
+            key = {
+                'table_name': name,
+                'equality': ','.join(equality),
+                'ranges': ','.join(ranges),
+                'sort': ','.join(sort),
+            }
+            criterion = and_(*[table.c[k] == v for k, v in key.items()])
+            update = table.update().where(criterion).values(
+                count=table.c.count + count,
+                total_time=table.c.total_time + total,
+                max_time=case(
+                    [(table.c.max_time < maximum, maximum)], else_=table.c.max_time
+                ),
+                date_modified=now,
+            )
+
+            # every shape on a connection and in a transaction of its own, so
+            # that the session of the request is left alone and a failed
+            # insert only rolls back its own shape
+            try:
+                with db.engine.begin() as connection:
+                    if not connection.execute(update).rowcount:
+                        connection.execute(table.insert().values(
+                            count=count, total_time=total, max_time=maximum, date_modified=now,
+                            **key
+                        ))
+            except IntegrityError:
+                # another worker inserted the shape meanwhile
+                with db.engine.begin() as connection:
+                    connection.execute(update)
+
+    def missing_indexes(self):
+        """
+        The recorded shapes which no index of the database serves, with the
+        columns of the index that would, most time spent first.
+        """
+        from monetario.models import db, QueryShape
+
+        bind = db.engine
+        indexes = {}
+        missing = []
+
+        for shape in QueryShape.query.order_by(QueryShape.total_time.desc()):
+            equality, ranges, sort = shape.columns()
+            columns = suggested_index(equality, ranges, sort)
+            if columns is None:
+                continue
+
+            if shape.table_name not in indexes:
+                indexes[shape.table_name] = table_indexes(bind, shape.table_name)
+
+            if not is_supported(columns, equality, indexes[shape.table_name]):
+                missing.append((shape, columns))
+        return missing
+
+    def clear(self):
+        with self._lock:
+            self._shapes.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._shapes),
+            'maxsize': self.maxsize,
+        }
+
+
+def index_name(table, columns):
+    return 'ix_{}_{}'.format(table, '_'.join(columns))
+
+
+def migration_stub(directory, indexes, message='Add indexes suggested by the index advisor'):
+    """
+    Write a migration creating ``indexes`` (pairs of table and columns) to
+    the Alembic ``directory``, returns its path.
+    """
+    from alembic.script import ScriptDirectory
+
+    upgrades = [
+        'op.create_index({!r}, {!r}, {!r}, unique=False)'.format(
+            index_name(table, columns), table, columns
+        )
+        for table, columns in indexes
+    ]
+    downgrades = [
+        'op.drop_index({!r}, table_name={!r})'.format(index_name(table, columns), table)
+        for table, columns in reversed(indexes)
+    ]
+
+    script = ScriptDirectory(directory).generate_revision(
+        uuid.uuid4().hex[-12:], message, head='head',
+        upgrades='\n    '.join(upgrades), downgrades='\n    '.join(downgrades)
+    )
+    return script.path
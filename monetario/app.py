@@ -1,12 +1,18 @@
 
 from flask import Flask
 
-from .extensions import babel, mail, sentry, db, login_manager
+from .extensions import babel, mail, sentry, db, login_manager, auth_cache, token_revocations
+from .extensions import keyring, password_hasher, login_throttle, count_cache, json_encoder
+from .extensions import compress, index_advisor, balance_index, exchange_rates
+# keeps the monthly rollups of records up to date on every flush
+from . import rollups  # noqa
 from . import views
 from .config import config
 
 from monetario.models import User
+from monetario.models import SigningKey
 from monetario.models import Token
+from monetario.models import UserIdentity
 
 
 def create_app(config_name='default'):
@@ -20,6 +26,17 @@ def create_app(config_name='default'):
     mail.init_app(app)
     sentry.init_app(app)
     login_manager.init_app(app)
+    auth_cache.init_app(app)
+    token_revocations.init_app(app, loader=Token.revocations)
+    keyring.init_app(app, loader=SigningKey.load_keys)
+    password_hasher.init_app(app)
+    login_throttle.init_app(app)
+    count_cache.init_app(app)
+    json_encoder.init_app(app)
+    compress.init_app(app)
+    index_advisor.init_app(app)
+    balance_index.init_app(app)
+    exchange_rates.init_app(app)
 
     configure_views(app)
 
@@ -35,13 +52,27 @@ def configure_views(app):
 def load_user_from_request(request):
     auth_token = request.headers.get('Authentication-Token')
 
-    if auth_token:
-        token = Token.query.filter(Token.token == auth_token).first()
+    if not auth_token:
+        return None
 
-        if token and token.user_id and token.is_token_valid():
-            return User.query.get(token.user_id)
+    identity = auth_cache.get(auth_token)
 
-    return None
+    if identity is None:
+        authenticated = Token.authenticate(auth_token)
+
+        if not authenticated:
+            return None
+
+        identity, expires_at = authenticated
+        auth_cache.set(auth_token, identity, expires_at)
+
+    user = UserIdentity(*identity)
+
+    if token_revocations.is_revoked(user.app_id, user.id, user.generation):
+        auth_cache.invalidate(auth_token)
+        return None
+
+    return user
 
 
 @login_manager.user_loader
@@ -0,0 +1,225 @@
+import hashlib
+import threading
+import time
+
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # pragma: no cover
+    redis = None
+
+
+def token_digest(token):
+    """
+    Fixed-size digest of a signed token, used as a lookup key instead of the
+    token string itself.
+    """
+    if isinstance(token, str):
+        token = token.encode('utf-8')
+    return hashlib.sha256(token).digest()
+
+
+class AuthCache(object):
+    """
+    In-process LRU cache of authenticated identities keyed by token digest.
+
+    Every entry holds a minimal ``(user_id, group_id, active)`` identity and
+    lives ``AUTH_CACHE_TTL`` seconds (or until the token itself expires,
+    whichever comes first), so a cache hit needs neither the ``token`` row
+    nor the ``user`` row nor a signature check.
+
+    Invalidations only reach the cache of the worker making them, the TTL
+    bounds how long the other workers keep accepting a revoked token.
+    """
+
+    def __init__(self, app=None):
+        self.maxsize = 10000
+        self.ttl = 5
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('AUTH_CACHE_SIZE', self.maxsize)
+        self.ttl = app.config.get('AUTH_CACHE_TTL', self.ttl)
+        self.clear()
+
+    def get(self, token):
+        key = token_digest(token)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, token, identity, expires_at):
+        if not self.maxsize:
+            return
+
+        if self.ttl is not None:
+            expires_at = min(expires_at, time.time() + self.ttl)
+
+        key = token_digest(token)
+
+        with self._lock:
+            self._entries[key] = (tuple(identity), expires_at)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token):
+        self.invalidate_digest(token_digest(token))
+
+    def invalidate_digest(self, digest):
+        with self._lock:
+            self._entries.pop(bytes(digest), None)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            keys = [key for key, (identity, _) in self._entries.items() if identity[0] == user_id]
+            for key in keys:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
+
+
+class RevocationSet(object):
+    """
+    Compact in-memory set of revoked stateless tokens.
+
+    Every ``(app_id, user_id)`` pair maps to the lowest token generation that
+    is still valid, so a self-describing token is revoked when its ``gen``
+    is lower than that. Entries are only kept for ``TOKEN_EXPIRES_IN``
+    seconds, after which every older token has expired anyway.
+
+    The set is reloaded every ``TOKEN_REVOCATION_RELOAD_INTERVAL`` seconds,
+    either from Redis (``TOKEN_REVOCATION_REDIS_URL``) or through ``loader``,
+    which must return ``(app_id, user_id, generation, revoked_at)`` tuples.
+    """
+
+    redis_prefix = 'monetario:token_revocation:'
+
+    def __init__(self, app=None, loader=None):
+        self.enabled = False
+        self.window = 900
+        self.reload_interval = 60
+        self.loader = loader
+        self.redis = None
+        self._entries = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app, loader)
+
+    def init_app(self, app, loader=None):
+        self.enabled = app.config.get('TOKEN_MODE') == 'stateless'
+        self.window = app.config.get('TOKEN_EXPIRES_IN', self.window)
+        self.reload_interval = app.config.get('TOKEN_REVOCATION_RELOAD_INTERVAL',
+                                              self.reload_interval)
+        if loader is not None:
+            self.loader = loader
+
+        url = app.config.get('TOKEN_REVOCATION_REDIS_URL')
+        if url and redis is None:
+            raise RuntimeError('TOKEN_REVOCATION_REDIS_URL requires the redis package')
+        self.redis = redis.StrictRedis.from_url(url) if url else None
+
+        with self._lock:
+            self._entries = {}
+            self._loaded_at = None
+
+    def revoke(self, app_id, user_id, generation, revoked_at=None):
+        """
+        Revoke every token of the pair with a generation lower than
+        ``generation``.
+        """
+        if not self.enabled:
+            return
+
+        if revoked_at is None:
+            revoked_at = time.time()
+
+        self._add(app_id, user_id, generation, revoked_at + self.window)
+
+        if self.redis is not None:
+            key = '{}{}:{}'.format(self.redis_prefix, app_id, user_id)
+            self.redis.set(key, generation, ex=self.window)
+
+    def is_revoked(self, app_id, user_id, generation):
+        if not self.enabled or generation is None:
+            return False
+
+        if self._loaded_at is None or self._loaded_at + self.reload_interval <= time.time():
+            self.reload()
+
+        entry = self._entries.get((app_id, user_id))
+
+        if entry is None or entry[1] <= time.time():
+            return False
+
+        return generation < entry[0]
+
+    def reload(self):
+        now = time.time()
+
+        if self.redis is not None:
+            keys = list(self.redis.scan_iter(match=self.redis_prefix + '*'))
+            values = self.redis.mget(keys) if keys else []
+            revocations = []
+            for key, value in zip(keys, values):
+                if value is None:
+                    continue
+                app_id, user_id = key.decode('utf-8')[len(self.redis_prefix):].split(':')
+                revocations.append((int(app_id), int(user_id), int(value), now))
+        elif self.loader is not None:
+            revocations = self.loader(now - self.window)
+        else:
+            revocations = []
+
+        with self._lock:
+            entries = {
+                key: entry for key, entry in self._entries.items() if entry[1] > now
+            }
+            self._entries = entries
+            self._loaded_at = now
+
+        for app_id, user_id, generation, revoked_at in revocations:
+            self._add(app_id, user_id, generation, revoked_at + self.window)
+
+    def _add(self, app_id, user_id, generation, expires_at):
+        key = (app_id, user_id)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry < (generation, expires_at):
+                self._entries[key] = (generation, expires_at)
+
+    def __len__(self):
+        return len(self._entries)
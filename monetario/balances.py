@@ -0,0 +1,317 @@
+import datetime
+import decimal
+import threading
+
+from collections import defaultdict
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class FenwickTree(object):
+    """
+    Binary indexed tree of ``size`` values, all 0 at first: adds to a value
+    and sums a prefix or a range of them in O(log n).
+    """
+
+    def __init__(self, size):
+        self._tree = [0] * (size + 1)
+
+    @classmethod
+    def from_values(cls, values):
+        tree = cls(len(values))
+
+        # in O(n), every node passes its sum on to its parent
+        nodes = tree._tree
+        for index, value in enumerate(values, 1):
+            nodes[index] += value
+            parent = index + (index & -index)
+            if parent < len(nodes):
+                nodes[parent] += nodes[index]
+        return tree
+
+    def __len__(self):
+        return len(self._tree) - 1
+
+    def add(self, index, value):
+        index += 1
+        while index < len(self._tree):
+            self._tree[index] += value
+            index += index & -index
+
+    def prefix_sum(self, index):
+        """
+        The sum of the values up to ``index``, included.
+        """
+        total = 0
+        index = min(index, len(self) - 1) + 1
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def range_sum(self, start, end):
+        """
+        The sum of the values from ``start`` to ``end``, included.
+        """
+        if end < start:
+            return 0
+        return self.prefix_sum(end) - (self.prefix_sum(start - 1) if start > 0 else 0)
+
+
+class DailyBalances(object):
+    """
+    The net amounts of the records of an account by day, from ``start`` on,
+    as of the ``version`` of the account.
+    """
+
+    def __init__(self, start, amounts, version):
+        self.start = start
+        self.version = version
+        self.tree = FenwickTree.from_values(amounts)
+
+    def __len__(self):
+        return len(self.tree)
+
+    def index(self, day):
+        return (day - self.start).days
+
+    def covers(self, day):
+        return 0 <= self.index(day) < len(self)
+
+    def add(self, day, amount):
+        self.tree.add(self.index(day), amount)
+
+    def balance(self, day):
+        """
+        The balance at the end of ``day``.
+        """
+        index = self.index(day)
+        return self.tree.prefix_sum(index) if index >= 0 else 0
+
+
+def _day(value):
+    from monetario.rollups import to_utc
+
+    value = to_utc(value)
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+
+class BalanceIndex(object):
+    """
+    Per-worker index of the daily balances of accounts, see
+    :class:`DailyBalances`, for the balances of an account at many dates.
+
+    An account is loaded on its first use and kept until it is one of the
+    least recently used beyond ``BALANCE_INDEX_SIZE`` (0 disables the
+    index). Accounts spanning more than ``BALANCE_INDEX_MAX_DAYS`` days are
+    summed in SQL instead.
+
+    Every flush of records bumps the ``balance_version`` of their accounts.
+    Once committed, the records of this worker are added to the loaded
+    accounts; an account written to by another worker no longer matches
+    its version and is loaded again.
+    """
+
+    # days loaded past today, for the records of the coming months
+    PADDING = 366
+
+    def __init__(self, app=None):
+        self.maxsize = 1000
+        self.max_days = 36600
+        self.hits = 0
+        self.misses = 0
+        self._accounts = OrderedDict()
+        self._lock = threading.Lock()
+
+        event.listen(Session, 'after_flush', self._after_flush)
+        event.listen(Session, 'after_commit', self._after_commit)
+        event.listen(Session, 'after_rollback', self._after_rollback)
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('BALANCE_INDEX_SIZE', self.maxsize)
+        self.max_days = app.config.get('BALANCE_INDEX_MAX_DAYS', self.max_days)
+        self.clear()
+
+    def balances(self, account, days):
+        """
+        The balances of ``account`` at the end of every one of ``days``, in
+        order.
+        """
+        if not days:
+            return []
+
+        balances = self._get(account)
+        if balances is None:
+            return self._sql_balances(account, days)
+        return [balances.balance(day) for day in days]
+
+    def _get(self, account):
+        if not self.maxsize:
+            return None
+
+        with self._lock:
+            balances = self._accounts.get(account.id)
+            if balances is not None and balances.version == account.balance_version:
+                self._accounts.move_to_end(account.id)
+                self.hits += 1
+                return balances
+            self.misses += 1
+
+        balances = self._load(account)
+        if balances is None:
+            return None
+
+        with self._lock:
+            self._accounts[account.id] = balances
+            self._accounts.move_to_end(account.id)
+
+            while len(self._accounts) > self.maxsize:
+                self._accounts.popitem(last=False)
+        return balances
+
+    def _load(self, account):
+        from monetario.models import db, Account, Record
+
+        version = account.balance_version
+
+        amounts = defaultdict(int)
+        query = db.session.query(Record.date, Record.amount).filter(
+            Record.account_id == account.id
+        )
+        for date, amount in query.yield_per(1000):
+            if date is not None and amount is not None:
+                amounts[_day(date)] += amount
+
+        today = datetime.date.today()
+        start = min(amounts) if amounts else today
+        end = max([today] + list(amounts)) + datetime.timedelta(days=self.PADDING)
+        if (end - start).days >= self.max_days:
+            return None
+
+        balances = DailyBalances(start, [
+            amounts.get(start + datetime.timedelta(days=x), 0) for x in range((end - start).days)
+        ], version)
+
+        # only the records of that version, if another worker committed to
+        # the account meanwhile it is loaded again next time
+        current = db.session.query(Account.balance_version).filter(
+            Account.id == account.id
+        ).scalar()
+        if current != version:
+            balances.version = None
+        return balances
+
+    def _sql_balances(self, account, days):
+        from monetario import rollups
+        from monetario.models import db, Record
+
+        first, last = min(days), max(days)
+        month = rollups.month_of(first)
+
+        opening = rollups.balance_before(account.user_id, month, account.id)
+        amounts = defaultdict(int)
+
+        query = db.session.query(Record.date, Record.amount).filter(
+            Record.account_id == account.id,
+            Record.date >= rollups.start_of(month),
+            Record.date < rollups.start_of(last + datetime.timedelta(days=1)),
+        )
+        for date, amount in query:
+            amounts[_day(date)] += amount or 0
+
+        balances = {}
+        balance = opening
+        day = month
+        while day <= last:
+            balance += amounts.get(day, 0)
+            balances[day] = balance
+            day += datetime.timedelta(days=1)
+        return [balances[day] for day in days]
+
+    def _after_flush(self, session, flush_context):
+        from monetario import rollups
+        from monetario.models import Account
+
+        changes = defaultdict(lambda: defaultdict(int))
+        for values, sign in rollups.record_changes(session):
+            if values['account_id'] is not None and values['date'] is not None:
+                amount = sign * decimal.Decimal(str(values['amount'] or 0))
+                changes[values['account_id']][_day(values['date'])] += amount
+
+        if not changes:
+            return
+
+        table = Account.__table__
+        connection = session.connection()
+        pending = session.info.setdefault('balance_index', {})
+
+        # in order of ids, so that concurrent transfers lock the accounts
+        # alike
+        for account_id in sorted(changes):
+            connection.execute(table.update().where(table.c.id == account_id).values(
+                balance_version=table.c.balance_version + 1,
+                date_modified=table.c.date_modified,
+            ))
+            version = connection.execute(
+                table.select().with_only_columns([table.c.balance_version])
+                .where(table.c.id == account_id)
+            ).scalar()
+
+            if version is None:
+                # the account is deleted
+                pending[account_id] = None
+                continue
+
+            if pending.get(account_id) is not None:
+                pending[account_id][1] = version
+            else:
+                pending[account_id] = [version - 1, version, defaultdict(int)]
+
+            for day, amount in changes[account_id].items():
+                pending[account_id][2][day] += amount
+
+    def _after_commit(self, session):
+        pending = session.info.pop('balance_index', None)
+        if not pending:
+            return
+
+        with self._lock:
+            for account_id, versions in pending.items():
+                balances = self._accounts.get(account_id)
+                if balances is None:
+                    continue
+
+                if versions is None:
+                    del self._accounts[account_id]
+                    continue
+
+                before, after, amounts = versions
+
+                if balances.version == before and all(balances.covers(x) for x in amounts):
+                    for day, amount in amounts.items():
+                        balances.add(day, amount)
+                    balances.version = after
+                else:
+                    del self._accounts[account_id]
+
+    def _after_rollback(self, session):
+        session.info.pop('balance_index', None)
+
+    def clear(self):
+        with self._lock:
+            self._accounts.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._accounts),
+            'maxsize': self.maxsize,
+        }
@@ -0,0 +1,254 @@
+"""
+Compiles marshmallow schemas into plain dump functions.
+
+``Schema.dump`` looks every field up, dispatches through several layers of
+methods and collects errors for every object it serializes. The functions
+generated here read the attributes and format the values of one schema in
+straight-line code, and produce exactly what ``Schema().dump(obj).data``
+would. Mappings and other subscriptable objects are still handed over to
+marshmallow, which looks values up by key before trying attributes.
+
+Fields without a specialized translation are serialized by the marshmallow
+field itself, and schemas using processors, accessors or extra data are
+not compiled at all, so the output stays the same either way.
+"""
+import functools
+
+from marshmallow import fields
+from marshmallow import missing
+from marshmallow import ValidationError
+from marshmallow.schema import BaseSchema
+from marshmallow.schema import MarshalResult
+from marshmallow.utils import ensure_text_type
+
+from monetario.serializers import ChoiceField
+from monetario.serializers import sparse_fieldsets
+from monetario.serializers import sparse_schema
+
+
+_choices = {}
+
+
+def _get_choices(obj, name):
+    """
+    ``dict(obj.<name>)``, built only once for choices which are class
+    attributes (and never modified).
+    """
+    pairs = getattr(obj, name)
+    entry = _choices.get(id(pairs))
+
+    if entry is None or entry[0] is not pairs:
+        if getattr(obj.__class__, name, None) is not pairs:
+            return dict(pairs)
+        entry = _choices[id(pairs)] = (pairs, dict(pairs))
+
+    return entry[1]
+
+
+def _dump_with_schema(schema, obj):
+    return schema.dump(obj).data
+
+
+def _is_compilable(schema):
+    # marshmallow fills __processors__ (a defaultdict) with empty lists as
+    # soon as it dumps anything
+    return not (
+        any(schema.__processors__.values()) or
+        type(schema).get_attribute is not BaseSchema.get_attribute or
+        schema.__accessor__ is not None or
+        schema.extra or
+        schema.prefix
+    )
+
+
+class _Compiler(object):
+    def __init__(self):
+        self.namespace = {
+            'missing': missing,
+            'ValidationError': ValidationError,
+            'ensure_text_type': ensure_text_type,
+            'get_choices': _get_choices,
+        }
+        self.lines = []
+        self.functions = {}
+        self.pending = []
+
+    def add(self, value, prefix):
+        name = '{}_{}'.format(prefix, len(self.namespace))
+        self.namespace[name] = value
+        return name
+
+    def emit(self, indent, line):
+        self.lines.append('    ' * indent + line)
+
+    def function(self, schema):
+        """
+        Name of the dump function of a schema instance, which is generated
+        later on so that nested and recursive schemas can refer to it.
+        """
+        name = self.functions.get(id(schema))
+
+        if name is None:
+            if _is_compilable(schema):
+                name = 'dump_{}'.format(len(self.functions))
+                self.pending.append(schema)
+            else:
+                name = self.add(functools.partial(_dump_with_schema, schema), 'marshmallow')
+            self.functions[id(schema)] = name
+
+        return name
+
+    def compile(self, schema):
+        """
+        Generate the dump function of a schema instance and of its nested
+        schemas, and return it.
+        """
+        name = self.function(schema)
+
+        while self.pending:
+            nested = self.pending.pop()
+
+            # marshmallow looks values up by key first, only plain objects
+            # are handled by the generated code
+            fallback = self.add(functools.partial(_dump_with_schema, nested), 'fallback')
+
+            self.emit(0, 'def {}(obj):'.format(self.functions[id(nested)]))
+            self.emit(1, "if hasattr(obj, '__getitem__'):")
+            self.emit(2, 'return {}(obj)'.format(fallback))
+            self.emit(1, 'ret = {}')
+            for field_name, field in nested.fields.items():
+                if not field.load_only:
+                    self.compile_field(field_name, field)
+            self.emit(1, 'return ret')
+            self.emit(0, '')
+
+        exec(compile('\n'.join(self.lines), '<compiled serializer>', 'exec'), self.namespace)
+
+        return self.namespace[name]
+
+    def compile_field(self, name, field):
+        key = repr(field.dump_to or name)
+        attr = field.attribute or name
+        field_type = type(field)
+
+        if (not isinstance(attr, str) or '.' in attr or
+                field.default is not missing or not field._CHECK_ATTRIBUTE):
+            field_type = None
+
+        if field_type in (fields.Integer, fields.Float) and not field.as_string:
+            self.emit_value(attr)
+            self.emit(2, 'if value is None:')
+            self.emit(3, 'ret[{}] = None'.format(key))
+            self.emit(2, 'else:')
+            self.emit(3, 'try:')
+            self.emit(4, 'ret[{}] = {}(value)'.format(key, field.num_type.__name__))
+            self.emit(3, 'except (TypeError, ValueError):')
+            self.emit(4, 'pass')
+        elif field_type is fields.String:
+            self.emit_value(attr)
+            self.emit(2, 'ret[{}] = None if value is None else ensure_text_type(value)'.format(key))
+        elif field_type is fields.Boolean:
+            truthy = self.add(field.truthy, 'truthy')
+            falsy = self.add(field.falsy, 'falsy')
+            self.emit_value(attr)
+            self.emit(2, 'if value is None:')
+            self.emit(3, 'ret[{}] = None'.format(key))
+            self.emit(2, 'elif value in {}:'.format(truthy))
+            self.emit(3, 'ret[{}] = True'.format(key))
+            self.emit(2, 'elif value in {}:'.format(falsy))
+            self.emit(3, 'ret[{}] = False'.format(key))
+            self.emit(2, 'else:')
+            self.emit(3, 'ret[{}] = bool(value)'.format(key))
+        elif (field_type is fields.DateTime and
+                (field.dateformat or field.DEFAULT_FORMAT) in field.DATEFORMAT_SERIALIZATION_FUNCS):
+            format_func = self.add(
+                field.DATEFORMAT_SERIALIZATION_FUNCS[field.dateformat or field.DEFAULT_FORMAT],
+                'format'
+            )
+            self.emit_value(attr)
+            self.emit(2, 'if value is None:')
+            self.emit(3, 'ret[{}] = None'.format(key))
+            self.emit(2, 'else:')
+            self.emit(3, 'try:')
+            self.emit(4, 'ret[{}] = {}(value, localtime={!r})'.format(key, format_func, field.localtime))
+            self.emit(3, 'except (AttributeError, ValueError):')
+            self.emit(4, 'pass')
+        elif field_type is fields.Date:
+            self.emit_value(attr)
+            self.emit(2, 'if value is None:')
+            self.emit(3, 'ret[{}] = None'.format(key))
+            self.emit(2, 'else:')
+            self.emit(3, 'try:')
+            self.emit(4, 'ret[{}] = value.isoformat()'.format(key))
+            self.emit(3, 'except AttributeError:')
+            self.emit(4, 'pass')
+        elif (field_type is not None and issubclass(field_type, ChoiceField) and
+                field_type._serialize is ChoiceField._serialize):
+            self.emit_value(attr)
+            self.emit(2, "ret[{}] = {{'value': value, 'title': get_choices(obj, {!r}).get(value)}}".format(
+                key, field.choices
+            ))
+        elif field_type is fields.Nested and not isinstance(field.only, str):
+            function = self.function(field.schema)
+            self.emit_value(attr)
+            self.emit(2, 'if value is None:')
+            self.emit(3, 'ret[{}] = None'.format(key))
+            self.emit(2, 'else:')
+            if field.many:
+                self.emit(3, 'ret[{}] = [{}(x) for x in value]'.format(key, function))
+            else:
+                self.emit(3, 'ret[{}] = {}(value)'.format(key, function))
+        elif field_type is fields.Field:
+            self.emit_value(attr)
+            self.emit(2, 'ret[{}] = value'.format(key))
+        else:
+            # anything else is serialized by marshmallow itself
+            serialize = self.add(field.serialize, 'serialize')
+            self.emit(1, 'try:')
+            self.emit(2, 'value = {}({!r}, obj)'.format(serialize, name))
+            self.emit(1, 'except ValidationError as e:')
+            self.emit(2, 'value = e.data or missing')
+            self.emit(1, 'if value is not missing:')
+            self.emit(2, 'ret[{}] = value'.format(key))
+
+    def emit_value(self, attr):
+        self.emit(1, 'value = getattr(obj, {!r}, missing)'.format(attr))
+        self.emit(1, 'if value is not missing:')
+        self.emit(2, 'if callable(value):')
+        self.emit(3, 'value = value()')
+
+
+def compile_schema(schema):
+    """
+    Compile a schema instance into a function returning the dumped data of
+    one object.
+    """
+    return _Compiler().compile(schema)
+
+
+def _freeze(fieldsets):
+    return tuple(sorted(
+        ((name or '', tuple(names)) for name, names in (fieldsets or {}).items())
+    ))
+
+
+@functools.lru_cache(maxsize=512)
+def _dumper(schema_class, frozen):
+    fieldsets = {name or None: names for name, names in frozen}
+    return compile_schema(sparse_schema(schema_class, fieldsets))
+
+
+def dumper(schema_class, fieldsets=None):
+    """
+    The compiled dump function of ``schema_class`` limited to ``fieldsets``
+    (see :func:`monetario.serializers.sparse_schema`), cached by the
+    fields it keeps so that unknown names do not make new entries.
+    """
+    return _dumper(schema_class, _freeze(sparse_fieldsets(schema_class, fieldsets)))
+
+
+def dump(schema_class, obj, fieldsets=None):
+    """
+    Drop-in replacement of ``sparse_schema(schema_class, fieldsets).dump(obj)``.
+    """
+    return MarshalResult(dumper(schema_class, fieldsets)(obj), {})
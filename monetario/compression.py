@@ -0,0 +1,125 @@
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+class _Zlib(object):
+    def __init__(self, level, wbits):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _Brotli(object):
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class Compress(object):
+    """
+    Compresses responses with the best encoding the client accepts out of
+    brotli (when installed), gzip and deflate.
+
+    Only responses of ``COMPRESS_MIMETYPES`` of at least
+    ``COMPRESS_MIN_SIZE`` bytes are compressed; streamed responses always
+    are, chunk by chunk. ``COMPRESS_LEVEL`` (zlib, 1-9) and
+    ``COMPRESS_BROTLI_QUALITY`` (0-11) trade CPU for size.
+    """
+
+    def __init__(self, app=None):
+        self.min_size = 1024
+        self.level = 6
+        self.brotli_quality = 4
+        self.mimetypes = ('application/json', 'application/x-ndjson')
+        self.encodings = ('gzip', 'deflate')
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', self.min_size)
+        self.level = app.config.get('COMPRESS_LEVEL', self.level)
+        self.brotli_quality = app.config.get('COMPRESS_BROTLI_QUALITY', self.brotli_quality)
+        self.mimetypes = tuple(app.config.get('COMPRESS_MIMETYPES', self.mimetypes))
+        encodings = app.config.get('COMPRESS_ENCODINGS', ('br', 'gzip', 'deflate'))
+        self.encodings = tuple(x for x in encodings if x != 'br' or brotli is not None)
+
+        app.after_request(self.after_request)
+
+    def negotiate(self):
+        """
+        The encoding responses to the current request are compressed with,
+        ``None`` when the client accepts none of them.
+        """
+        accepted = request.accept_encodings
+        encoding = accepted.best_match(self.encodings)
+
+        if encoding is None or not accepted[encoding]:
+            return None
+        return encoding
+
+    def compressor(self, encoding):
+        if encoding == 'br':
+            return _Brotli(self.brotli_quality)
+        if encoding == 'gzip':
+            return _Zlib(self.level, 16 + zlib.MAX_WBITS)
+        return _Zlib(self.level, zlib.MAX_WBITS)
+
+    def after_request(self, response):
+        if (response.mimetype not in self.mimetypes or response.direct_passthrough or
+                response.status_code < 200 or response.status_code in (204, 304) or
+                'Content-Encoding' in response.headers):
+            return response
+
+        response.vary.add('Accept-Encoding')
+
+        encoding = self.negotiate()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self._stream(response.response, self.compressor(encoding))
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+
+            compressor = self.compressor(encoding)
+            response.set_data(compressor.compress(data) + compressor.finish())
+
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def _stream(self, chunks, compressor):
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                # flushed so that every chunk reaches the client right away
+                yield compressor.compress(chunk) + compressor.flush()
+            yield compressor.finish()
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
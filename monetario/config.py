@@ -15,6 +15,102 @@ class Config(object):
     BABEL_DEFAULT_LOCALE = 'ru'
     BABEL_DEFAULT_TIMEZONE = 'Europe/Kiev'
 
+    # Authenticated identities cached per worker, keyed by token digest.
+    # Entries live AUTH_CACHE_TTL seconds at most (None: until the token
+    # expires). A token revoked or refreshed, or a user changed, on another
+    # worker is only dropped from the cache of that one, the others keep
+    # accepting it for as long.
+    AUTH_CACHE_SIZE = 10000
+    AUTH_CACHE_TTL = 5
+
+    # 'database' tokens are checked against their row on every cache miss,
+    # 'stateless' tokens carry user_id/group_id/app_id and a generation and
+    # are only checked against the in-memory revocation set.
+    TOKEN_MODE = 'database'
+    TOKEN_EXPIRES_IN = 900
+    TOKEN_REVOCATION_RELOAD_INTERVAL = 60
+    TOKEN_REVOCATION_REDIS_URL = os.environ.get('TOKEN_REVOCATION_REDIS_URL')
+
+    # Extra signing keys by key id. Keys created with `manage.py
+    # rotate_signing_key` are loaded from the database on top of these;
+    # tokens without a key id are verified with SECRET_KEY.
+    SIGNING_KEYS = {}
+    SIGNING_KEY_ID = None
+    SIGNING_KEYS_RELOAD_INTERVAL = 300
+
+    # Passwords are hashed on a bounded pool per worker. Logins beyond
+    # PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_SIZE, and beyond all but
+    # one of the WORKER_CONCURRENCY request threads of the worker (gunicorn
+    # --threads, or --worker-connections of the gevent worker), fail fast
+    # with 503. The sync worker serves one request at a time and never
+    # rejects one. Hashes made with another method or salt length are
+    # upgraded on the next login.
+    WORKER_CONCURRENCY = int(os.environ.get('WORKER_CONCURRENCY', 1))
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:50000'
+    PASSWORD_HASH_SALT_LENGTH = 16
+    PASSWORD_HASH_WORKERS = 2
+    PASSWORD_HASH_QUEUE_SIZE = 8
+    PASSWORD_HASH_TIMEOUT = 10
+
+    # Sliding-window limits of POST /token/ as (attempts, seconds) per email,
+    # client address and API app. The app limit can be overridden per App,
+    # the override is kept with the counters for LOGIN_THROTTLE_OVERRIDE_TTL
+    # seconds. Both are kept per worker unless LOGIN_THROTTLE_REDIS_URL is set.
+    LOGIN_THROTTLE_LIMITS = {
+        'email': (10, 300),
+        'ip': (30, 60),
+        'app': (600, 60),
+    }
+    LOGIN_THROTTLE_MAX_KEYS = 100000
+    LOGIN_THROTTLE_OVERRIDE_TTL = 300
+    LOGIN_THROTTLE_REDIS_URL = os.environ.get('LOGIN_THROTTLE_REDIS_URL')
+
+    # Counts of collections requested with count=estimate, cached per worker
+    # until a write to the counted table or for COUNT_CACHE_TTL seconds. On
+    # PostgreSQL the planner estimate is used once it exceeds the threshold.
+    COUNT_CACHE_SIZE = 10000
+    COUNT_CACHE_TTL = 300
+    COUNT_ESTIMATE_THRESHOLD = 10000
+
+    # Collections requested as NDJSON or with stream=1 are fetched
+    # STREAM_YIELD_PER rows at a time and sent in chunks of about
+    # STREAM_CHUNK_SIZE characters.
+    STREAM_YIELD_PER = 50
+    STREAM_CHUNK_SIZE = 16384
+
+    # Backend of the compact JSON encoding of API responses, 'auto' uses
+    # orjson or rapidjson when installed and the json module otherwise.
+    JSON_ENCODER = os.environ.get('JSON_ENCODER', 'auto')
+
+    # JSON responses of at least COMPRESS_MIN_SIZE bytes (and every streamed
+    # one) are compressed with the first of COMPRESS_ENCODINGS the client
+    # accepts, brotli only when installed. Higher levels cost more CPU.
+    COMPRESS_ENCODINGS = ('br', 'gzip', 'deflate')
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 4
+
+    # Shapes (filtered and sorted columns) of collection queries and their
+    # latency, up to INDEX_ADVISOR_SIZE of them per worker, added to the
+    # query_shape table every INDEX_ADVISOR_FLUSH_INTERVAL seconds. See
+    # `manage.py index_advice`.
+    INDEX_ADVISOR_SIZE = 1000
+    INDEX_ADVISOR_FLUSH_INTERVAL = 60
+
+    # Daily balances of up to BALANCE_INDEX_SIZE accounts per worker, for
+    # /accounts/<id>/balance_series/. Accounts spanning more than
+    # BALANCE_INDEX_MAX_DAYS days are summed in SQL instead.
+    BALANCE_INDEX_SIZE = 1000
+    BALANCE_INDEX_MAX_DAYS = 36600
+
+    # Records and transactions keep their amount in BASE_CURRENCY, at the
+    # currency_rate of their date, for reports in it. See
+    # `manage.py backfill_amount_base` for the rows written before.
+    BASE_CURRENCY = os.environ.get('BASE_CURRENCY', 'EUR')
+    # Seconds a worker converts with the rates it loaded before checking for
+    # new ones.
+    EXCHANGE_RATES_RELOAD_INTERVAL = 60
+
     @staticmethod
     def init_app(app):
         pass
@@ -31,6 +127,7 @@ class TestingConfig(Config):
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = "sqlite://"
     SQLALCHEMY_ECHO = False
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha1:1000'
 
 
 class ProductionConfig(Config):
@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class CountCache(object):
+    """
+    In-process LRU cache of collection counts.
+
+    Entries are keyed by table, user and the SQL of the count, and are
+    dropped as soon as this worker flushes a write to a row of that table
+    and user (or of any user for tables without ``user_id``). Writes made by
+    other workers are only seen after ``COUNT_CACHE_TTL`` seconds, so the
+    counts served from here are estimates.
+    """
+
+    def __init__(self, app=None):
+        self.maxsize = 10000
+        self.ttl = 300
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+        # every session of the process, flushes of other apps only cost a
+        # few needless invalidations
+        event.listen(Session, 'after_flush', self._after_flush)
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('COUNT_CACHE_SIZE', self.maxsize)
+        self.ttl = app.config.get('COUNT_CACHE_TTL', self.ttl)
+        self.clear()
+
+    def _generation(self, table, user_id):
+        return self._generations.get((table, None), 0), self._generations.get((table, user_id), 0)
+
+    def key(self, table, user_id, statement, params):
+        params = json.dumps(params, sort_keys=True, default=str)
+        return (table, user_id, str(statement), params)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if (entry is None or entry[1] <= time.time() or
+                    entry[2] != self._generation(key[0], key[1])):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, count):
+        if not self.maxsize:
+            return
+
+        with self._lock:
+            self._entries[key] = (count, time.time() + self.ttl, self._generation(key[0], key[1]))
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, table, user_id=None):
+        with self._lock:
+            key = (table, user_id)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def _after_flush(self, session, flush_context):
+        for instance in set(session.new) | set(session.dirty) | set(session.deleted):
+            table = getattr(instance, '__tablename__', None)
+            if table is not None:
+                self.invalidate(table, getattr(instance, 'user_id', None))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
@@ -0,0 +1,100 @@
+import datetime
+import decimal
+import json
+import uuid
+
+from marshmallow.schema import MarshalResult
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import rapidjson
+except ImportError:  # pragma: no cover
+    rapidjson = None
+
+
+def default(obj):
+    """
+    Values the encoders do not handle themselves. Amounts are dumped as
+    floats, like the ``Float`` fields of the serializers do.
+    """
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError('{!r} is not JSON serializable'.format(obj))
+
+
+def _stdlib(sort_keys):
+    return json.JSONEncoder(separators=(',', ':'), sort_keys=sort_keys, default=default).encode
+
+
+def _orjson(sort_keys):
+    option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+
+    def encode(obj):
+        return orjson.dumps(obj, default=default, option=option).decode('utf-8')
+    return encode
+
+
+def _rapidjson(sort_keys):
+    def encode(obj):
+        return rapidjson.dumps(obj, default=default, sort_keys=sort_keys)
+    return encode
+
+
+BACKENDS = (
+    ('orjson', lambda: orjson, _orjson),
+    ('rapidjson', lambda: rapidjson, _rapidjson),
+    ('json', lambda: json, _stdlib),
+)
+
+
+class Encoder(object):
+    """
+    Compact JSON encoding of API responses.
+
+    ``JSON_ENCODER`` names the backend, ``'auto'`` picks the first installed
+    one of orjson, rapidjson and the standard library. Every backend
+    handles ``Decimal``, dates and datetimes the same way (see
+    :func:`default`), and sorts keys when ``JSON_SORT_KEYS`` is set.
+    """
+
+    def __init__(self, app=None):
+        self.name = 'json'
+        self.encode = _stdlib(True)
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        name = app.config.get('JSON_ENCODER', 'auto')
+        sort_keys = app.config.get('JSON_SORT_KEYS', True)
+
+        for backend, module, factory in BACKENDS:
+            if name not in ('auto', backend):
+                continue
+            if module() is None:
+                if name == backend:
+                    raise RuntimeError(
+                        '{0} JSON encoder requires the {0} package'.format(backend)
+                    )
+                continue
+            self.name = backend
+            self.encode = factory(sort_keys)
+            return
+
+        raise RuntimeError('Unknown JSON encoder {}'.format(name))
+
+    def dumps(self, obj):
+        # a (data, errors) tuple, which would be encoded as a list
+        if isinstance(obj, MarshalResult):
+            obj = obj.data
+        return self.encode(obj)
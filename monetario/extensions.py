@@ -5,6 +5,18 @@ from flask.ext.sqlalchemy import SQLAlchemy
 from raven.contrib.flask import Sentry
 from flask.ext.login import LoginManager
 
+from .advisor import IndexAdvisor
+from .auth import AuthCache
+from .auth import RevocationSet
+from .balances import BalanceIndex
+from .compression import Compress
+from .counts import CountCache
+from .encoders import Encoder
+from .hashing import PasswordHasher
+from .rates import ExchangeRates
+from .signing import Keyring
+from .throttle import Throttle
+
 
 db = SQLAlchemy()
 babel = Babel()
@@ -12,3 +24,14 @@ mail = Mail()
 migrate = Migrate()
 sentry = Sentry()
 login_manager = LoginManager()
+auth_cache = AuthCache()
+token_revocations = RevocationSet()
+keyring = Keyring()
+password_hasher = PasswordHasher()
+login_throttle = Throttle(config_prefix='LOGIN_THROTTLE')
+count_cache = CountCache()
+json_encoder = Encoder()
+compress = Compress()
+index_advisor = IndexAdvisor()
+balance_index = BalanceIndex()
+exchange_rates = ExchangeRates()
@@ -0,0 +1,118 @@
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashingBusy(Exception):
+    """
+    Raised when the password hashing pool of this worker is saturated.
+    """
+
+
+class PasswordHasher(object):
+    """
+    Runs password hashing on a small dedicated thread pool.
+
+    At most ``PASSWORD_HASH_WORKERS`` hashes run at once and at most
+    ``PASSWORD_HASH_QUEUE_SIZE`` more may wait for a thread; any call beyond
+    that raises :exc:`HashingBusy` immediately instead of queueing, so a
+    burst of logins can not occupy every request thread of the worker.
+
+    The caller waits for its hash, so there are never more hashes in flight
+    than the ``WORKER_CONCURRENCY`` request threads of the worker: the bound
+    is capped to all of them but one. Under the sync worker, one request at
+    a time, nothing is ever rejected and a hash can only time out; failing
+    fast needs the threaded (``--threads``) or gevent worker.
+    """
+
+    def __init__(self, app=None):
+        self.method = 'pbkdf2:sha256:50000'
+        self.salt_length = 16
+        self.max_workers = 2
+        self.queue_size = 8
+        self.timeout = 10
+        self.concurrency = 1
+        self.rejected = 0
+        self._executor = None
+        self._pid = None
+        self._slots = threading.BoundedSemaphore(self.slots)
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        self.salt_length = app.config.get('PASSWORD_HASH_SALT_LENGTH', self.salt_length)
+        self.max_workers = app.config.get('PASSWORD_HASH_WORKERS', self.max_workers)
+        self.queue_size = app.config.get('PASSWORD_HASH_QUEUE_SIZE', self.queue_size)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        self.concurrency = app.config.get('WORKER_CONCURRENCY', self.concurrency)
+        self.rejected = 0
+
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = None
+            self._slots = threading.BoundedSemaphore(self.slots)
+
+    @property
+    def slots(self):
+        # hashes running or waiting for a thread, leaving a request thread
+        # free for anything but logins
+        return max(min(self.max_workers + self.queue_size, self.concurrency - 1), 1)
+
+    @property
+    def executor(self):
+        # The pool is created lazily so that every forked worker gets its own.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    def generate(self, password):
+        return generate_password_hash(password, method=self.method, salt_length=self.salt_length)
+
+    def needs_rehash(self, pwhash):
+        parts = pwhash.split('$', 2)
+        if len(parts) != 3:
+            return True
+
+        method, salt, _ = parts
+        return method != self.method or len(salt) != self.salt_length
+
+    def hash(self, password):
+        return self.submit(self.generate, password)
+
+    def check(self, pwhash, password):
+        return self.submit(check_password_hash, pwhash, password)
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingBusy()
+
+        slots = self._slots
+
+        def run():
+            try:
+                return fn(*args)
+            finally:
+                slots.release()
+
+        try:
+            future = self.executor.submit(run)
+        except Exception:
+            slots.release()
+            raise
+
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            self.rejected += 1
+            raise HashingBusy()
@@ -1,13 +1,20 @@
+import binascii
+import os
+import time
+
 from datetime import datetime
 
 from flask import current_app
 from flask import url_for
 
-from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 from itsdangerous import BadSignature, SignatureExpired
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import DDL
+from sqlalchemy import event
 
-from .extensions import db
+from .auth import token_digest
+from .extensions import db, keyring, password_hasher
+from .search import searchable
+from monetario.compiler import dump
 from monetario.serializers import AppSchema
 from monetario.serializers import TokenSchema
 from monetario.serializers import GroupSchema
@@ -39,6 +46,70 @@ class CurrencyRate(db.Model):
     date_modified = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
 
+class SigningKey(db.Model):
+    __tablename__ = 'signing_key'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kid = db.Column(db.String(32), index=True, unique=True, nullable=False)
+    secret = db.Column(db.String(128), nullable=False)
+    date_created = db.Column(db.DateTime, default=datetime.now)
+    date_retired = db.Column(db.DateTime, index=True)
+
+    @staticmethod
+    def generate():
+        return SigningKey(
+            kid=binascii.hexlify(os.urandom(4)).decode('ascii'),
+            secret=binascii.hexlify(os.urandom(32)).decode('ascii'),
+        )
+
+    @staticmethod
+    def load_keys():
+        """
+        Signing keys which have not been retired as ``(kid, secret)`` pairs,
+        oldest first.
+        """
+        return db.session.query(SigningKey.kid, SigningKey.secret).filter(
+            SigningKey.date_retired.is_(None)
+        ).order_by(SigningKey.date_created, SigningKey.id).all()
+
+    def __repr__(self):
+        return self.kid
+
+
+class QueryShape(db.Model):
+    """
+    Usage of one shape of collection queries, as recorded by the index
+    advisor. Columns are comma separated.
+    """
+    __tablename__ = 'query_shape'
+    __table_args__ = (
+        db.UniqueConstraint('table_name', 'equality', 'ranges', 'sort'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(64), nullable=False)
+    equality = db.Column(db.String(255), nullable=False, default='')
+    ranges = db.Column(db.String(255), nullable=False, default='')
+    sort = db.Column(db.String(255), nullable=False, default='')
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total_time = db.Column(db.Float, nullable=False, default=0)
+    max_time = db.Column(db.Float, nullable=False, default=0)
+    date_modified = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def columns(self):
+        """
+        The compared, range and sort columns as lists.
+        """
+        return tuple(
+            value.split(',') if value else [] for value in (self.equality, self.ranges, self.sort)
+        )
+
+    def __repr__(self):
+        return '<QueryShape {} {}/{}/{} />'.format(
+            self.table_name, self.equality, self.ranges, self.sort
+        )
+
+
 class Tag(db.Model):
     __tablename__ = 'tag'
 
@@ -56,10 +127,8 @@ class Group(db.Model):
     def resource_url(self):
         return url_for('api.v1.get_group', group_id=self.id, _external=True)
 
-    def to_json(self, exclude=None):
-        schema = GroupSchema()
-        result = schema.dump(self)
-        return result
+    def to_json(self, exclude=None, fields=None):
+        return dump(GroupSchema, self, fields)
 
     @staticmethod
     def from_json(data, partial=False):
@@ -96,7 +165,7 @@ class User(db.Model):
 
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.generate(password)
 
     def get_id(self):
         return self.id
@@ -111,18 +180,26 @@ class User(db.Model):
         return False
 
     def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.check(self.password_hash, password)
+
+    def upgrade_password_hash(self, password):
+        """
+        Rehash an already verified password if it was hashed with parameters
+        other than the configured ones.
+        """
+        if not password_hasher.needs_rehash(self.password_hash):
+            return False
+
+        self.password_hash = password_hasher.hash(password)
+        return True
 
     def generate_auth_token(self, expires_in=3600):
-        s = Serializer(current_app.config['SECRET_KEY'], expires_in=expires_in)
-        return s.dumps({'id': self.id}).decode('utf-8')
+        return keyring.dumps({'id': self.id}, expires_in=expires_in)
 
     @staticmethod
     def verify_auth_token(token):
-        s = Serializer(current_app.config['SECRET_KEY'])
-
         try:
-            data = s.loads(token)
+            data = keyring.loads(token)
         except SignatureExpired:
             return None
         except BadSignature:
@@ -134,10 +211,8 @@ class User(db.Model):
     def resource_url(self):
         return url_for('api.v1.get_user', user_id=self.id, _external=True)
 
-    def to_json(self, exclude=None):
-        schema = UserSchema()
-        result = schema.dump(self)
-        return result
+    def to_json(self, exclude=None, fields=None):
+        return dump(UserSchema, self, fields)
 
     @staticmethod
     def from_json(data, partial=False):
@@ -152,6 +227,42 @@ class User(db.Model):
             return self.email
 
 
+class UserIdentity(object):
+    """
+    Lightweight authenticated user built from a cached ``(id, group_id, active)``
+    identity. The full ``User`` row is only loaded when a view asks for it.
+    """
+
+    def __init__(self, id, group_id, active, app_id=None, generation=None):
+        self.id = id
+        self.group_id = group_id
+        self.active = active
+        self.app_id = app_id
+        self.generation = generation
+        self._user = None
+
+    @property
+    def user(self):
+        if self._user is None:
+            self._user = User.query.get(self.id)
+        return self._user
+
+    def get_id(self):
+        return self.id
+
+    def is_authenticated(self):
+        return True
+
+    def is_active(self):
+        return self.active
+
+    def is_anonymous(self):
+        return False
+
+    def __repr__(self):
+        return '<UserIdentity id="{}" />'.format(self.id)
+
+
 class Category(db.Model):
     __tablename__ = 'category'
 
@@ -177,10 +288,8 @@ class Category(db.Model):
     def resource_url(self):
         return url_for('api.v1.get_category', category_id=self.id, _external=True)
 
-    def to_json(self, exclude=None):
-        schema = CategorySchema()
-        result = schema.dump(self)
-        return result
+    def to_json(self, exclude=None, fields=None):
+        return dump(CategorySchema, self, fields)
 
     @staticmethod
     def from_json(data, partial=False):
@@ -191,6 +300,9 @@ class Category(db.Model):
 
 class GroupCategory(db.Model):
     __tablename__ = 'group_category'
+    __table_args__ = (
+        db.Index('ix_group_category_group_id_date_modified', 'group_id', 'date_modified'),
+    )
 
     CATEGORY_TYPE_INCOME = Category.CATEGORY_TYPE_INCOME
     CATEGORY_TYPE_EXPENSE = Category.CATEGORY_TYPE_EXPENSE
@@ -208,6 +320,8 @@ class GroupCategory(db.Model):
     group_id = db.Column(db.Integer, db.ForeignKey('group.id'), index=True)
     group = db.relationship(Group, backref='categories')
 
+    date_modified = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
     def __repr__(self):
         return self.name
 
@@ -215,10 +329,8 @@ class GroupCategory(db.Model):
     def resource_url(self):
         return url_for('api.v1.get_group_category', group_category_id=self.id, _external=True)
 
-    def to_json(self, exclude=None):
-        schema = GroupCategorySchema()
-        result = schema.dump(self)
-        return result
+    def to_json(self, exclude=None, fields=None):
+        return dump(GroupCategorySchema, self, fields)
 
     @staticmethod
     def from_json(data, partial=False):
@@ -247,10 +359,8 @@ class GroupCurrency(db.Model):
     def resource_url(self):
         return url_for('api.v1.get_group_currency', group_currency_id=self.id, _external=True)
 
-    def to_json(self, exclude=None):
-        schema = GroupCurrencySchema()
-        result = schema.dump(self)
-        return result
+    def to_json(self, exclude=None, fields=None):
+        return dump(GroupCurrencySchema, self, fields)
 
     @staticmethod
     def from_json(data, partial=False):
@@ -261,6 +371,9 @@ class GroupCurrency(db.Model):
 
 class Account(db.Model):
     __tablename__ = 'account'
+    __table_args__ = (
+        db.Index('ix_account_user_id_date_modified', 'user_id', 'date_modified'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), index=True)
@@ -270,6 +383,11 @@ class Account(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     user = db.relationship(User, backref='accounts')
 
+    date_modified = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    # bumped by every flush of records of the account, see
+    # monetario.balances.BalanceIndex
+    balance_version = db.Column(db.Integer, nullable=False, default=0)
+
     def __repr__(self):
         return self.name
 
@@ -277,10 +395,8 @@ class Account(db.Model):
     def resource_url(self):
         return url_for('api.v1.get_account', account_id=self.id, _external=True)
 
-    def to_json(self, exclude=None):
-        schema = AccountSchema()
-        result = schema.dump(self)
-        return result
+    def to_json(self, exclude=None, fields=None):
+        return dump(AccountSchema, self, fields)
 
     @staticmethod
     def from_json(data, partial=False):
@@ -304,6 +420,10 @@ class Transaction(db.Model):
     target_account = db.relationship('Account', foreign_keys=[target_account_id])
 
     amount = db.Column(db.Numeric(13, 4))
+    # the amount in the BASE_CURRENCY and the rate it was converted at, see
+    # monetario.rates.ExchangeRates.set_amount_base
+    amount_base = db.Column(db.Numeric(15, 4))
+    base_rate = db.Column(db.Numeric(18, 8))
 
     currency_id = db.Column(db.Integer, db.ForeignKey('group_currency.id'), index=True)
     currency = db.relationship(GroupCurrency, backref='transactions')
@@ -318,10 +438,8 @@ class Transaction(db.Model):
     def resource_url(self):
         return url_for('api.v1.get_transaction', transaction_id=self.id, _external=True)
 
-    def to_json(self, exclude=None):
-        schema = TransactionSchema()
-        result = schema.dump(self)
-        return result
+    def to_json(self, exclude=None, fields=None):
+        return dump(TransactionSchema, self, fields)
 
     @staticmethod
     def from_json(data, partial=False):
@@ -330,8 +448,20 @@ class Transaction(db.Model):
         return result
 
 
+searchable(Transaction.__table__, 'description')
+
+
 class Record(db.Model):
     __tablename__ = 'record'
+    __table_args__ = (
+        db.Index('ix_record_user_id_date_modified', 'user_id', 'date_modified'),
+        # the records of a user by date, of which the balances only read the
+        # trailing columns, and the records of a category of a user by date
+        db.Index(
+            'ix_record_user_id_date', 'user_id', 'date', 'record_type', 'category_id', 'amount'
+        ),
+        db.Index('ix_record_user_id_category_id_date', 'user_id', 'category_id', 'date'),
+    )
 
     (
         RECORD_TYPE_INCOME,
@@ -363,6 +493,10 @@ class Record(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     amount = db.Column(db.Numeric(13, 4))
+    # the amount in the BASE_CURRENCY and the rate it was converted at, see
+    # monetario.rates.ExchangeRates.set_amount_base
+    amount_base = db.Column(db.Numeric(15, 4))
+    base_rate = db.Column(db.Numeric(18, 8))
     description = db.Column(db.Text, index=True)
     record_type = db.Column(db.Integer, default=RECORD_TYPE_EXPENSE)
     payment_method = db.Column(
@@ -370,7 +504,7 @@ class Record(db.Model):
     )  # cash, debet card, mobile, internet payment
     date = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, index=True)
 
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     user = db.relationship(User, backref='records')
 
     transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.id'), index=True)
@@ -387,6 +521,8 @@ class Record(db.Model):
 
     tags = db.relationship('Tag', secondary=record_tag_table, backref=db.backref('records'))
 
+    date_modified = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
     def __repr__(self):
         return '{}_{}_{}'.format(self.account_id, self.record_type, self.amount)
 
@@ -394,10 +530,8 @@ class Record(db.Model):
     def resource_url(self):
         return url_for('api.v1.get_record', record_id=self.id, _external=True)
 
-    def to_json(self, exclude=None):
-        schema = RecordSchema()
-        result = schema.dump(self)
-        return result
+    def to_json(self, exclude=None, fields=None):
+        return dump(RecordSchema, self, fields)
 
     @staticmethod
     def from_json(data, partial=False):
@@ -406,6 +540,66 @@ class Record(db.Model):
         return result
 
 
+searchable(Record.__table__, 'description')
+
+# a few pages of records per range of dates, for large tables which are
+# mostly appended to in date order
+event.listen(
+    Record.__table__, 'after_create',
+    DDL('CREATE INDEX ix_record_date_brin ON record USING brin (date)').execute_if(
+        dialect='postgresql'
+    )
+)
+
+
+class RecordMonth(db.Model):
+    """
+    Sums of the records of one account and currency of a user in a month,
+    and the balance they start from, kept up to date by
+    :mod:`monetario.rollups`.
+    """
+    __tablename__ = 'record_month'
+    __table_args__ = (
+        db.Index('ix_record_month_user_id_month', 'user_id', 'month'),
+        db.Index('ix_record_month_account_id_currency_id_month',
+                 'account_id', 'currency_id', 'month'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # the rows of a user, account or currency go with it, its records are
+    # counted without it
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'))
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id', ondelete='CASCADE'))
+    currency_id = db.Column(
+        db.Integer, db.ForeignKey('group_currency.id', ondelete='CASCADE'), index=True
+    )
+    # the first day of the month
+    month = db.Column(db.Date, nullable=False)
+
+    income = db.Column(db.Numeric(15, 4), nullable=False, default=0)
+    expense = db.Column(db.Numeric(15, 4), nullable=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    # the checkpoint: the sum of the records of the account and currency
+    # before the month
+    balance = db.Column(db.Numeric(15, 4), nullable=False, default=0)
+
+    def __repr__(self):
+        return '<RecordMonth {} {} {} {} />'.format(
+            self.user_id, self.account_id, self.currency_id, self.month
+        )
+
+
+# one row per key, records without an account or currency included
+db.Index(
+    'ix_record_month_key',
+    db.func.coalesce(RecordMonth.user_id, 0),
+    db.func.coalesce(RecordMonth.account_id, 0),
+    db.func.coalesce(RecordMonth.currency_id, 0),
+    RecordMonth.month,
+    unique=True
+)
+
+
 class App(db.Model):
     __tablename__ = 'app'
 
@@ -413,6 +607,10 @@ class App(db.Model):
     name = db.Column(db.String(255), index=True)
     secret = db.Column(db.String(255), index=True)
 
+    # overrides LOGIN_THROTTLE_LIMITS['app'] when both are set
+    login_limit = db.Column(db.Integer)
+    login_limit_period = db.Column(db.Integer)
+
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     user = db.relationship(User, backref='apps')
 
@@ -420,30 +618,47 @@ class App(db.Model):
         return self.name
 
     def generate_auth_token(self, expires_in=157680000):
-        s = Serializer(current_app.config['SECRET_KEY'], expires_in=expires_in)
-        return s.dumps({'id': self.id}).decode('utf-8')
+        return keyring.dumps({'id': self.id}, expires_in=expires_in)
 
     @staticmethod
     def verify_auth_token(token):
-        s = Serializer(current_app.config['SECRET_KEY'])
+        app_id = App.load_app_id(token)
+
+        if app_id is None:
+            return None
+
+        return App.query.get(app_id)
 
+    @staticmethod
+    def load_app_id(token):
+        """
+        Id of the app a secret was signed for, checked without a query.
+        """
         try:
-            data = s.loads(token)
+            data = keyring.loads(token)
         except SignatureExpired:
             return None
         except BadSignature:
             return None
 
-        return App.query.get(data['id'])
+        return data['id']
+
+    @property
+    def login_throttle_limit(self):
+        """
+        The ``(attempts, seconds)`` logins through the app are limited to,
+        ``None`` for LOGIN_THROTTLE_LIMITS['app'].
+        """
+        if self.login_limit and self.login_limit_period:
+            return (self.login_limit, self.login_limit_period)
+        return None
 
     @property
     def resource_url(self):
         return url_for('api.v1.get_app', app_id=self.id, _external=True)
 
-    def to_json(self, exclude=None):
-        schema = AppSchema()
-        result = schema.dump(self)
-        return result
+    def to_json(self, exclude=None, fields=None):
+        return dump(AppSchema, self, fields)
 
     @staticmethod
     def from_json(data, partial=False):
@@ -454,6 +669,9 @@ class App(db.Model):
 
 class Token(db.Model):
     __tablename__ = 'token'
+    __table_args__ = (
+        db.UniqueConstraint('app_id', 'user_id', name='uq_token_app_id_user_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -463,41 +681,165 @@ class Token(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     user = db.relationship(User, backref='tokens')
 
-    token = db.Column(db.String(255), index=True)
+    # only a digest of the signed token is stored, see Token.token
+    token_digest = db.Column(db.LargeBinary(32), index=True)
+    generation = db.Column(db.Integer, default=0, nullable=False)
+    date_modified = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    @property
+    def token(self):
+        """
+        The signed token issued through this instance. Tokens are never read
+        back from the database, rows are looked up by their digest instead.
+        """
+        return getattr(self, '_token', None)
+
+    @token.setter
+    def token(self, value):
+        self._token = value
+        self.token_digest = token_digest(value) if value else None
+
+    @staticmethod
+    def find(auth_token):
+        return Token.query.filter(Token.token_digest == token_digest(auth_token)).first()
+
+    def generate_auth_token(self, expires_in=None):
+        if expires_in is None:
+            expires_in = current_app.config['TOKEN_EXPIRES_IN']
+
+        # The payload does not depend on the row id, so a new token row can be
+        # inserted together with its signed value.
+        payload = {'app_id': self.app_id, 'user_id': self.user_id, 'gen': self.generation or 0}
+
+        if current_app.config['TOKEN_MODE'] == 'stateless':
+            payload.update({'group_id': self.user.group_id, 'active': self.user.active})
 
-    def generate_auth_token(self, expires_in=900):
-        s = Serializer(current_app.config['SECRET_KEY'], expires_in=expires_in)
-        return s.dumps({'id': self.id}).decode('utf-8')
+        return keyring.dumps(payload, expires_in=expires_in)
 
-    def is_token_valid(self):
-        s = Serializer(current_app.config['SECRET_KEY'])
+    def issue(self, expires_in=None):
+        """
+        Start a new token generation and sign a token for it. Tokens of the
+        previous generations are revoked.
+        """
+        self.generation = (self.generation or 0) + 1
+        self.token = self.generate_auth_token(expires_in=expires_in)
+        return self.token
 
+    def revoke(self):
+        self.generation = (self.generation or 0) + 1
+        self.token = None
+
+    @staticmethod
+    def load_auth_token(token):
+        """
+        Verify a signed token and return its ``(payload, header)`` pair or
+        ``None`` when the token is expired or forged.
+        """
         try:
-            data = s.loads(self.token)
+            return keyring.loads(token, return_header=True)
         except SignatureExpired:
-            return False
+            return None
         except BadSignature:
-            return False
+            return None
+
+    def load_token(self, auth_token):
+        loaded = Token.load_auth_token(auth_token)
+
+        if not loaded:
+            return None
+
+        data = loaded[0]
+
+        if 'id' in data:
+            # issued before token payloads stopped carrying the row id
+            if data['id'] != self.id:
+                return None
+        elif (data.get('app_id'), data.get('user_id')) != (self.app_id, self.user_id):
+            return None
+
+        return loaded
 
-        return self.id == data['id']
+    def is_token_valid(self, auth_token):
+        return self.load_token(auth_token) is not None
 
     @staticmethod
-    def verify_auth_token(token):
-        s = Serializer(current_app.config['SECRET_KEY'])
+    def authenticate(auth_token):
+        """
+        Resolve a token sent by a client to ``(identity, expires_at)``, where
+        identity is ``(user_id, group_id, active, app_id, generation)``.
+
+        Self-describing tokens are trusted as-is in the stateless mode, any
+        other token is checked against its ``token`` row.
+        """
+        if current_app.config['TOKEN_MODE'] == 'stateless':
+            loaded = Token.load_auth_token(auth_token)
+
+            if not loaded:
+                return None
+
+            data, header = loaded
+
+            if 'group_id' in data:
+                identity = (
+                    data['user_id'], data['group_id'], data['active'], data['app_id'], data['gen']
+                )
+                return identity, header['exp']
+
+        row = (
+            db.session.query(Token, User)
+            .join(User, User.id == Token.user_id)
+            .filter(Token.token_digest == token_digest(auth_token))
+            .first()
+        )
+
+        if not row:
+            return None
+
+        token, user = row
+        loaded = token.load_token(auth_token)
+
+        if not loaded:
+            return None
+
+        identity = (user.id, user.group_id, user.active, token.app_id, token.generation)
+        return identity, loaded[1]['exp']
 
+    @staticmethod
+    def revocations(since):
+        """
+        Token generations bumped after ``since`` as
+        ``(app_id, user_id, generation, revoked_at)`` tuples.
+        """
+        tokens = db.session.query(
+            Token.app_id, Token.user_id, Token.generation, Token.date_modified
+        ).filter(
+            Token.generation > 0,
+            Token.date_modified >= datetime.fromtimestamp(since)
+        )
+
+        return [
+            (app_id, user_id, generation, time.mktime(date_modified.timetuple()))
+            for app_id, user_id, generation, date_modified in tokens
+        ]
+
+    @staticmethod
+    def verify_auth_token(token):
         try:
-            data = s.loads(token)
+            data = keyring.loads(token)
         except SignatureExpired:
             return None
         except BadSignature:
             return None
 
-        return Token.query.get(data['id'])
+        if 'id' in data:
+            return Token.query.get(data['id'])
 
-    def to_json(self, exclude=None):
-        schema = TokenSchema()
-        result = schema.dump(self)
-        return result
+        return Token.query.filter(
+            Token.app_id == data.get('app_id'), Token.user_id == data.get('user_id')
+        ).first()
+
+    def to_json(self, exclude=None, fields=None):
+        return dump(TokenSchema, self, fields)
 
     @staticmethod
     def from_json(data, partial=False):
@@ -0,0 +1,310 @@
+import decimal
+import threading
+import time
+
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import bindparam
+from sqlalchemy import inspect
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    # numpy is a requirement, plain lists are for development only
+    numpy = None
+
+
+RATE_FORMAT = '{:.8f}'
+AMOUNT_QUANTUM = decimal.Decimal('0.0001')
+
+
+class MissingRate(ValueError):
+    pass
+
+
+def _amount_changed(obj):
+    # new, or of another amount, date or currency than the one its amount in
+    # the base currency was set for
+    state = inspect(obj)
+    if not state.persistent:
+        return True
+    return any(state.attrs[x].history.has_changes() for x in ('amount', 'date', 'currency_id'))
+
+
+def _array(values, dtype):
+    return numpy.array(values, dtype=dtype) if numpy is not None else list(values)
+
+
+def _lookup(days, rates, wanted):
+    # the rate of every one of the wanted days, that of the day before
+    # when there is none that day, or else the first one
+    if numpy is not None:
+        index = numpy.searchsorted(days, wanted, side='right') - 1
+        return rates[numpy.maximum(index, 0)]
+    return [rates[max(bisect_right(days, x) - 1, 0)] for x in wanted]
+
+
+class ExchangeRates(object):
+    """
+    Per-worker copy of the ``currency_rate`` history, to convert amounts of
+    many days at once.
+
+    The rates of every base and currency are held as arrays of days and
+    rates (NumPy arrays when it is installed), the rate of a day being the
+    latest one published by then. The history is loaded on first use and
+    checked at most every ``EXCHANGE_RATES_RELOAD_INTERVAL`` seconds after,
+    to be loaded again when the count or the latest modification of the
+    rates changed since.
+
+    Records and transactions also keep their amount in the
+    ``BASE_CURRENCY``, see :meth:`set_amount_base`, so that reports in it
+    sum a column.
+    """
+
+    def __init__(self, app=None):
+        self.base_currency = 'EUR'
+        self.reload_interval = 60
+        self._rates = None
+        self._marker = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.base_currency = app.config.get('BASE_CURRENCY', self.base_currency)
+        self.reload_interval = app.config.get('EXCHANGE_RATES_RELOAD_INTERVAL',
+                                              self.reload_interval)
+        self.clear()
+
+    def _load(self):
+        from monetario.models import db, CurrencyRate
+
+        with self._lock:
+            if (self._rates is not None and
+                    self._checked_at + self.reload_interval > time.time()):
+                return self._rates
+
+        # a scan of the rates, hence not on every use
+        marker = tuple(db.session.query(
+            db.func.count(CurrencyRate.id),
+            db.func.max(CurrencyRate.date_modified),
+        ).one())
+
+        with self._lock:
+            if self._rates is not None and marker == self._marker:
+                self._checked_at = time.time()
+                return self._rates
+
+        history = defaultdict(lambda: defaultdict(dict))
+        query = db.session.query(
+            CurrencyRate.base_currency,
+            CurrencyRate.currency,
+            CurrencyRate.date_created,
+            CurrencyRate.rate,
+        ).filter(CurrencyRate.rate > 0).order_by(CurrencyRate.date_created, CurrencyRate.id)
+
+        for base, currency, date, rate in query:
+            # the last rate of a day wins
+            history[base][currency][date.toordinal()] = float(rate)
+
+        rates = {}
+        for base, currencies in history.items():
+            rates[base] = {}
+            for currency, days in currencies.items():
+                days = sorted(days.items())
+                rates[base][currency] = (
+                    _array([x[0] for x in days], 'int64'),
+                    _array([x[1] for x in days], 'float64'),
+                )
+
+        with self._lock:
+            self._rates, self._marker, self._checked_at = rates, marker, time.time()
+        return rates
+
+    def _factors(self, rates, source, target, days):
+        for base, currencies in rates.items():
+            if ((source == base or source in currencies) and
+                    (target == base or target in currencies)):
+                break
+        else:
+            return None
+
+        def lookup(currency):
+            if currency == base:
+                return None
+            return _lookup(currencies[currency][0], currencies[currency][1], days)
+
+        # amounts of the base are worth the rate of a currency in it
+        source_rates, target_rates = lookup(source), lookup(target)
+        if numpy is not None:
+            factors = numpy.ones(len(days))
+            if target_rates is not None:
+                factors *= target_rates
+            if source_rates is not None:
+                factors /= source_rates
+            return factors.tolist()
+
+        factors = [1.0] * len(days)
+        if target_rates is not None:
+            factors = [x * y for x, y in zip(factors, target_rates)]
+        if source_rates is not None:
+            factors = [x / y for x, y in zip(factors, source_rates)]
+        return factors
+
+    def factors(self, pairs, target):
+        """
+        The rates converting amounts of the ``(currency, date)`` of ``pairs``
+        to the ``target`` currency, in order, ``None`` for those without
+        one.
+        """
+        pairs = list(pairs)
+        factors = [None] * len(pairs)
+
+        by_currency = defaultdict(list)
+        for index, (currency, date) in enumerate(pairs):
+            by_currency[currency].append(index)
+
+        rates = None
+        for currency, indexes in by_currency.items():
+            if currency == target:
+                results = [1.0] * len(indexes)
+            else:
+                if rates is None:
+                    rates = self._load()
+
+                days = _array([pairs[x][1].toordinal() for x in indexes], 'int64')
+                results = self._factors(rates, currency, target, days)
+                if results is None:
+                    continue
+
+            for index, result in zip(indexes, results):
+                factors[index] = result
+        return factors
+
+    def convert(self, amounts, target):
+        """
+        The ``(currency, date, amount)`` of ``amounts`` as amounts of the
+        ``target`` currency, in order, each at the rate of its date. Raises
+        ``MissingRate``.
+        """
+        amounts = list(amounts)
+        factors = self.factors([(currency, date) for currency, date, _ in amounts], target)
+
+        for (currency, _, _), factor in zip(amounts, factors):
+            if factor is None:
+                raise MissingRate('No rate from {} to {}.'.format(currency, target))
+
+        values = [float(amount or 0) for _, _, amount in amounts]
+        if numpy is not None:
+            return (numpy.array(values) * numpy.array(factors)).tolist()
+        return [x * y for x, y in zip(values, factors)]
+
+    def set_amount_base(self, *objects):
+        """
+        Set the ``amount_base`` of records or transactions to their amount
+        in the ``BASE_CURRENCY`` at the rate of their date, and that rate as
+        their ``base_rate``. Both are ``None`` without a rate. Those of
+        persistent objects are only set again when their amount, date or
+        currency changed.
+        """
+        from monetario.models import db, GroupCurrency
+
+        objects = [x for x in objects if _amount_changed(x)]
+        if not objects:
+            return
+
+        symbols = {}
+        pairs = []
+
+        with db.session.no_autoflush:
+            for obj in objects:
+                if obj.currency_id not in symbols:
+                    symbols[obj.currency_id] = db.session.query(GroupCurrency.symbol).filter(
+                        GroupCurrency.id == obj.currency_id
+                    ).scalar()
+                pairs.append((symbols[obj.currency_id], obj.date or datetime.utcnow()))
+
+            factors = self.factors(pairs, self.base_currency)
+
+        for obj, factor in zip(objects, factors):
+            if factor is None or obj.amount is None:
+                obj.amount_base = obj.base_rate = None
+            else:
+                obj.base_rate = decimal.Decimal(RATE_FORMAT.format(factor))
+                obj.amount_base = (
+                    decimal.Decimal(str(obj.amount)) * obj.base_rate
+                ).quantize(AMOUNT_QUANTUM)
+
+    def backfill(self, model, chunk_size=1000, pause=0, after_id=0):
+        """
+        Set the ``amount_base`` and ``base_rate`` of the rows of ``model``
+        which have none, in chunks of ``chunk_size`` rows in order of ids
+        after ``after_id``, committing every chunk and sleeping ``pause``
+        seconds after it. Yields the last id and the number of rows set of
+        every chunk: a backfill stopped midway resumes after the last id, or
+        from the start as only rows without ``amount_base`` are read.
+        """
+        from monetario.models import db, GroupCurrency
+
+        # with the rates as of now, however recently they were checked
+        self.clear()
+
+        table = model.__table__
+        values = {
+            'amount_base': bindparam('new_amount_base'),
+            'base_rate': bindparam('new_base_rate'),
+        }
+        if 'date_modified' in table.c:
+            # not a change of the row for its ETags
+            values['date_modified'] = table.c.date_modified
+        update = table.update().where(table.c.id == bindparam('row_id')).values(**values)
+
+        while True:
+            rows = db.session.query(
+                model.id, GroupCurrency.symbol, model.date, model.amount
+            ).select_from(
+                model
+            ).outerjoin(
+                GroupCurrency, GroupCurrency.id == model.currency_id
+            ).filter(
+                model.amount_base.is_(None),
+                model.amount.isnot(None),
+                model.id > after_id,
+            ).order_by(model.id).limit(chunk_size).all()
+
+            if not rows:
+                return
+
+            factors = self.factors(
+                [(symbol, date or datetime.utcnow()) for _, symbol, date, _ in rows],
+                self.base_currency
+            )
+            updates = []
+            for (row_id, _, _, amount), factor in zip(rows, factors):
+                if factor is not None:
+                    rate = decimal.Decimal(RATE_FORMAT.format(factor))
+                    updates.append({
+                        'row_id': row_id,
+                        'new_amount_base': (amount * rate).quantize(AMOUNT_QUANTUM),
+                        'new_base_rate': rate,
+                    })
+
+            if updates:
+                db.session.execute(update, updates)
+            db.session.commit()
+
+            after_id = rows[-1][0]
+            yield after_id, len(updates)
+
+            if pause:
+                time.sleep(pause)
+
+    def clear(self):
+        with self._lock:
+            self._rates = None
+            self._marker = None
+            self._checked_at = None
@@ -0,0 +1,377 @@
+"""
+Monthly rollups of records.
+
+``record_month`` holds the income, expense and count of the records of
+every (user, account, currency, month). It is updated on every flush that
+adds, changes or deletes records, in the same transaction, so balances and
+cash flows read a row per month instead of every record. Bulk
+``query.update()``/``query.delete()`` of records bypass the session and
+need a :func:`rebuild` afterwards (``manage.py rebuild_rollups``).
+
+Every row also checkpoints the balance of its account and currency at the
+start of the month, so a balance is the latest checkpoint of each account
+plus the month after it. A change to a past month moves the checkpoints of
+the later months of its account by its amount, in the same flush.
+"""
+import datetime
+import decimal
+
+from collections import defaultdict
+from collections import OrderedDict
+
+from sqlalchemy import and_
+from sqlalchemy import case
+from sqlalchemy import event
+from sqlalchemy import func
+from sqlalchemy import inspect
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm import Session
+
+from monetario.models import db
+from monetario.models import Record
+from monetario.models import RecordMonth
+
+
+FIELDS = ('user_id', 'account_id', 'currency_id', 'date', 'amount', 'record_type')
+
+
+def to_utc(value):
+    """
+    ``value`` as a naive datetime in UTC, as naive dates of records are.
+    """
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def month_of(value):
+    value = to_utc(value)
+    return datetime.date(value.year, value.month, 1)
+
+
+def start_of(day):
+    # the first instant of a day in UTC, compared as such to timezone-aware
+    # dates whatever the timezone of the connection
+    return datetime.datetime(day.year, day.month, day.day, tzinfo=datetime.timezone.utc)
+
+
+def _contribution(values):
+    """
+    The key and the (income, expense, count) of a record of ``values``.
+    """
+    if values['date'] is None:
+        return None, None
+
+    amount = decimal.Decimal(str(values['amount'] or 0))
+    income = amount if values['record_type'] == Record.RECORD_TYPE_INCOME else 0
+    expense = amount if values['record_type'] == Record.RECORD_TYPE_EXPENSE else 0
+
+    key = (
+        values['user_id'], values['account_id'], values['currency_id'], month_of(values['date'])
+    )
+    return key, (income, expense, 1)
+
+
+def _current(record):
+    return {name: getattr(record, name) for name in FIELDS}
+
+
+def _committed(record):
+    # the values as they were before the flush
+    attrs = inspect(record).attrs
+    values = {}
+
+    for name in FIELDS:
+        history = attrs[name].history
+        if history.deleted:
+            values[name] = history.deleted[0]
+        elif history.unchanged:
+            values[name] = history.unchanged[0]
+        else:
+            values[name] = getattr(record, name)
+    return values
+
+
+def _keep_history(target, value, oldvalue, initiator):
+    pass
+
+
+# load the value a change replaces even when it was expired, as after a
+# commit, so that the rollups it counts in can be told
+for name in FIELDS:
+    event.listen(getattr(Record, name), 'set', _keep_history, active_history=True)
+
+
+@event.listens_for(Record.date, 'set', retval=True)
+def _date_in_utc(target, value, oldvalue, initiator):
+    # a database without timezones (SQLite) drops the offset, the month of a
+    # record read back is then that of the flush
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc)
+    return value
+
+
+def _changed(record):
+    attrs = inspect(record).attrs
+    return any(attrs[name].history.has_changes() for name in FIELDS)
+
+
+def record_changes(session):
+    """
+    The records being flushed by ``session`` as pairs of the values of
+    :data:`FIELDS` and 1 for the values they get or -1 for those they lose.
+    """
+    for record in session.new:
+        if isinstance(record, Record):
+            yield _current(record), 1
+
+    for record in session.dirty:
+        if isinstance(record, Record) and _changed(record):
+            yield _committed(record), -1
+            yield _current(record), 1
+
+    for record in session.deleted:
+        if isinstance(record, Record):
+            yield _committed(record), -1
+
+
+def record_deltas(session):
+    """
+    The changes to the rollups of the records being flushed by ``session``.
+    """
+    deltas = defaultdict(lambda: [0, 0, 0])
+
+    for values, sign in record_changes(session):
+        key, contribution = _contribution(values)
+        if key is not None:
+            delta = deltas[key]
+            for x, value in enumerate(contribution):
+                delta[x] += sign * value
+
+    return {key: delta for key, delta in deltas.items() if any(delta)}
+
+
+KEY_COLUMNS = ('user_id', 'account_id', 'currency_id', 'month')
+
+
+def _is(column, value):
+    return column.is_(None) if value is None else column == value
+
+
+def _key_criterion(table, key):
+    # the month may be left out of the key, for every month of an account
+    return and_(*[_is(table.c[name], value) for name, value in zip(KEY_COLUMNS, key)])
+
+
+def _opening_balance(connection, table, key):
+    # from the checkpoint of the month before, if any
+    month = key[-1]
+    row = connection.execute(
+        select([table.c.balance + table.c.income + table.c.expense])
+        .where(_key_criterion(table, key[:-1]))
+        .where(table.c.month < month)
+        .order_by(table.c.month.desc())
+        .limit(1)
+    ).first()
+    return row[0] if row is not None else 0
+
+
+def apply_deltas(connection, deltas):
+    table = RecordMonth.__table__
+
+    for key, (income, expense, count) in deltas.items():
+        update = table.update().where(_key_criterion(table, key)).values(
+            income=table.c.income + income,
+            expense=table.c.expense + expense,
+            count=table.c.count + count,
+        )
+
+        if not connection.execute(update).rowcount:
+            user_id, account_id, currency_id, month = key
+            balance = _opening_balance(connection, table, key)
+            try:
+                with connection.begin_nested():
+                    connection.execute(table.insert().values(
+                        user_id=user_id, account_id=account_id, currency_id=currency_id,
+                        month=month, income=income, expense=expense, count=count,
+                        balance=balance,
+                    ))
+            except IntegrityError:
+                # a concurrent transaction inserted the key first
+                connection.execute(update)
+
+        if income or expense:
+            # the checkpoints of the later months of the account
+            connection.execute(table.update().where(and_(
+                _key_criterion(table, key[:-1]),
+                table.c.month > key[-1],
+            )).values(balance=table.c.balance + income + expense))
+
+
+def deleted_keys(session):
+    """
+    The ids of the users, accounts and currencies deleted by the flush of
+    ``session``, by column of the rollups.
+    """
+    from monetario.models import Account, GroupCurrency, User
+
+    deleted = defaultdict(set)
+    for obj in session.deleted:
+        for model, name in ((User, 'user_id'), (Account, 'account_id'),
+                            (GroupCurrency, 'currency_id')):
+            if isinstance(obj, model):
+                deleted[name].add(obj.id)
+    return deleted
+
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(session, flush_context):
+    deltas = record_deltas(session)
+    deleted = deleted_keys(session)
+
+    if deleted:
+        # the rows of the deleted ones are gone (or go now, without the
+        # cascade of the foreign keys), their records count without them
+        table = RecordMonth.__table__
+        session.connection().execute(table.delete().where(or_(*[
+            table.c[name].in_(ids) for name, ids in deleted.items()
+        ])))
+        deltas = {
+            key: delta for key, delta in deltas.items()
+            if not any(value in deleted.get(name, ()) for name, value in zip(KEY_COLUMNS, key))
+        }
+
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+def rebuild(user_id=None):
+    """
+    Recompute the rollups (of one user) from the records, in the current
+    transaction of the session.
+    """
+    query = db.session.query(*[getattr(Record, name) for name in FIELDS])
+    delete = RecordMonth.__table__.delete()
+
+    if user_id is not None:
+        query = query.filter(Record.user_id == user_id)
+        delete = delete.where(RecordMonth.user_id == user_id)
+
+    deltas = defaultdict(lambda: [0, 0, 0])
+    for row in query.yield_per(1000):
+        key, contribution = _contribution(dict(zip(FIELDS, row)))
+        if key is not None:
+            for x, value in enumerate(contribution):
+                deltas[key][x] += value
+
+    connection = db.session.connection()
+    connection.execute(delete)
+    # in order of months, so that every checkpoint is written once
+    apply_deltas(connection, OrderedDict(sorted(deltas.items(), key=lambda x: x[0][-1])))
+
+    return len(deltas)
+
+
+def _sums(query):
+    income, expense, count = query.one()
+    return income or 0, expense or 0, count or 0
+
+
+def month_sums(user_id, date_from=None, date_to=None):
+    """
+    Income, expense and count of the records of a user from ``date_from``
+    to ``date_to`` (excluded, either may be ``None``) by month, as
+    ``(month, income, expense, count)`` in order. Whole months are read
+    from the rollups, the days of partial months from the records.
+    """
+    first = last = None
+    if date_from is not None:
+        first = date_from if date_from.day == 1 else _next_month(month_of(date_from))
+    if date_to is not None:
+        last = month_of(date_to)
+
+    months = []
+
+    if date_from is not None and date_from < first:
+        end = first if date_to is None else min(first, date_to)
+        months.append((month_of(date_from), _record_sums(user_id, date_from, end)))
+
+    query = db.session.query(
+        RecordMonth.month,
+        func.sum(RecordMonth.income),
+        func.sum(RecordMonth.expense),
+        func.sum(RecordMonth.count),
+    ).filter(
+        RecordMonth.user_id == user_id,
+    ).group_by(RecordMonth.month).order_by(RecordMonth.month)
+
+    if first is not None:
+        query = query.filter(RecordMonth.month >= first)
+    if last is not None:
+        query = query.filter(RecordMonth.month < last)
+
+    if first is None or last is None or first < last:
+        months.extend((month, (income, expense, count)) for month, income, expense, count in query)
+
+    if date_to is not None:
+        start = last if first is None else max(last, first)
+        if start < date_to:
+            months.append((start, _record_sums(user_id, start, date_to)))
+
+    return [
+        (month, income, expense, count)
+        for month, (income, expense, count) in months if count
+    ]
+
+
+def _next_month(month):
+    return (month + datetime.timedelta(days=31)).replace(day=1)
+
+
+def _record_sums(user_id, date_from, date_to):
+    return _sums(db.session.query(
+        func.sum(
+            case([(Record.record_type == Record.RECORD_TYPE_INCOME, Record.amount)], else_=0)
+        ),
+        func.sum(
+            case([(Record.record_type == Record.RECORD_TYPE_EXPENSE, Record.amount)], else_=0)
+        ),
+        func.count(Record.id),
+    ).filter(
+        Record.user_id == user_id,
+        Record.date >= start_of(date_from),
+        Record.date < start_of(date_to),
+    ))
+
+
+def balance_before(user_id, month, account_id=None):
+    """
+    The sum of the records of a user (in one account) before ``month``: the
+    latest checkpoint of every account and currency before it, plus the
+    records of its month.
+    """
+    later = aliased(RecordMonth)
+
+    def same(column, other):
+        return or_(column == other, and_(column.is_(None), other.is_(None)))
+
+    latest = db.session.query(func.max(later.month)).filter(
+        later.user_id == RecordMonth.user_id,
+        same(later.account_id, RecordMonth.account_id),
+        same(later.currency_id, RecordMonth.currency_id),
+        later.month < month,
+    ).correlate(RecordMonth).as_scalar()
+
+    query = db.session.query(
+        func.sum(RecordMonth.balance + RecordMonth.income + RecordMonth.expense)
+    ).filter(
+        RecordMonth.user_id == user_id,
+        RecordMonth.month == latest,
+    )
+
+    if account_id is not None:
+        query = query.filter(RecordMonth.account_id == account_id)
+    return query.scalar() or 0
@@ -0,0 +1,109 @@
+"""
+Full-text search over text columns.
+
+On PostgreSQL a column is searched through a GIN index of its
+``to_tsvector`` in the ``simple`` configuration (lowercased words, no
+stemming, as descriptions are written in any language). On SQLite it is
+mirrored into an FTS5 table ``<table>_search`` kept up to date by triggers.
+Both are created along with the table by :func:`searchable`; existing
+databases get them from a migration.
+"""
+import re
+
+from sqlalchemy import DDL
+from sqlalchemy import event
+from sqlalchemy import false
+from sqlalchemy import func
+from sqlalchemy import literal_column
+from sqlalchemy import select
+from sqlalchemy.sql import column as sql_column
+from sqlalchemy.sql import table as sql_table
+
+
+SEARCH_CONFIG = 'simple'
+
+POSTGRESQL_DDL = (
+    "CREATE INDEX ix_{table}_{column}_search ON \"{table}\" "
+    "USING gin (to_tsvector('" + SEARCH_CONFIG + "', coalesce({column}, '')))",
+)
+
+SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {table}_search "
+    "USING fts5({column}, content='{table}', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON \"{table}\" BEGIN "
+    "INSERT INTO {table}_search(rowid, {column}) VALUES (new.id, new.{column}); END",
+    "CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON \"{table}\" BEGIN "
+    "INSERT INTO {table}_search({table}_search, rowid, {column}) "
+    "VALUES ('delete', old.id, old.{column}); END",
+    "CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {column} "
+    "ON \"{table}\" BEGIN "
+    "INSERT INTO {table}_search({table}_search, rowid, {column}) "
+    "VALUES ('delete', old.id, old.{column}); "
+    "INSERT INTO {table}_search(rowid, {column}) VALUES (new.id, new.{column}); END",
+)
+
+
+def searchable(table, column):
+    """
+    Create the search index of ``column`` of ``table`` with the table.
+    """
+    names = {'table': table.name, 'column': column}
+
+    for statement in POSTGRESQL_DDL:
+        event.listen(
+            table, 'after_create', DDL(statement.format(**names)).execute_if(dialect='postgresql')
+        )
+    for statement in SQLITE_DDL:
+        event.listen(
+            table, 'after_create', DDL(statement.format(**names)).execute_if(dialect='sqlite')
+        )
+    # the triggers go with the table, the FTS5 table has to be dropped
+    event.listen(
+        table, 'after_drop',
+        DDL('DROP TABLE IF EXISTS {table}_search'.format(**names)).execute_if(dialect='sqlite')
+    )
+
+
+def search_words(q):
+    return re.findall(r'\w+', q or '')
+
+
+def match(model, column, q, dialect, key=None):
+    """
+    The criterion and relevance of searching ``q`` in ``column`` of
+    ``model``, for rows of which ``key`` (the primary key of ``model`` by
+    default) is a row of ``model``. Every word of ``q`` has to match; the
+    relevance is higher for better matches and NULL for rows which do not.
+    """
+    words = search_words(q)
+    if key is None:
+        key = model.id
+
+    if not words:
+        return false(), None
+
+    if dialect == 'postgresql':
+        # literals, so that the expression is the one of the index
+        config = literal_column("'{}'".format(SEARCH_CONFIG))
+        vector = func.to_tsvector(config, func.coalesce(column, literal_column("''")))
+        query = func.plainto_tsquery(config, ' '.join(words))
+        matches = vector.op('@@')(query)
+        relevance = func.ts_rank(vector, query)
+
+        if key is model.id:
+            return matches, relevance
+        return (
+            key.in_(select([model.id]).where(matches)),
+            select([relevance]).where(model.id == key).where(matches).as_scalar(),
+        )
+
+    name = '{}_search'.format(model.__tablename__)
+    fts = sql_table(name, sql_column('rowid'), sql_column('rank'))
+    # quoted words are matched as such, whatever FTS5 syntax they contain
+    matches = literal_column(name).op('MATCH')(' '.join('"{}"'.format(x) for x in words))
+
+    return (
+        key.in_(select([fts.c.rowid]).where(matches)),
+        # rank is the bm25 score, lower for better matches
+        select([-fts.c.rank]).where(matches).where(fts.c.rowid == key).as_scalar(),
+    )
@@ -1,6 +1,7 @@
 import pycountry
 
-from marshmallow import Schema, fields, ValidationError
+from marshmallow import Schema, fields, ValidationError, class_registry
+from marshmallow.validate import Range
 
 
 def validate_currency_symbol(val):
@@ -8,19 +9,94 @@ def validate_currency_symbol(val):
         raise ValidationError('Symbol is not valid')
 
 
-class CategoryTypeField(fields.Field):
-    def _serialize(self, value, attr, obj):
-        return {'value': value, 'title': dict(obj.CATEGORY_TYPES).get(value)}
+def _only(declared, requested):
+    # in the order of the declared fields, whatever that of the request
+    names = [x for x in declared if x in requested and x != 'id']
+    if 'id' in declared:
+        names.insert(0, 'id')
+    return tuple(names)
 
 
-class RecordTypeField(fields.Field):
-    def _serialize(self, value, attr, obj):
-        return {'value': value, 'title': dict(obj.RECORD_TYPES).get(value)}
+def sparse_fieldsets(schema_class, fieldsets=None):
+    """
+    ``fieldsets`` (see :func:`sparse_schema`) without the names which are
+    not declared by ``schema_class`` or its nested schemas, in order: the
+    same fields make the same fieldsets.
+    """
+    if not fieldsets:
+        return {}
+
+    declared = schema_class._declared_fields
+    sparse = {}
+
+    if None in fieldsets:
+        sparse[None] = _only(declared, fieldsets[None])
+
+    for name, requested in fieldsets.items():
+        field = declared.get(name)
+
+        if (name is None or not isinstance(field, fields.Nested) or
+                (None in sparse and name not in sparse[None])):
+            continue
+
+        nested = field.nested
+        if nested == 'self':
+            nested = schema_class
+        elif isinstance(nested, str):
+            nested = class_registry.get_class(nested)
+
+        nested_declared = nested._declared_fields
+        if field.only:
+            nested_declared = [x for x in field.only if x in nested_declared]
+
+        sparse[name] = _only(nested_declared, requested)
+
+    return sparse
+
+
+def sparse_schema(schema_class, fieldsets=None):
+    """
+    Instantiate ``schema_class`` limited to the requested fields.
+
+    ``fieldsets`` maps ``None`` to the fields of the object itself and the
+    name of a nested field to the fields of the nested object, unknown names
+    are ignored and ids are always kept. Nested fields can only be narrowed
+    down, not widened beyond their declared ``only``.
+    """
+    fieldsets = sparse_fieldsets(schema_class, fieldsets)
+    if not fieldsets:
+        return schema_class()
+
+    schema = schema_class(only=fieldsets.get(None))
 
+    for name, only in fieldsets.items():
+        if name is not None:
+            schema.fields[name].only = only
+
+    return schema
+
+
+class ChoiceField(fields.Field):
+    """
+    Serializes a value together with its title, looked up in the
+    ``(value, title)`` pairs of the ``choices`` attribute of the object.
+    """
+    choices = None
 
-class PaymentMethodField(fields.Field):
     def _serialize(self, value, attr, obj):
-        return {'value': value, 'title': dict(obj.PAYMENT_METHODS).get(value)}
+        return {'value': value, 'title': dict(getattr(obj, self.choices)).get(value)}
+
+
+class CategoryTypeField(ChoiceField):
+    choices = 'CATEGORY_TYPES'
+
+
+class RecordTypeField(ChoiceField):
+    choices = 'RECORD_TYPES'
+
+
+class PaymentMethodField(ChoiceField):
+    choices = 'PAYMENT_METHODS'
 
 
 class GroupSchema(Schema):
@@ -147,6 +223,9 @@ class AppSchema(Schema):
     id = fields.Int(dump_only=True)
     name = fields.Str(required=True)
     secret = fields.Str(required=True, dump_only=True)
+    # up to 10000 logins in periods of a second to a day
+    login_limit = fields.Int(allow_none=True, validate=Range(min=1, max=10000))
+    login_limit_period = fields.Int(allow_none=True, validate=Range(min=1, max=86400))
 
     user = fields.Nested(UserSchema, dump_only=True)
     user_id = fields.Int(required=True, load_only=True, load_from='user')
@@ -173,6 +252,10 @@ class DateRangeFilterSchema(Schema):
     date_to = fields.Date()
 
 
+class ReportCurrencySchema(Schema):
+    currency = fields.Int()
+
+
 class CashFlowSchema(Schema):
     cash_flow = fields.Float(required=True)
     expense = fields.Float()
@@ -180,11 +263,28 @@ class CashFlowSchema(Schema):
     date = fields.Date()
 
 
+class BalanceSeriesSchema(Schema):
+    balance = fields.Float(required=True)
+    date = fields.Date()
+
+
 class ExpenseSchema(Schema):
     amount = fields.Float(required=True)
     category_id = fields.Int()
+    name = fields.Str()
+    colour = fields.Str()
+    logo = fields.Str()
+    parent_id = fields.Int()
+    # with the records of the descendants of the category
+    subtotal = fields.Float()
 
 
 class IncomeSchema(Schema):
     amount = fields.Float(required=True)
     category_id = fields.Int()
+    name = fields.Str()
+    colour = fields.Str()
+    logo = fields.Str()
+    parent_id = fields.Int()
+    # with the records of the descendants of the category
+    subtotal = fields.Float()
@@ -0,0 +1,139 @@
+import os
+import shutil
+import tempfile
+
+from flask import url_for
+
+from monetario.advisor import IndexAdvisor
+from monetario.advisor import is_supported
+from monetario.advisor import migration_stub
+from monetario.advisor import query_shape
+from monetario.advisor import suggested_index
+from monetario.app import db
+from monetario.extensions import index_advisor
+from monetario.models import QueryShape
+from monetario.models import Record
+from monetario.views.api.v1.tests.fixtures import UserFactory
+from monetario.tests import BaseTestCase
+
+
+class IndexAdvisorTestCase(BaseTestCase):
+    def test_query_shape(self):
+        query = Record.query.filter(Record.user_id == 1, Record.account_id.isnot(None))
+
+        self.assertEqual(
+            query_shape(
+                Record, query, 'category_id,in,1,2;date,ge,2015-01-01;amount,gt,0;tags,eq,1',
+                'date,desc;id'
+            ),
+            ('record', ('user_id', 'category_id'), ('date', 'amount'), ('date', 'id'))
+        )
+        self.assertEqual(query_shape(Record, Record.query, None, None), ('record', (), (), ()))
+
+    def test_suggested_index(self):
+        self.assertEqual(
+            suggested_index(('user_id', 'category_id'), ('amount', ), ('date', )),
+            ['user_id', 'category_id', 'date']
+        )
+        self.assertEqual(
+            suggested_index(('user_id', ), ('amount', 'date'), ()), ['user_id', 'amount']
+        )
+        self.assertIsNone(suggested_index((), (), ()))
+
+    def test_is_supported(self):
+        indexes = [['user_id', 'category_id', 'date'], ['id']]
+
+        self.assertTrue(
+            is_supported(['category_id', 'user_id', 'date'], ('category_id', 'user_id'), indexes)
+        )
+        self.assertTrue(is_supported(['user_id'], ('user_id', ), indexes))
+        self.assertFalse(is_supported(['user_id', 'date'], ('user_id', ), indexes))
+        self.assertFalse(is_supported(['category_id'], ('category_id', ), indexes))
+
+    def test_bounded(self):
+        advisor = IndexAdvisor()
+        advisor.maxsize = 2
+
+        for sort in ('date', 'amount', 'date', 'id'):
+            advisor.record(Record, Record.query, None, sort, 0.01)
+
+        self.assertEqual(list(advisor._shapes), [
+            ('record', (), (), ('date', )), ('record', (), (), ('id', ))
+        ])
+        self.assertEqual(advisor._shapes[('record', (), (), ('date', ))][0], 2)
+
+    def test_missing_indexes(self):
+        user = UserFactory.create()
+        db.session.add(user)
+        db.session.commit()
+
+        token = self.get_token(self.create_api_app(user), user)
+
+        index_advisor.clear()
+        for filter, sort in (
+            ('amount,gt,10', 'amount'),
+            ('amount,gt,10', 'amount'),
+            ('date,ge,2015-01-01', 'date,desc'),
+            ('category_id,eq,1', None),
+        ):
+            response = self.client.get(
+                url_for('api.v1.get_records', filter=filter, sort=sort),
+                headers={'Authentication-Token': token}
+            )
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(index_advisor.stats()['size'], 3)
+        index_advisor.flush()
+        index_advisor.flush()
+
+        shapes = QueryShape.query.order_by(QueryShape.id).all()
+        self.assertEqual([(x.equality, x.ranges, x.sort, x.count) for x in shapes], [
+            ('user_id', 'amount', 'amount', 2),
+            ('user_id', 'date', 'date', 1),
+            ('user_id,category_id', '', '', 1),
+        ])
+
+        # (user_id, date) and (user_id, category_id, date) serve the others
+        missing = index_advisor.missing_indexes()
+        self.assertEqual(
+            [(x.table_name, columns) for x, columns in missing],
+            [('record', ['user_id', 'amount'])]
+        )
+
+    def test_failed_flush(self):
+        user = UserFactory.create()
+        db.session.add(user)
+        db.session.commit()
+
+        token = self.get_token(self.create_api_app(user), user)
+        QueryShape.__table__.drop(db.engine)
+
+        index_advisor.clear()
+        index_advisor._next_flush = 0
+        response = self.client.get(
+            url_for('api.v1.get_records'), headers={'Authentication-Token': token}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(index_advisor.stats()['size'], 0)
+
+    def test_migration_stub(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        migrations = os.path.join(os.path.dirname(__file__), '..', '..', 'migrations')
+        shutil.copy(os.path.join(migrations, 'script.py.mako'), directory)
+        os.mkdir(os.path.join(directory, 'versions'))
+
+        path = migration_stub(directory, [('record', ['user_id', 'amount'])])
+
+        with open(path) as f:
+            source = f.read()
+
+        self.assertIn(
+            "op.create_index('ix_record_user_id_amount', 'record', ['user_id', 'amount'], "
+            "unique=False)", source
+        )
+        self.assertIn(
+            "op.drop_index('ix_record_user_id_amount', table_name='record')", source
+        )
+        compile(source, path, 'exec')
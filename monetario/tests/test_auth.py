@@ -0,0 +1,70 @@
+import time
+
+from monetario.auth import AuthCache
+from monetario.auth import token_digest
+from monetario.tests import BaseTestCase
+
+
+class AuthCacheTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = AuthCache()
+
+    def test_token_digest_is_fixed_size(self):
+        self.assertEqual(len(token_digest('a')), 32)
+        self.assertEqual(len(token_digest('a' * 255)), 32)
+        self.assertEqual(token_digest('a'), token_digest(b'a'))
+
+    def test_hit_and_miss_counters(self):
+        self.assertIsNone(self.cache.get('token'))
+
+        self.cache.set('token', (1, 2, True), time.time() + 60)
+
+        self.assertEqual(self.cache.get('token'), (1, 2, True))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_expired_entry_is_dropped(self):
+        self.cache.set('token', (1, 2, True), time.time() - 1)
+
+        self.assertIsNone(self.cache.get('token'))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_ttl_bounds_token_expiry(self):
+        self.cache.ttl = -1
+        self.cache.set('token', (1, 2, True), time.time() + 60)
+
+        self.assertIsNone(self.cache.get('token'))
+
+    def test_entries_outlive_revocations_on_other_workers_briefly(self):
+        self.cache.init_app(self.app)
+        self.cache.set('token', (1, 2, True), time.time() + self.app.config['TOKEN_EXPIRES_IN'])
+
+        (_, expires_at), = self.cache._entries.values()
+        self.assertLessEqual(expires_at, time.time() + 5)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.maxsize = 2
+        expires_at = time.time() + 60
+
+        self.cache.set('token1', (1, 1, True), expires_at)
+        self.cache.set('token2', (2, 1, True), expires_at)
+        self.cache.get('token1')
+        self.cache.set('token3', (3, 1, True), expires_at)
+
+        self.assertIsNotNone(self.cache.get('token1'))
+        self.assertIsNone(self.cache.get('token2'))
+        self.assertIsNotNone(self.cache.get('token3'))
+
+    def test_invalidate(self):
+        expires_at = time.time() + 60
+        self.cache.set('token1', (1, 1, True), expires_at)
+        self.cache.set('token2', (1, 1, True), expires_at)
+        self.cache.set('token3', (2, 1, True), expires_at)
+
+        self.cache.invalidate('token1')
+        self.assertIsNone(self.cache.get('token1'))
+
+        self.cache.invalidate_user(1)
+        self.assertIsNone(self.cache.get('token2'))
+        self.assertIsNotNone(self.cache.get('token3'))
@@ -0,0 +1,137 @@
+import datetime
+import decimal
+import random
+import unittest
+
+from monetario.app import db
+from monetario.balances import FenwickTree
+from monetario.extensions import balance_index
+from monetario.models import Account
+from monetario.models import Record
+from monetario.views.api.v1.tests.fixtures import AccountFactory
+from monetario.views.api.v1.tests.fixtures import GroupCurrencyFactory
+from monetario.views.api.v1.tests.fixtures import UserFactory
+from monetario.tests import BaseTestCase
+
+
+class FenwickTreeTestCase(unittest.TestCase):
+    def test_sums(self):
+        random.seed(0)
+        values = [random.randint(-100, 100) for x in range(37)]
+        tree = FenwickTree.from_values(values)
+
+        for x in range(len(values)):
+            self.assertEqual(tree.prefix_sum(x), sum(values[:x + 1]))
+        self.assertEqual(tree.range_sum(5, 20), sum(values[5:21]))
+        self.assertEqual(tree.range_sum(0, 0), values[0])
+        self.assertEqual(tree.range_sum(7, 6), 0)
+
+    def test_add(self):
+        tree = FenwickTree(10)
+        values = [0] * 10
+
+        for index, value in ((3, 5), (0, -2), (9, 7), (3, 1)):
+            tree.add(index, value)
+            values[index] += value
+
+        self.assertEqual([tree.prefix_sum(x) for x in range(10)], [
+            sum(values[:x + 1]) for x in range(10)
+        ])
+        self.assertEqual(tree._tree, FenwickTree.from_values(values)._tree)
+
+
+class BalanceIndexTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.currency = GroupCurrencyFactory.create()
+        self.user = UserFactory.create()
+        self.account = AccountFactory.create(user=self.user, currency=self.currency)
+        db.session.add_all([self.currency, self.user, self.account])
+        db.session.commit()
+
+        self.add_record(datetime.datetime(2015, 1, 10), '-10')
+        self.add_record(datetime.datetime(2015, 3, 5, 23), '100')
+
+    def tearDown(self):
+        balance_index.maxsize = self.app.config['BALANCE_INDEX_SIZE']
+        super().tearDown()
+
+    def add_record(self, date, amount):
+        record = Record(
+            user=self.user, account=self.account, currency=self.currency, date=date,
+            amount=decimal.Decimal(amount), record_type=Record.RECORD_TYPE_EXPENSE
+        )
+        db.session.add(record)
+        db.session.commit()
+        return record
+
+    def balances(self, *days):
+        return [float(x) for x in balance_index.balances(self.account, [
+            datetime.date(2015, month, day) for month, day in days
+        ])]
+
+    def test_balances(self):
+        days = ((1, 1), (1, 10), (2, 1), (3, 5), (12, 31))
+
+        self.assertEqual(self.balances(*days), [0.0, -10.0, -10.0, 90.0, 90.0])
+        self.assertEqual(balance_index.stats()['misses'], 1)
+
+        # without the index
+        balance_index.maxsize = 0
+        self.assertEqual(self.balances(*days), [0.0, -10.0, -10.0, 90.0, 90.0])
+
+    def test_writes(self):
+        self.balances((1, 1))
+
+        # point updates on commit, the account is not loaded again
+        record = self.add_record(datetime.datetime(2015, 2, 1), '-5')
+        record.date = datetime.datetime(2015, 1, 20)
+        db.session.commit()
+
+        self.assertEqual(self.balances((1, 19), (1, 20), (3, 5)), [-10.0, -15.0, 85.0])
+        self.assertEqual(balance_index.stats(), {
+            'hits': 1, 'misses': 1, 'size': 1, 'maxsize': 1000,
+        })
+
+        # rolled back
+        db.session.add(Record(
+            user=self.user, account=self.account, currency=self.currency,
+            date=datetime.datetime(2015, 1, 1), amount=decimal.Decimal('-1000'),
+            record_type=Record.RECORD_TYPE_EXPENSE
+        ))
+        db.session.flush()
+        db.session.rollback()
+
+        self.assertEqual(self.balances((3, 5)), [85.0])
+
+    def test_other_worker(self):
+        self.balances((1, 1))
+
+        # a record committed by another worker bumps the version alone
+        table = Account.__table__
+        db.session.execute(Record.__table__.insert().values(
+            user_id=self.user.id, account_id=self.account.id, currency_id=self.currency.id,
+            date=datetime.datetime(2015, 2, 1), amount=decimal.Decimal('-7'),
+            record_type=Record.RECORD_TYPE_EXPENSE
+        ))
+        db.session.execute(table.update().where(table.c.id == self.account.id).values(
+            balance_version=table.c.balance_version + 1
+        ))
+        db.session.commit()
+
+        self.assertEqual(self.balances((2, 1)), [-17.0])
+        self.assertEqual(balance_index.stats()['misses'], 2)
+
+    def test_eviction(self):
+        other = AccountFactory.create(user=self.user, currency=self.currency)
+        db.session.add(other)
+        db.session.commit()
+
+        balance_index.maxsize = 1
+        self.balances((1, 1))
+        balance_index.balances(other, [datetime.date(2015, 1, 1)])
+        self.balances((1, 1))
+
+        self.assertEqual(balance_index.stats()['size'], 1)
+        self.assertEqual(balance_index.stats()['misses'], 3)
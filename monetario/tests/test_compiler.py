@@ -0,0 +1,209 @@
+import datetime
+import decimal
+
+from types import SimpleNamespace
+from unittest import mock
+
+from pytz import UTC
+
+from marshmallow.schema import BaseSchema
+
+from monetario.app import db
+
+from monetario.compiler import compile_schema
+from monetario.compiler import dumper
+from monetario.models import Category
+from monetario.models import GroupCategory
+from monetario.models import Record
+from monetario.models import Token
+from monetario import serializers
+from monetario.serializers import sparse_schema
+from monetario.views.api.v1.tests.fixtures import AccountFactory
+from monetario.views.api.v1.tests.fixtures import AppFactory
+from monetario.views.api.v1.tests.fixtures import GroupCategoryFactory
+from monetario.views.api.v1.tests.fixtures import GroupCurrencyFactory
+from monetario.views.api.v1.tests.fixtures import GroupFactory
+from monetario.views.api.v1.tests.fixtures import RecordFactory
+from monetario.views.api.v1.tests.fixtures import TransactionFactory
+from monetario.views.api.v1.tests.fixtures import UserFactory
+from monetario.tests import BaseTestCase
+
+
+class CompilerParityTestCase(BaseTestCase):
+    """
+    Every compiled schema must dump exactly what marshmallow dumps.
+    """
+
+    def setUp(self):
+        super().setUp()
+
+        self.group = GroupFactory.create()
+        self.user = UserFactory.create(group=self.group)
+        self.currency = GroupCurrencyFactory.create(group=self.group)
+        self.account = AccountFactory.create(user=self.user, currency=self.currency)
+        self.target_account = AccountFactory.create(user=self.user, currency=self.currency)
+
+        self.parent_category = GroupCategoryFactory.create(
+            group=self.group, colour='red', logo='logo.png',
+            category_type=GroupCategory.CATEGORY_TYPE_EXPENSE
+        )
+        self.category = GroupCategoryFactory.create(
+            group=self.group, parent=self.parent_category, colour='blue', logo='logo.png',
+            category_type=GroupCategory.CATEGORY_TYPE_EXPENSE
+        )
+        self.global_category = Category(name='Food', colour='green', logo='food.png',
+                                        category_type=Category.CATEGORY_TYPE_INCOME)
+
+        db.session.add_all([
+            self.group, self.user, self.currency, self.account, self.target_account,
+            self.parent_category, self.category, self.global_category
+        ])
+        db.session.commit()
+
+        self.transaction = TransactionFactory(
+            source_account=self.account,
+            target_account=self.target_account,
+            user=self.user,
+            currency=self.currency,
+            description='Transfer',
+            date=datetime.datetime(2015, 1, 2, 3, 4, 5, tzinfo=UTC)
+        )
+        self.record = RecordFactory.create(
+            account=self.account, currency=self.currency, category=self.category,
+            user=self.user, transaction=self.transaction, description='Coffee'
+        )
+        self.api_app = AppFactory.create(user=self.user)
+        self.token = Token(app=self.api_app, user=self.user)
+
+        db.session.add_all([self.transaction, self.record, self.api_app, self.token])
+        db.session.commit()
+
+    def assertParity(self, schema_class, obj, fieldsets=None):
+        expected = sparse_schema(schema_class, fieldsets).dump(obj).data
+        self.assertEqual(dumper(schema_class, fieldsets)(obj), expected)
+        return expected
+
+    def test_models(self):
+        for schema_class, obj in (
+            (serializers.GroupSchema, self.group),
+            (serializers.UserSchema, self.user),
+            (serializers.CategorySchema, self.global_category),
+            (serializers.GroupCategorySchema, self.category),
+            (serializers.GroupCurrencySchema, self.currency),
+            (serializers.AccountSchema, self.account),
+            (serializers.TransactionSchema, self.transaction),
+            (serializers.RecordSchema, self.record),
+            (serializers.AppSchema, self.api_app),
+            (serializers.TokenSchema, self.token),
+        ):
+            self.assertParity(schema_class, obj)
+
+    def test_nested_and_custom_fields(self):
+        data = self.assertParity(serializers.RecordSchema, self.record)
+
+        self.assertEqual(data['record_type']['title'], dict(Record.RECORD_TYPES)[self.record.record_type])
+        self.assertEqual(data['payment_method']['value'], self.record.payment_method)
+        self.assertEqual(data['account'], {'id': self.account.id, 'name': self.account.name})
+        self.assertEqual(
+            set(data['transaction']),
+            {'id', 'source_account', 'target_account', 'amount', 'currency'}
+        )
+
+        data = self.assertParity(serializers.GroupCategorySchema, self.category)
+
+        self.assertEqual(data['parent']['id'], self.parent_category.id)
+        self.assertNotIn('parent', data['parent'])
+
+    def test_sparse_fieldsets(self):
+        for fieldsets in (
+            {None: ('amount', 'account')},
+            {'account': ('name', )},
+            {None: ('amount', 'category'), 'category': ('colour', 'unknown')},
+            {None: ('unknown', )},
+            {'transaction': ('source_account', )},
+        ):
+            self.assertParity(serializers.RecordSchema, self.record, fieldsets)
+
+    def test_unknown_fields_share_a_dumper(self):
+        expected = dumper(serializers.RecordSchema, {None: ('amount', )})
+
+        for fieldsets in (
+            {None: ('amount', 'unknown1')},
+            {None: ('unknown2', 'amount', 'amount')},
+            {None: ('amount', ), 'unknown3': ('name', ), 'account': ('name', )},
+        ):
+            self.assertIs(dumper(serializers.RecordSchema, fieldsets), expected)
+
+    def test_missing_and_none_values(self):
+        for obj in (
+            SimpleNamespace(),
+            SimpleNamespace(id=None, amount=None, description=None, date=None, record_type=None,
+                            payment_method=None, RECORD_TYPES=Record.RECORD_TYPES,
+                            PAYMENT_METHODS=Record.PAYMENT_METHODS, account=None, user=None),
+        ):
+            self.assertParity(serializers.TransactionSchema, obj)
+            self.assertParity(serializers.UserSchema, obj)
+
+        obj = SimpleNamespace(record_type=7, RECORD_TYPES=Record.RECORD_TYPES, PAYMENT_METHODS=[])
+        self.assertParity(serializers.RecordSchema, obj)
+
+    def test_value_conversions(self):
+        for value in (
+            decimal.Decimal('12.3400'), '12.5', 3, 'abc', b'bytes', 'text', True, 0,
+            datetime.datetime(2015, 6, 7, 8, 9, 10), datetime.datetime(2015, 6, 7, 8, 9, 10, 11, tzinfo=UTC),
+            datetime.date(2015, 6, 7), lambda: 5,
+        ):
+            obj = SimpleNamespace(
+                id=value, amount=value, name=value, active=value, date=value,
+                date_created=value, email=value, description=value
+            )
+            self.assertParity(serializers.UserSchema, obj)
+            self.assertParity(serializers.TransactionSchema, obj)
+            self.assertParity(serializers.BalanceSchema, obj)
+
+    def test_invalid_email(self):
+        data = self.assertParity(serializers.UserSchema, SimpleNamespace(id=1, email='not an email'))
+
+        self.assertNotIn('email', data)
+
+    def test_mappings(self):
+        self.assertParity(serializers.BalanceSchema, {
+            'cash_flow': decimal.Decimal('10.5'),
+            'income': 3,
+            'date': datetime.date(2015, 1, 1),
+        })
+        self.assertParity(serializers.RecordSchema, {'id': 1, 'account': {'id': 2, 'name': 'a'}})
+
+    def test_compile_schema_instance(self):
+        schema = serializers.RecordSchema(only=('id', 'amount'))
+
+        self.assertEqual(compile_schema(schema)(self.record), schema.dump(self.record).data)
+
+    def test_to_json(self):
+        self.assertEqual(
+            self.record.to_json().data, serializers.RecordSchema().dump(self.record).data
+        )
+        self.assertEqual(
+            self.record.to_json(fields={None: ('amount', )}).data,
+            {'id': self.record.id, 'amount': float(self.record.amount)}
+        )
+
+    def test_instance_choices(self):
+        types = [(0, 'In'), (1, 'Out')]
+
+        for obj in (
+            SimpleNamespace(record_type=1, RECORD_TYPES=Record.RECORD_TYPES),
+            SimpleNamespace(record_type=1, RECORD_TYPES=types),
+        ):
+            data = self.assertParity(serializers.RecordSchema, obj, {None: ('record_type', )})
+
+        self.assertEqual(data['record_type'], {'value': 1, 'title': 'Out'})
+
+    def test_models_are_compiled(self):
+        serializers.RecordSchema().dump(self.record)
+        dump = compile_schema(serializers.RecordSchema())
+
+        with mock.patch.object(BaseSchema, 'dump', side_effect=AssertionError):
+            data = dump(self.record)
+
+        self.assertEqual(data, serializers.RecordSchema().dump(self.record).data)
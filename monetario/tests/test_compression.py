@@ -0,0 +1,102 @@
+import gzip
+import json
+import zlib
+
+from flask import Response
+
+from monetario import compression
+from monetario.compression import Compress
+from monetario.tests import BaseTestCase
+
+
+class CompressTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.objects = [{'id': x, 'name': 'Object {}'.format(x)} for x in range(200)]
+
+        @self.app.route('/compress/<int:count>/')
+        def compressible(count):
+            return Response(json.dumps(self.objects[:count]), mimetype='application/json')
+
+        @self.app.route('/compress/stream/')
+        def stream():
+            def generate():
+                for x in self.objects:
+                    yield json.dumps(x) + '\n'
+            return Response(generate(), mimetype='application/x-ndjson')
+
+        @self.app.route('/compress/text/')
+        def text():
+            return Response('x' * 10000, mimetype='text/plain')
+
+    def get(self, url, encoding):
+        return self.client.get(url, headers={'Accept-Encoding': encoding})
+
+    def test_gzip(self):
+        response = self.get('/compress/200/', 'gzip, deflate')
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.data).decode('utf-8')), self.objects)
+        self.assertEqual(int(response.headers['Content-Length']), len(response.data))
+
+    def test_deflate(self):
+        response = self.get('/compress/200/', 'deflate')
+
+        self.assertEqual(response.headers['Content-Encoding'], 'deflate')
+        self.assertEqual(json.loads(zlib.decompress(response.data).decode('utf-8')), self.objects)
+
+    def test_negotiation(self):
+        for accept_encoding, expected in (
+            ('', None),
+            ('identity', None),
+            ('gzip;q=0, deflate', 'deflate'),
+            ('gzip;q=0', None),
+            ('deflate;q=0.5, gzip', 'gzip'),
+            ('*', 'br' if compression.brotli is not None else 'gzip'),
+        ):
+            response = self.get('/compress/200/', accept_encoding)
+
+            self.assertEqual(response.headers.get('Content-Encoding'), expected, accept_encoding)
+
+    def test_threshold(self):
+        response = self.get('/compress/2/', 'gzip')
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(json.loads(response.data.decode('utf-8')), self.objects[:2])
+
+    def test_mimetypes(self):
+        response = self.get('/compress/text/', 'gzip')
+
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_stream(self):
+        response = self.client.get(
+            '/compress/stream/', headers={'Accept-Encoding': 'gzip'}, buffered=False
+        )
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        lines = []
+
+        for chunk in response.response:
+            # every chunk can be decompressed as soon as it is received
+            lines.extend(decompressor.decompress(chunk).decode('utf-8').splitlines())
+
+        self.assertEqual([json.loads(x) for x in lines], self.objects)
+
+    def test_level(self):
+        self.app.config['COMPRESS_LEVEL'] = 1
+        fast = Compress(self.app).compressor('gzip')
+        self.app.config['COMPRESS_LEVEL'] = 9
+        small = Compress(self.app).compressor('gzip')
+
+        data = json.dumps(self.objects * 10).encode('utf-8')
+
+        self.assertLess(
+            len(small.compress(data) + small.finish()), len(fast.compress(data) + fast.finish())
+        )
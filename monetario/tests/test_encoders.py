@@ -0,0 +1,82 @@
+import datetime
+import decimal
+import json
+import unittest
+import uuid
+
+from pytz import UTC
+
+from monetario import encoders
+from monetario.encoders import Encoder
+from monetario.serializers import BalanceSchema
+from monetario.tests import BaseTestCase
+
+
+class EncoderTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.data = {
+            'amount': decimal.Decimal('12.3400'),
+            'date': datetime.date(2015, 1, 2),
+            'naive': datetime.datetime(2015, 1, 2, 3, 4, 5),
+            'aware': datetime.datetime(2015, 1, 2, 3, 4, 5, 6, tzinfo=UTC),
+            'uuid': uuid.UUID(int=1),
+            'objects': [{'id': 1, 'title': 'Caf\xe9'}, None, True, 1.5],
+        }
+        self.expected = {
+            'amount': 12.34,
+            'date': '2015-01-02',
+            'naive': '2015-01-02T03:04:05',
+            'aware': '2015-01-02T03:04:05.000006+00:00',
+            'uuid': '00000000-0000-0000-0000-000000000001',
+            'objects': [{'id': 1, 'title': 'Caf\xe9'}, None, True, 1.5],
+        }
+
+    def encoder(self, name):
+        self.app.config['JSON_ENCODER'] = name
+        return Encoder(self.app)
+
+    def test_backends(self):
+        for name, module, factory in encoders.BACKENDS:
+            if module() is None:
+                continue
+
+            encoded = self.encoder(name).dumps(self.data)
+
+            self.assertEqual(json.loads(encoded), self.expected)
+            self.assertNotIn(' ', encoded.replace('Caf', ''))
+            self.assertNotIn('\n', encoded)
+
+    def test_sorted_keys(self):
+        encoded = self.encoder('auto').dumps({'b': 1, 'a': {'d': 2, 'c': 3}})
+
+        self.assertEqual(encoded, '{"a":{"c":3,"d":2},"b":1}')
+
+    def test_marshal_result(self):
+        result = BalanceSchema().dump({
+            'cash_flow': decimal.Decimal('1.5'), 'date': datetime.date(2015, 1, 1)
+        })
+
+        self.assertEqual(
+            json.loads(self.encoder('auto').dumps(result)),
+            {'cash_flow': 1.5, 'date': '2015-01-01'}
+        )
+
+    def test_unknown_values(self):
+        with self.assertRaises(TypeError):
+            self.encoder('json').dumps({'value': object()})
+
+    def test_unknown_encoder(self):
+        with self.assertRaises(RuntimeError):
+            self.encoder('yaml')
+
+    @unittest.skipIf(encoders.orjson is not None, 'orjson is installed')
+    def test_missing_encoder(self):
+        with self.assertRaises(RuntimeError):
+            self.encoder('orjson')
+
+    def test_auto(self):
+        names = [name for name, module, factory in encoders.BACKENDS]
+
+        self.assertIn(self.encoder('auto').name, names)
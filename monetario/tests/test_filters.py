@@ -0,0 +1,42 @@
+from datetime import datetime
+from decimal import Decimal
+
+from monetario.models import Record
+from monetario.models import User
+from monetario.views.api.filters import compile_filter
+from monetario.views.api.filters import FilterError
+from monetario.views.api.filters import indexed_columns
+from monetario.tests import BaseTestCase
+
+
+class FiltersTestCase(BaseTestCase):
+    def test_indexed_columns(self):
+        columns = indexed_columns(User)
+
+        self.assertIn('email', columns)
+        self.assertIn('id', columns)
+        self.assertNotIn('password', columns)
+        self.assertNotIn('password_hash', columns)
+
+        columns = indexed_columns(Record)
+
+        self.assertIn('date', columns)
+        self.assertIn('user_id', columns)
+        self.assertNotIn('amount', columns)
+        # only the second column of (user_id, date_modified)
+        self.assertNotIn('date_modified', columns)
+
+    def test_compiled_filters_are_cached(self):
+        allowed = ('amount', 'date')
+
+        criterion = compile_filter(Record, allowed, 'amount,gt,10;date,ge,2015-01-01')
+
+        self.assertIs(compile_filter(Record, allowed, 'amount,gt,10;date,ge,2015-01-01'), criterion)
+        self.assertEqual(
+            list(criterion.compile().params.values()),
+            [Decimal('10'), datetime(2015, 1, 1)]
+        )
+
+    def test_not_allowed(self):
+        with self.assertRaises(FilterError):
+            compile_filter(Record, ('date', ), 'amount,gt,10')
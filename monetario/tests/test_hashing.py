@@ -0,0 +1,71 @@
+import threading
+
+from monetario.hashing import HashingBusy
+from monetario.hashing import PasswordHasher
+from monetario.tests import BaseTestCase
+
+
+class PasswordHasherTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.app.config['PASSWORD_HASH_WORKERS'] = 1
+        self.app.config['PASSWORD_HASH_QUEUE_SIZE'] = 0
+        self.app.config['WORKER_CONCURRENCY'] = 4
+        self.hasher = PasswordHasher(self.app)
+
+    def test_check(self):
+        pwhash = self.hasher.generate('cat')
+
+        self.assertTrue(self.hasher.check(pwhash, 'cat'))
+        self.assertFalse(self.hasher.check(pwhash, 'dog'))
+
+    def test_configured_method_is_used(self):
+        self.assertTrue(self.hasher.hash('cat').startswith('pbkdf2:sha1:1000$'))
+
+    def test_needs_rehash(self):
+        self.assertFalse(self.hasher.needs_rehash(self.hasher.generate('cat')))
+
+        self.hasher.method = 'pbkdf2:sha256:2000'
+
+        self.assertTrue(self.hasher.needs_rehash('pbkdf2:sha1:1000$salt$hash'))
+
+    def test_needs_rehash_of_salt_length(self):
+        pwhash = self.hasher.generate('cat')
+
+        self.hasher.salt_length = 32
+
+        self.assertTrue(self.hasher.needs_rehash(pwhash))
+        self.assertFalse(self.hasher.needs_rehash(self.hasher.generate('cat')))
+
+    def test_slots_of_worker_concurrency(self):
+        self.app.config['PASSWORD_HASH_WORKERS'] = 2
+        self.app.config['PASSWORD_HASH_QUEUE_SIZE'] = 8
+
+        for concurrency, slots in ((1, 1), (4, 3), (100, 10)):
+            self.app.config['WORKER_CONCURRENCY'] = concurrency
+            self.hasher.init_app(self.app)
+
+            self.assertEqual(self.hasher.slots, slots)
+
+    def test_saturated_pool_fails_fast(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def wait():
+            started.set()
+            release.wait()
+
+        thread = threading.Thread(target=self.hasher.submit, args=(wait, ))
+        thread.start()
+        started.wait()
+
+        with self.assertRaises(HashingBusy):
+            self.hasher.check(self.hasher.generate('cat'), 'cat')
+
+        self.assertEqual(self.hasher.rejected, 1)
+
+        release.set()
+        thread.join()
+
+        self.assertTrue(self.hasher.check(self.hasher.generate('cat'), 'cat'))
@@ -0,0 +1,182 @@
+import datetime
+import decimal
+
+from monetario.app import db
+from monetario.extensions import exchange_rates
+from monetario.models import CurrencyRate
+from monetario.models import Record
+from monetario.rates import MissingRate
+from monetario.views.api.v1.tests.fixtures import AccountFactory
+from monetario.views.api.v1.tests.fixtures import GroupCurrencyFactory
+from monetario.views.api.v1.tests.fixtures import UserFactory
+from monetario.views.api.v1.transaction import make_transaction
+from monetario.tests import BaseTestCase
+
+
+class ExchangeRatesTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        for currency, day, rate in (
+            ('USD', datetime.date(2015, 1, 1), '2'),
+            ('USD', datetime.date(2015, 2, 1), '4'),
+            ('GBP', datetime.date(2015, 1, 1), '0.5'),
+        ):
+            self.add_rate('EUR', currency, day, rate)
+        db.session.commit()
+
+    def add_rate(self, base, currency, day, rate):
+        rate = CurrencyRate(
+            base_currency=base, currency=currency, rate=decimal.Decimal(rate),
+            date_created=datetime.datetime.combine(day, datetime.time(12))
+        )
+        db.session.add(rate)
+        return rate
+
+    def test_convert(self):
+        amounts = [
+            ('EUR', datetime.date(2015, 1, 15), 10),
+            ('USD', datetime.date(2015, 1, 15), 10),
+            ('USD', datetime.date(2015, 2, 1), 10),
+            # before the first rate, at the first one
+            ('USD', datetime.date(2014, 1, 1), 10),
+            ('GBP', datetime.date(2015, 3, 1), 10),
+            ('USD', datetime.date(2015, 3, 1), decimal.Decimal('1.5')),
+        ]
+
+        self.assertEqual(exchange_rates.convert(amounts, 'USD'), [
+            20.0, 10.0, 10.0, 10.0, 80.0, 1.5,
+        ])
+        self.assertEqual(exchange_rates.convert(amounts, 'EUR'), [
+            10.0, 5.0, 2.5, 5.0, 20.0, 0.375,
+        ])
+
+    def test_missing_rate(self):
+        with self.assertRaises(MissingRate):
+            exchange_rates.convert([('JPY', datetime.date(2015, 1, 1), 10)], 'EUR')
+
+        # nor loaded for the target currency itself
+        self.assertEqual(exchange_rates.convert([('JPY', datetime.date(2015, 1, 1), 1)], 'JPY'), [
+            1.0,
+        ])
+
+    def test_refresh(self):
+        amounts = [('USD', datetime.date(2015, 2, 10), 8)]
+        self.assertEqual(exchange_rates.convert(amounts, 'EUR'), [2.0])
+
+        # until the next check
+        self.add_rate('EUR', 'USD', datetime.date(2015, 2, 5), '1')
+        db.session.commit()
+        self.assertEqual(exchange_rates.convert(amounts, 'EUR'), [2.0])
+
+        exchange_rates.reload_interval = 0
+        self.assertEqual(exchange_rates.convert(amounts, 'EUR'), [8.0])
+
+        rate = self.add_rate('EUR', 'USD', datetime.date(2015, 2, 10), '8')
+        db.session.commit()
+        self.assertEqual(exchange_rates.convert(amounts, 'EUR'), [1.0])
+
+        rate.rate = decimal.Decimal('16')
+        db.session.commit()
+        self.assertEqual(exchange_rates.convert(amounts, 'EUR'), [0.5])
+
+        db.session.delete(rate)
+        db.session.commit()
+        self.assertEqual(exchange_rates.convert(amounts, 'EUR'), [8.0])
+
+    def test_last_rate_of_a_day(self):
+        for hour, rate in ((18, '8'), (9, '1')):
+            self.add_rate('EUR', 'USD', datetime.date(2015, 2, 10), rate).date_created = (
+                datetime.datetime(2015, 2, 10, hour)
+            )
+        db.session.commit()
+
+        exchange_rates.reload_interval = 0
+        self.assertEqual(exchange_rates.convert([('USD', datetime.date(2015, 2, 10), 8)], 'EUR'), [
+            1.0,
+        ])
+
+
+class AmountBaseTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.euro = GroupCurrencyFactory.create(symbol='EUR')
+        self.dollar = GroupCurrencyFactory.create(symbol='USD')
+        self.yen = GroupCurrencyFactory.create(symbol='JPY')
+        self.user = UserFactory.create()
+        self.account = AccountFactory.create(user=self.user, currency=self.dollar)
+        db.session.add_all([self.euro, self.dollar, self.yen, self.user, self.account])
+        db.session.add(CurrencyRate(
+            base_currency='EUR', currency='USD', rate=decimal.Decimal('1.25'),
+            date_created=datetime.datetime(2015, 1, 1)
+        ))
+        db.session.commit()
+
+    def test_set_amount_base(self):
+        record = Record(
+            amount=decimal.Decimal('-10'), currency_id=self.dollar.id,
+            date=datetime.datetime(2015, 6, 1)
+        )
+        yen = Record(amount=decimal.Decimal('-10'), currency_id=self.yen.id)
+        exchange_rates.set_amount_base(record, yen)
+
+        self.assertEqual(record.amount_base, decimal.Decimal('-8'))
+        self.assertEqual(record.base_rate, decimal.Decimal('0.8'))
+        self.assertIsNone(yen.amount_base)
+        self.assertIsNone(yen.base_rate)
+
+    def test_set_amount_base_of_changes(self):
+        record = Record(
+            amount=decimal.Decimal('-10'), currency_id=self.dollar.id,
+            date=datetime.datetime(2015, 6, 1)
+        )
+        exchange_rates.set_amount_base(record)
+        db.session.add(record)
+        db.session.commit()
+
+        record.amount_base = decimal.Decimal('-1')
+        db.session.commit()
+
+        record.description = 'Lunch'
+        exchange_rates.set_amount_base(record)
+        self.assertEqual(record.amount_base, decimal.Decimal('-1'))
+
+        record.amount = decimal.Decimal('-20')
+        exchange_rates.set_amount_base(record)
+        self.assertEqual(record.amount_base, decimal.Decimal('-16'))
+
+    def test_make_transaction(self):
+        transaction = make_transaction(
+            self.user, self.account.id, self.account.id, 5.0, self.dollar.id, 'Moved',
+            datetime.datetime(2015, 6, 1)
+        )
+
+        self.assertEqual(float(transaction.amount_base), 4.0)
+        self.assertEqual(sorted(float(x.amount_base) for x in transaction.records), [-4.0, 4.0])
+
+    def test_backfill(self):
+        table = Record.__table__
+        date_modified = datetime.datetime(2015, 1, 1)
+        db.session.execute(table.insert(), [
+            {'amount': amount, 'currency_id': currency.id, 'date': datetime.datetime(2015, 6, 1),
+             'date_modified': date_modified}
+            for amount, currency in ((10, self.dollar), (20, self.yen), (30, self.euro))
+        ])
+        db.session.commit()
+
+        self.assertEqual(list(exchange_rates.backfill(Record, chunk_size=2)), [(2, 1), (3, 1)])
+        self.assertEqual([
+            (float(x.amount_base) if x.amount_base is not None else None, x.date_modified)
+            for x in Record.query.order_by(Record.id)
+        ], [(8.0, date_modified), (None, date_modified), (30.0, date_modified)])
+
+        # once there is a rate, only the rows without an amount are read
+        db.session.add(CurrencyRate(
+            base_currency='EUR', currency='JPY', rate=decimal.Decimal('100'),
+            date_created=datetime.datetime(2015, 1, 1)
+        ))
+        db.session.commit()
+
+        self.assertEqual(list(exchange_rates.backfill(Record)), [(2, 1)])
+        self.assertEqual(float(Record.query.get(2).amount_base), 0.2)
@@ -0,0 +1,261 @@
+import datetime
+import decimal
+
+from sqlalchemy.exc import IntegrityError
+
+from monetario import rollups
+from monetario.app import db
+from monetario.models import Record
+from monetario.models import RecordMonth
+from monetario.views.api.v1.tests.fixtures import AccountFactory
+from monetario.views.api.v1.tests.fixtures import GroupCurrencyFactory
+from monetario.views.api.v1.tests.fixtures import UserFactory
+from monetario.views.api.v1.transaction import make_transaction
+from monetario.tests import BaseTestCase
+
+
+class RollupsTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.currency = GroupCurrencyFactory.create()
+        self.user = UserFactory.create()
+        self.account = AccountFactory.create(user=self.user, currency=self.currency)
+        self.target = AccountFactory.create(user=self.user, currency=self.currency)
+        db.session.add_all([self.currency, self.user, self.account, self.target])
+        db.session.commit()
+
+    def add_record(self, date, amount, record_type=Record.RECORD_TYPE_EXPENSE):
+        record = Record(
+            user=self.user, account=self.account, currency=self.currency, date=date,
+            amount=decimal.Decimal(amount), record_type=record_type
+        )
+        db.session.add(record)
+        db.session.commit()
+        return record
+
+    def rollups(self):
+        return sorted((
+            (x.account_id, x.month, float(x.income), float(x.expense), x.count)
+            for x in RecordMonth.query if x.count
+        ), key=lambda x: (x[0] or 0,) + x[1:])
+
+    def test_writes(self):
+        record = self.add_record(datetime.datetime(2015, 6, 3), '-10')
+        self.add_record(datetime.datetime(2015, 6, 20), '25', Record.RECORD_TYPE_INCOME)
+
+        self.assertEqual(self.rollups(), [
+            (self.account.id, datetime.date(2015, 6, 1), 25.0, -10.0, 2),
+        ])
+
+        record.date = datetime.datetime(2015, 7, 1)
+        record.amount = decimal.Decimal('-4')
+        db.session.commit()
+
+        self.assertEqual(self.rollups(), [
+            (self.account.id, datetime.date(2015, 6, 1), 25.0, 0.0, 1),
+            (self.account.id, datetime.date(2015, 7, 1), 0.0, -4.0, 1),
+        ])
+
+        db.session.delete(record)
+        db.session.commit()
+
+        self.assertEqual(self.rollups(), [
+            (self.account.id, datetime.date(2015, 6, 1), 25.0, 0.0, 1),
+        ])
+
+    def checkpoints(self):
+        return [
+            (x.account_id, x.month.isoformat(), float(x.balance))
+            for x in RecordMonth.query.order_by(RecordMonth.account_id, RecordMonth.month)
+        ]
+
+    def assertBalances(self):
+        # the checkpoints against the sums of the records
+        for month in range(1, 8):
+            month = datetime.date(2015, month, 1)
+            expected = sum(
+                x.amount for x in Record.query if x.date.date() < month
+            )
+            self.assertEqual(float(rollups.balance_before(self.user.id, month)), float(expected))
+
+    def test_checkpoints(self):
+        record = self.add_record(datetime.datetime(2015, 1, 10), '-10')
+        self.add_record(datetime.datetime(2015, 4, 10), '100', Record.RECORD_TYPE_INCOME)
+        self.assertEqual(self.checkpoints(), [
+            (self.account.id, '2015-01-01', 0.0),
+            (self.account.id, '2015-04-01', -10.0),
+        ])
+
+        # backdated, between the two
+        self.add_record(datetime.datetime(2015, 2, 10), '-5')
+        self.assertEqual(self.checkpoints(), [
+            (self.account.id, '2015-01-01', 0.0),
+            (self.account.id, '2015-02-01', -10.0),
+            (self.account.id, '2015-04-01', -15.0),
+        ])
+        self.assertBalances()
+
+        # moved after the others
+        record.date = datetime.datetime(2015, 5, 1)
+        record.amount = decimal.Decimal('-20')
+        db.session.commit()
+        self.assertEqual(self.checkpoints(), [
+            (self.account.id, '2015-01-01', 0.0),
+            (self.account.id, '2015-02-01', 0.0),
+            (self.account.id, '2015-04-01', -5.0),
+            (self.account.id, '2015-05-01', 95.0),
+        ])
+        self.assertBalances()
+
+        make_transaction(
+            self.user, self.account.id, self.target.id, 30.0, self.currency.id, 'Savings',
+            datetime.datetime(2015, 3, 3)
+        )
+        self.assertEqual(self.checkpoints(), [
+            (self.account.id, '2015-01-01', 0.0),
+            (self.account.id, '2015-02-01', 0.0),
+            (self.account.id, '2015-03-01', -5.0),
+            (self.account.id, '2015-04-01', -35.0),
+            (self.account.id, '2015-05-01', 65.0),
+            (self.target.id, '2015-03-01', 0.0),
+        ])
+        self.assertBalances()
+
+    def test_transaction(self):
+        make_transaction(
+            self.user, self.account.id, self.target.id, 30.0, self.currency.id, 'Savings',
+            datetime.datetime(2015, 6, 3)
+        )
+
+        self.assertEqual(self.rollups(), sorted([
+            (self.account.id, datetime.date(2015, 6, 1), 0.0, -30.0, 1),
+            (self.target.id, datetime.date(2015, 6, 1), 30.0, 0.0, 1),
+        ]))
+
+    def test_rebuild(self):
+        self.add_record(datetime.datetime(2015, 5, 31), '-1')
+        self.add_record(datetime.datetime(2015, 6, 1), '2', Record.RECORD_TYPE_INCOME)
+        incremental = self.rollups()
+
+        RecordMonth.query.delete()
+        db.session.commit()
+
+        self.assertEqual(rollups.rebuild(), 2)
+        db.session.commit()
+
+        self.assertEqual(self.rollups(), incremental)
+        self.assertEqual(self.checkpoints(), [
+            (self.account.id, '2015-05-01', 0.0),
+            (self.account.id, '2015-06-01', -1.0),
+        ])
+
+    def test_timezones(self):
+        offset = datetime.timezone(datetime.timedelta(hours=-2))
+        self.add_record(datetime.datetime(2015, 6, 30, 23, 30, tzinfo=offset), '-1')
+        self.add_record(datetime.datetime(2015, 7, 1, 1, 30, tzinfo=offset), '-2')
+
+        incremental = self.rollups()
+        self.assertEqual(incremental, [
+            (self.account.id, datetime.date(2015, 7, 1), 0.0, -3.0, 2),
+        ])
+
+        rollups.rebuild()
+        self.assertEqual(self.rollups(), incremental)
+        self.assertEqual(
+            rollups.month_sums(self.user.id, datetime.date(2015, 7, 1), datetime.date(2015, 7, 2)),
+            [(datetime.date(2015, 7, 1), 0, -3.0, 2)]
+        )
+
+    def test_concurrent_first_record(self):
+        table = RecordMonth.__table__
+        key = (self.user.id, None, self.currency.id, datetime.date(2015, 6, 1))
+        opening_balance = rollups._opening_balance
+
+        def insert_first(connection, table, key):
+            # as another transaction does between the update and the insert
+            connection.execute(table.insert().values(
+                user_id=key[0], account_id=key[1], currency_id=key[2], month=key[3],
+                income=0, expense=-1, count=1, balance=0
+            ))
+            return opening_balance(connection, table, key)
+
+        rollups._opening_balance = insert_first
+        try:
+            rollups.apply_deltas(db.session.connection(), {key: [0, -2, 1]})
+        finally:
+            rollups._opening_balance = opening_balance
+
+        self.assertEqual(
+            [(float(x.expense), x.count) for x in RecordMonth.query], [(-3.0, 2)]
+        )
+
+        with self.assertRaises(IntegrityError):
+            db.session.execute(table.insert().values(
+                user_id=key[0], account_id=None, currency_id=key[2], month=key[3],
+                income=0, expense=0, count=0, balance=0
+            ))
+
+    def test_deletes(self):
+        # as PostgreSQL does
+        db.session.execute('PRAGMA foreign_keys=ON')
+
+        self.add_record(datetime.datetime(2015, 5, 31), '-1')
+        self.add_record(datetime.datetime(2015, 6, 1), '2', Record.RECORD_TYPE_INCOME)
+        db.session.add(Record(
+            user=self.user, account=self.target, currency=self.currency,
+            date=datetime.datetime(2015, 6, 2), amount=decimal.Decimal('-4'),
+            record_type=Record.RECORD_TYPE_EXPENSE
+        ))
+        db.session.commit()
+
+        def rebuilt():
+            incremental = self.rollups(), self.checkpoints()
+            rollups.rebuild()
+            self.assertEqual((self.rollups(), self.checkpoints()), incremental)
+            db.session.rollback()
+            return incremental[0]
+
+        db.session.delete(self.account)
+        db.session.commit()
+
+        self.assertEqual(rebuilt(), [
+            (None, datetime.date(2015, 5, 1), 0.0, -1.0, 1),
+            (None, datetime.date(2015, 6, 1), 2.0, 0.0, 1),
+            (self.target.id, datetime.date(2015, 6, 1), 0.0, -4.0, 1),
+        ])
+
+        db.session.delete(self.user)
+        db.session.commit()
+
+        self.assertEqual(RecordMonth.query.filter(RecordMonth.user_id.isnot(None)).count(), 0)
+        self.assertEqual(len(rebuilt()), 3)
+
+    def test_month_sums(self):
+        for day, amount in ((1, '-1'), (15, '-2'), (45, '-4'), (75, '-8')):
+            self.add_record(datetime.datetime(2015, 1, 1) + datetime.timedelta(days=day - 1), amount)
+
+        def sums(date_from, date_to):
+            return [
+                (month.isoformat(), float(expense), count)
+                for month, income, expense, count in rollups.month_sums(
+                    self.user.id, date_from, date_to
+                )
+            ]
+
+        self.assertEqual(sums(None, None), [
+            ('2015-01-01', -3.0, 2), ('2015-02-01', -4.0, 1), ('2015-03-01', -8.0, 1),
+        ])
+        # partial months at either end are read from the records
+        self.assertEqual(sums(datetime.date(2015, 1, 10), datetime.date(2015, 3, 10)), [
+            ('2015-01-01', -2.0, 1), ('2015-02-01', -4.0, 1),
+        ])
+        self.assertEqual(sums(datetime.date(2015, 1, 2), datetime.date(2015, 1, 20)), [
+            ('2015-01-01', -2.0, 1),
+        ])
+        self.assertEqual(sums(datetime.date(2015, 1, 20), datetime.date(2015, 2, 20)), [
+            ('2015-02-01', -4.0, 1),
+        ])
+        self.assertEqual(sums(datetime.date(2015, 2, 1), None), [
+            ('2015-02-01', -4.0, 1), ('2015-03-01', -8.0, 1),
+        ])
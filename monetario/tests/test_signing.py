@@ -0,0 +1,74 @@
+from datetime import datetime
+
+from itsdangerous import BadSignature
+from itsdangerous import SignatureExpired
+
+from monetario.app import db
+from monetario.extensions import keyring
+from monetario.models import SigningKey
+from monetario.signing import Keyring
+from monetario.tests import BaseTestCase
+
+
+class KeyringTestCase(BaseTestCase):
+    def rotate(self):
+        key = SigningKey.generate()
+        db.session.add(key)
+        db.session.commit()
+        keyring.reload()
+        return key
+
+    def test_serializers_are_reused(self):
+        self.assertIs(keyring.serializer(None, 60), keyring.serializer(None, 60))
+        self.assertIsNot(keyring.serializer(None, 60), keyring.serializer(None, 120))
+
+    def test_token_without_key_id_uses_secret_key(self):
+        token = keyring.dumps({'id': 1}, expires_in=60)
+
+        self.assertIsNone(Keyring.get_key_id(token))
+        self.assertEqual(keyring.loads(token), {'id': 1})
+
+    def test_rotated_key_signs_and_old_keys_verify(self):
+        old_token = keyring.dumps({'id': 1}, expires_in=60)
+
+        key = self.rotate()
+        token = keyring.dumps({'id': 2}, expires_in=60)
+
+        self.assertEqual(Keyring.get_key_id(token), key.kid)
+        self.assertEqual(keyring.loads(token), {'id': 2})
+        self.assertEqual(keyring.loads(old_token), {'id': 1})
+
+        self.rotate()
+
+        self.assertEqual(keyring.loads(token), {'id': 2})
+
+    def test_key_from_another_worker_is_loaded_on_demand(self):
+        other = Keyring(self.app, loader=SigningKey.load_keys)
+        self.rotate()
+        token = keyring.dumps({'id': 1}, expires_in=60)
+
+        other.reload_interval = 3600
+        other.min_reload_interval = 0
+
+        self.assertEqual(other.loads(token), {'id': 1})
+
+    def test_retired_key_does_not_verify(self):
+        key = self.rotate()
+        token = keyring.dumps({'id': 1}, expires_in=60)
+
+        key.date_retired = datetime.now()
+        db.session.commit()
+        keyring.reload()
+
+        with self.assertRaises(BadSignature):
+            keyring.loads(token)
+
+    def test_expired_token(self):
+        token = keyring.dumps({'id': 1}, expires_in=-1)
+
+        with self.assertRaises(SignatureExpired):
+            keyring.loads(token)
+
+    def test_malformed_token(self):
+        with self.assertRaises(BadSignature):
+            keyring.loads('not a token')
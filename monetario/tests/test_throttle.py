@@ -0,0 +1,91 @@
+from monetario.throttle import Throttle
+from monetario.throttle import Throttled
+from monetario.tests import BaseTestCase
+
+
+class ThrottleTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.app.config['TEST_THROTTLE_LIMITS'] = {'email': (3, 60), 'ip': (5, 60)}
+        self.throttle = Throttle(self.app, config_prefix='TEST_THROTTLE')
+
+    def test_limit(self):
+        for i in range(3):
+            self.throttle.limit({'email': 'a@b.c'}, now=600)
+
+        with self.assertRaises(Throttled) as cm:
+            self.throttle.limit({'email': 'a@b.c'}, now=610)
+
+        self.assertEqual(cm.exception.scope, 'email')
+        self.assertEqual(cm.exception.retry_after, 50)
+
+        self.throttle.limit({'email': 'd@e.f'}, now=610)
+
+    def test_rejected_attempts_are_not_counted(self):
+        for i in range(3):
+            self.throttle.limit({'email': 'a@b.c', 'ip': '127.0.0.1'}, now=600)
+
+        with self.assertRaises(Throttled):
+            self.throttle.limit({'email': 'a@b.c', 'ip': '127.0.0.1'}, now=600)
+
+        self.throttle.limit({'email': 'd@e.f', 'ip': '127.0.0.1'}, now=600)
+        self.throttle.limit({'email': 'g@h.i', 'ip': '127.0.0.1'}, now=600)
+
+        with self.assertRaises(Throttled) as cm:
+            self.throttle.limit({'email': 'j@k.l', 'ip': '127.0.0.1'}, now=600)
+
+        self.assertEqual(cm.exception.scope, 'ip')
+
+    def test_window_slides(self):
+        for i in range(3):
+            self.throttle.limit({'email': 'a@b.c'}, now=650)
+
+        # almost all of the previous window is still inside the sliding one
+        self.throttle.limit({'email': 'a@b.c'}, now=661)
+
+        with self.assertRaises(Throttled):
+            self.throttle.limit({'email': 'a@b.c'}, now=661)
+
+        # only a third of it is after 40 seconds
+        self.throttle.limit({'email': 'a@b.c'}, now=700)
+
+        with self.assertRaises(Throttled):
+            self.throttle.limit({'email': 'a@b.c'}, now=700)
+
+    def test_none_keys_are_not_limited(self):
+        for i in range(10):
+            self.throttle.limit({'email': None, 'app': 1}, now=600)
+
+    def test_set_limit(self):
+        self.throttle.set_limit('email', 'a@b.c', (1, 60))
+        self.throttle.limit({'email': 'a@b.c'}, now=600)
+
+        with self.assertRaises(Throttled):
+            self.throttle.limit({'email': 'a@b.c'}, now=600)
+
+        self.throttle.set_limit('email', 'a@b.c', None)
+        self.throttle.limit({'email': 'a@b.c'}, now=600)
+
+        self.assertEqual(self.throttle.get_limit('email', 'a@b.c'), ())
+        self.assertIsNone(self.throttle.get_limit('email', 'd@e.f'))
+
+    def test_limit_overrides_expire(self):
+        self.throttle.override_ttl = -1
+        self.throttle.set_limit('email', 'a@b.c', (1, 60))
+
+        self.assertIsNone(self.throttle.get_limit('email', 'a@b.c'))
+        for i in range(3):
+            self.throttle.limit({'email': 'a@b.c'}, now=600)
+
+    def test_stats(self):
+        for i in range(4):
+            try:
+                self.throttle.limit({'email': 'a@b.c'}, now=600)
+            except Throttled:
+                pass
+
+        self.assertEqual(self.throttle.stats(), {
+            'email': {'allowed': 3, 'rejected': 1},
+            'ip': {'allowed': 0, 'rejected': 0},
+        })
@@ -0,0 +1,221 @@
+import math
+import threading
+import time
+
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # pragma: no cover
+    redis = None
+
+
+class Throttled(Exception):
+    """
+    Raised when a request goes over one of its rate limits.
+    """
+
+    def __init__(self, scope, retry_after):
+        super().__init__(scope, retry_after)
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class MemoryCounters(object):
+    """
+    Fixed-window counters and limit overrides of this worker, the least
+    recently used keys of either are dropped once there are more than
+    ``maxsize`` of them.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._counters = OrderedDict()
+        self._limits = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, keys):
+        with self._lock:
+            return [self._counters.get(key, 0) for key in keys]
+
+    def incr(self, keys):
+        with self._lock:
+            for key, expires_in in keys:
+                self._counters[key] = self._counters.get(key, 0) + 1
+                self._counters.move_to_end(key)
+
+            while len(self._counters) > self.maxsize:
+                self._counters.popitem(last=False)
+
+    def get_limits(self, keys):
+        now = time.time()
+        limits = []
+
+        with self._lock:
+            for key in keys:
+                entry = self._limits.get(key)
+                limits.append(entry[0] if entry is not None and entry[1] > now else None)
+        return limits
+
+    def set_limit(self, key, limit, expires_in):
+        with self._lock:
+            self._limits[key] = (limit, time.time() + expires_in)
+            self._limits.move_to_end(key)
+
+            while len(self._limits) > self.maxsize:
+                self._limits.popitem(last=False)
+
+
+class RedisCounters(object):
+    """
+    Fixed-window counters and limit overrides shared by every worker through
+    Redis.
+    """
+
+    prefix = 'monetario:throttle:'
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError('Redis throttle counters require the redis package')
+        self.redis = redis.StrictRedis.from_url(url)
+
+    def _key(self, key):
+        return self.prefix + ':'.join(str(x) for x in key)
+
+    def get(self, keys):
+        return [int(x or 0) for x in self.redis.mget([self._key(key) for key in keys])]
+
+    def incr(self, keys):
+        pipe = self.redis.pipeline(transaction=False)
+        for key, expires_in in keys:
+            pipe.incr(self._key(key))
+            pipe.expire(self._key(key), expires_in)
+        pipe.execute()
+
+    def get_limits(self, keys):
+        limits = []
+        for value in self.redis.mget([self._key(('limit', ) + key) for key in keys]):
+            if value is None:
+                limits.append(None)
+            else:
+                limits.append(tuple(int(x) for x in value.decode('utf-8').split(',') if x))
+        return limits
+
+    def set_limit(self, key, limit, expires_in):
+        self.redis.set(
+            self._key(('limit', ) + key), ','.join(str(x) for x in limit), ex=expires_in
+        )
+
+
+class Throttle(object):
+    """
+    Sliding-window rate limiter.
+
+    Every limit is ``(attempts, seconds)``. The number of attempts in the
+    last ``seconds`` is estimated from the counters of the current and the
+    previous fixed window, the previous one weighted by how much of it is
+    still inside the sliding window.
+
+    The limit of a scope can be overridden for one key, see
+    :meth:`set_limit`. Overrides are kept next to the counters for
+    ``<prefix>_OVERRIDE_TTL`` seconds.
+    """
+
+    def __init__(self, app=None, config_prefix='THROTTLE'):
+        self.config_prefix = config_prefix
+        self.limits = {}
+        self.override_ttl = 300
+        self.counters = MemoryCounters()
+        self.allowed = {}
+        self.rejected = {}
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        prefix = self.config_prefix + '_'
+        self.limits = dict(app.config.get(prefix + 'LIMITS', {}))
+        self.override_ttl = app.config.get(prefix + 'OVERRIDE_TTL', self.override_ttl)
+
+        url = app.config.get(prefix + 'REDIS_URL')
+        if url:
+            self.counters = RedisCounters(url)
+        else:
+            self.counters = MemoryCounters(app.config.get(prefix + 'MAX_KEYS', 100000))
+
+        self.allowed = {}
+        self.rejected = {}
+
+    def set_limit(self, scope, key, limit):
+        """
+        Override the limit of the scope for one key, ``None`` restores the
+        configured one.
+        """
+        self.counters.set_limit((scope, key), tuple(limit or ()), self.override_ttl)
+
+    def get_limit(self, scope, key):
+        """
+        The limit set for one key of the scope, ``()`` for the configured
+        one and ``None`` when none was set (or it expired).
+        """
+        return self.counters.get_limits([(scope, key)])[0]
+
+    def limit(self, keys, now=None):
+        """
+        Count one attempt for every ``scope: key`` pair of ``keys`` or raise
+        :exc:`Throttled` without counting anything when any of them is over
+        its limit. Keys which are ``None`` are not limited.
+        """
+        if now is None:
+            now = time.time()
+
+        keys = [(scope, key) for scope, key in sorted(keys.items()) if key is not None]
+        overrides = self.counters.get_limits(keys) if keys else []
+
+        checks = []
+        for (scope, key), override in zip(keys, overrides):
+            limit = override or self.limits.get(scope)
+
+            if not limit:
+                continue
+
+            attempts, period = limit
+            window = int(now // period)
+            checks.append((scope, key, attempts, period, window))
+
+        counter_keys = []
+        for scope, key, attempts, period, window in checks:
+            counter_keys.append((scope, key, period, window))
+            counter_keys.append((scope, key, period, window - 1))
+
+        counts = self.counters.get(counter_keys)
+
+        for i, (scope, key, attempts, period, window) in enumerate(checks):
+            current, previous = counts[2 * i], counts[2 * i + 1]
+            elapsed = now - window * period
+
+            if previous * (1 - elapsed / period) + current >= attempts:
+                self._count(self.rejected, scope)
+                raise Throttled(scope, int(math.ceil(period - elapsed)))
+
+        self.counters.incr([
+            ((scope, key, period, window), 2 * period)
+            for scope, key, attempts, period, window in checks
+        ])
+
+        for scope, key, attempts, period, window in checks:
+            self._count(self.allowed, scope)
+
+    def _count(self, counts, scope):
+        with self._lock:
+            counts[scope] = counts.get(scope, 0) + 1
+
+    def stats(self):
+        return {
+            scope: {
+                'allowed': self.allowed.get(scope, 0),
+                'rejected': self.rejected.get(scope, 0),
+            }
+            for scope in set(self.limits) | set(self.allowed) | set(self.rejected)
+        }
@@ -1,19 +1,52 @@
+import base64
 import functools
+import hashlib
+import json
+import time
 
-from flask import jsonify as flask_jsonify
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from decimal import Decimal
+
+from flask import abort
+from flask import current_app
 from flask import request
+from flask import stream_with_context
 from flask import url_for
+from flask_login import current_user
+from flask_sqlalchemy import Pagination
+from sqlalchemy import and_
+from sqlalchemy import false
+from sqlalchemy import func
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy.orm import ColumnProperty
+from sqlalchemy.orm import contains_eager
+from sqlalchemy.orm import load_only
+
+from monetario.extensions import compress
+from monetario.extensions import count_cache
+from monetario.extensions import db
+from monetario.extensions import index_advisor
+from monetario.extensions import json_encoder
+from monetario.views.api.filters import compile_filter
+from monetario.views.api.filters import FilterError
+from monetario.views.api.filters import indexed_columns
 
 
 def jsonify(exclude=None):
     """
-    This decorator generates a JSON response from a Python dictionary or
-    a SQLAlchemy model.
+    This decorator generates a compact JSON response from a Python
+    dictionary or a SQLAlchemy model, encoded by ``json_encoder``.
     """
     def decorator(f):
         @functools.wraps(f)
         def wrapped(*args, **kwargs):
             rv = f(*args, **kwargs)
+            if isinstance(rv, current_app.response_class):
+                return rv
             status_or_headers = {}
             headers = None
             if isinstance(rv, tuple):
@@ -22,8 +55,10 @@ def jsonify(exclude=None):
                 headers, status_or_headers = status_or_headers, None
             if not isinstance(rv, dict):
                 # assume it is a model, call its to_json() method
-                rv = rv.to_json(exclude=exclude).data
-            rv = flask_jsonify(rv)
+                rv = rv.to_json(exclude=exclude, fields=get_fields()).data
+            rv = current_app.response_class(
+                json_encoder.dumps(rv), mimetype='application/json'
+            )
             if status_or_headers is not None:
                 rv.status_code = status_or_headers
             if headers is not None:
@@ -33,20 +68,157 @@ def jsonify(exclude=None):
     return decorator
 
 
-def _filter_query(model, query, filter_spec):
-    filters = [f.split(',') for f in filter_spec.split(';')]
+def change_marker(model, *criteria):
+    """
+    The latest ``date_modified`` and the number of the rows of ``model``
+    matching ``criteria``, as scalar subqueries. Together they change on
+    every insert, update and delete of those rows.
+    """
+    return [
+        select([func.max(model.date_modified)]).where(and_(*criteria)).as_scalar(),
+        select([func.count()]).select_from(model.__table__).where(and_(*criteria)).as_scalar(),
+    ]
+
+
+def conditional(markers):
+    """
+    This decorator implements conditional GETs with strong ETags.
+
+    ``markers`` is a function of the route arguments returning the change
+    markers (see :func:`change_marker`) of every table the response is made
+    of. They are read in one query and hashed with the user, the requested
+    URL, format and content encoding into the ETag, so requests with a matching
+    ``If-None-Match`` are answered with 304 before the view runs.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapped(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return f(*args, **kwargs)
+
+            columns = [column for marker in markers(*args, **kwargs) for column in marker]
+            values = db.session.query(*columns).one()
+
+            etag = hashlib.sha1(json.dumps([
+                current_user.id,
+                request.full_path,
+                get_stream_format(),
+                compress.negotiate(),
+                list(values),
+            ], default=str).encode('utf-8')).hexdigest()
+
+            if etag in request.if_none_match:
+                rv = current_app.response_class(status=304)
+                rv.set_etag(etag)
+                return rv
+
+            rv = f(*args, **kwargs)
+            if rv.status_code == 200:
+                rv.set_etag(etag)
+            return rv
+        return wrapped
+    return decorator
+
+
+def get_fields():
+    """
+    Parse the sparse fieldsets of the request, ``fields=id,amount`` for the
+    requested object and ``fields[account]=id,name`` for a nested one, into
+    a dict keyed by ``None`` and the nested field names.
+    """
+    fieldsets = {}
+
+    for key, value in request.args.items():
+        if key == 'fields':
+            name = None
+        elif key.startswith('fields[') and key.endswith(']'):
+            name = key[7:-1]
+        else:
+            continue
+        fieldsets[name] = tuple(x.strip() for x in value.split(',') if x.strip())
+
+    return fieldsets
+
+
+def link_args():
+    """
+    The arguments of the request carried over to the links of the other
+    pages of a collection: its sparse fieldsets and ``stream``.
+    """
+    return {
+        key: value for key, value in request.args.items()
+        if key in ('fields', 'stream') or (key.startswith('fields[') and key.endswith(']'))
+    }
+
+
+def requested_fields():
+    """
+    The fieldsets a collection response is made of. Without ``expand`` only
+    resource URLs are returned, so nothing but ids is needed.
+    """
+    if not request.args.get('expand'):
+        return {None: ('id', )}
+    return get_fields()
+
+
+def is_requested(fieldsets, name):
+    return None not in fieldsets or name in fieldsets[None]
+
+
+def load_fields(model, fieldsets, name=None):
+    """
+    Names of the columns of ``model`` to load for the fieldset ``name``
+    (suitable for ``load_only``), or ``None`` when it is not restricted.
+    Foreign keys of requested relationships are included so that they can
+    still be loaded.
+    """
+    if name not in fieldsets:
+        return None
+
+    mapper = model.__mapper__
+    columns = {column.key for column in mapper.primary_key}
+
+    for field in fieldsets[name]:
+        if field in mapper.column_attrs:
+            columns.add(field)
+        elif field in mapper.relationships:
+            columns.update(
+                mapper.get_property_by_column(column).key
+                for column in mapper.relationships[field].local_columns
+            )
+
+    return sorted(columns)
+
+
+def prune_query(model, query, joins=()):
+    """
+    Load only the columns of ``model`` the requested fields need, and join
+    and eagerly load only the relationships of ``joins``, pairs of a
+    relationship and whether it is an outer join, which are requested, with
+    only their requested columns.
+    """
+    fields = requested_fields()
+
+    columns = load_fields(model, fields)
+    if columns is not None:
+        query = query.options(load_only(*columns))
 
-    for f in filters:
-        if len(f) < 3 or (len(f) > 3 and f[1] != 'in'):
+    for relationship, outer in joins:
+        if not is_requested(fields, relationship.key):
             continue
-        if f[1] == 'in':
-            f = [f[0], f[1], f[2:]]
-        ops = {'eq': '__eq__', 'ne': '__ne__', 'lt': '__lt__', 'le': '__le__',
-               'gt': '__gt__', 'ge': '__ge__', 'in': 'in_', 'like': 'like'}
-        if hasattr(model, f[0]) and f[1] in ops.keys():
-            column = getattr(model, f[0])
-            op = ops[f[1]]
-            query = query.filter(getattr(column, op)(f[2]))
+
+        target = relationship.property.mapper.class_
+        option = contains_eager(relationship)
+        columns = load_fields(target, fields, relationship.key)
+        if columns is not None:
+            option = option.load_only(*columns)
+
+        if outer:
+            query = query.outerjoin(target, relationship)
+        else:
+            query = query.join(target, relationship)
+        query = query.options(option)
+
     return query
 
 
@@ -63,11 +235,294 @@ def _sort_query(model, query, sort_spec):
     return query
 
 
-def collection(model, name=None, max_per_page=10, exclude=None):
+def _sort_spec(model, sort_spec):
+    """
+    Parse a sort spec into ``(column, descending)`` pairs of model columns,
+    ending with the primary key as a tie-breaker.
+    """
+    spec = []
+
+    for s in (sort_spec or '').split(';'):
+        s = s.split(',')
+        column = getattr(model, s[0], None)
+        if column is None or not isinstance(getattr(column, 'property', None), ColumnProperty):
+            continue
+        spec.append((column, len(s) == 2 and s[1] == 'desc'))
+
+    if not any(column.key == model.id.key for column, descending in spec):
+        spec.append((model.id, spec[-1][1] if spec else False))
+
+    return spec
+
+
+def _dump_cursor_value(value):
+    if isinstance(value, datetime):
+        offset = value.utcoffset()
+        return [
+            value.year, value.month, value.day, value.hour, value.minute, value.second,
+            value.microsecond, offset.total_seconds() if offset is not None else None
+        ]
+    if isinstance(value, date):
+        return value.toordinal()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _load_cursor_value(column, value):
+    if value is None:
+        return None
+
+    python_type = column.type.python_type
+
+    if python_type is datetime:
+        tzinfo = timezone(timedelta(seconds=value[7])) if value[7] is not None else None
+        return datetime(*value[:7], tzinfo=tzinfo)
+    if python_type is date:
+        return date.fromordinal(value)
+    if python_type is Decimal:
+        return Decimal(value)
+    if not isinstance(value, python_type):
+        raise ValueError(value)
+    return value
+
+
+def dump_cursor(spec, item):
+    values = [_dump_cursor_value(getattr(item, column.key)) for column, descending in spec]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def load_cursor(spec, cursor):
+    """
+    Decode a cursor of ``spec`` made by :func:`dump_cursor`, raises
+    :exc:`ValueError` when it is malformed.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8'))
+        if not isinstance(values, list) or len(values) != len(spec):
+            raise ValueError(cursor)
+        return [_load_cursor_value(column, value) for (column, descending), value in zip(spec, values)]
+    except (TypeError, IndexError, ArithmeticError, NotImplementedError) as e:
+        raise ValueError(cursor) from e
+
+
+def _seek_query(query, spec, values, nulls_high):
+    """
+    Filter the rows that come after ``values`` in the order of ``spec``.
+
+    ``(a, b) > (x, y)`` is expanded into ``a >= x AND (a > x OR b > y)`` so
+    the leading term can be used as an index condition. ``nulls_high`` tells
+    whether the database sorts NULLs after every other value.
+    """
+    def after(column, descending, value):
+        nulls_last = nulls_high != descending
+        if value is None:
+            return column.isnot(None) if not nulls_last else None
+        clause = column < value if descending else column > value
+        if column.nullable and nulls_last:
+            clause = or_(clause, column.is_(None))
+        return clause
+
+    def equal(column, value):
+        return column.is_(None) if value is None else column == value
+
+    clause = None
+
+    for (column, descending), value in reversed(list(zip(spec, values))):
+        term = after(column, descending, value)
+        if clause is not None:
+            tail = and_(equal(column, value), clause)
+            term = tail if term is None else or_(term, tail)
+        clause = term
+
+    if clause is None:
+        return query.filter(false())
+
+    (column, descending), value = spec[0], values[0]
+    if value is not None and not (column.nullable and nulls_high != descending):
+        query = query.filter(column <= value if descending else column >= value)
+
+    return query.filter(clause)
+
+
+class CursorPage(object):
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+
+def _planner_estimate(model, query):
+    session = query.session
+    compiled = query.statement.compile(dialect=session.get_bind(model.__mapper__).dialect)
+
+    plan = session.connection(mapper=model.__mapper__).execute(
+        'EXPLAIN (FORMAT JSON) ' + str(compiled), compiled.params
+    ).scalar()
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_query(model, query, mode='exact', base=False):
+    """
+    Count the rows of a collection query.
+
+    ``exact`` always runs a COUNT. ``estimate`` serves counts from
+    ``count_cache`` and, on PostgreSQL, takes the planner estimate instead
+    of counting when it exceeds ``COUNT_ESTIMATE_THRESHOLD`` rows. ``base``
+    tells that the query selects from the model table only, so the COUNT
+    does not need to wrap it in a subquery.
+    """
+    query = query.order_by(None)
+
+    def count():
+        if base:
+            return query.with_entities(func.count()).scalar()
+        return query.count()
+
+    if mode != 'estimate':
+        return count()
+
+    bind = query.session.get_bind(model.__mapper__)
+    compiled = query.statement.compile(dialect=bind.dialect)
+    key = count_cache.key(
+        model.__tablename__, getattr(current_user, 'id', None), compiled, compiled.params
+    )
+
+    total = count_cache.get(key)
+
+    if total is None:
+        threshold = current_app.config.get('COUNT_ESTIMATE_THRESHOLD')
+
+        if bind.dialect.name == 'postgresql' and threshold:
+            total = _planner_estimate(model, query)
+            if total < threshold:
+                total = count()
+        else:
+            total = count()
+
+        count_cache.set(key, total)
+
+    return total
+
+
+class StreamedPage(object):
+    """
+    The rows of one page, fetched from a server-side cursor ``yield_per``
+    rows at a time while they are iterated, so only the rows being
+    serialized are held in memory. The first row is fetched right away to
+    tell whether the page is empty; ``has_next`` and ``last`` are only known
+    once the page has been consumed.
+    """
+
+    def __init__(self, query, per_page, yield_per):
+        # one more row tells whether there is a next page
+        self._rows = iter(query.limit(per_page + 1).yield_per(yield_per))
+        self._first = next(self._rows, None)
+        self.per_page = per_page
+        self.has_next = None
+        self.last = None
+
+    def __bool__(self):
+        return self._first is not None
+
+    def __iter__(self):
+        item, self._first = self._first, None
+        count = 0
+
+        while item is not None and count < self.per_page:
+            yield item
+            self.last = item
+            count += 1
+            item = next(self._rows, None)
+
+        self.has_next = item is not None
+
+        # let the cursor be closed
+        for item in self._rows:
+            pass
+
+
+def get_stream_format():
+    """
+    How the requested collection is streamed: ``'ndjson'`` when the client
+    asks for ``application/x-ndjson``, ``'json'`` with ``stream=1`` and
+    ``None`` when it is not.
+    """
+    best = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+
+    if best == 'application/x-ndjson':
+        return 'ndjson'
+    if request.args.get('stream'):
+        return 'json'
+    return None
+
+
+def stream_collection(items, meta, stream_format):
+    """
+    Stream a collection response, encoding the objects one by one.
+
+    ``json`` streams the usual ``{"objects": [...], "meta": {...}}``
+    envelope. ``ndjson`` streams one object per line followed by a last
+    ``{"meta": {...}}`` line. ``meta`` is called once every item has been
+    sent.
+    """
+    chunk_size = current_app.config.get('STREAM_CHUNK_SIZE', 16384)
+
+    def generate():
+        dumps = json_encoder.dumps
+
+        if stream_format == 'ndjson':
+            chunks = (dumps(item) + '\n' for item in items)
+            tail = lambda: dumps({'meta': meta()}) + '\n'
+        else:
+            chunks = ((',' if i else '') + dumps(item) for i, item in enumerate(items))
+            tail = lambda: '],"meta":' + dumps(meta()) + '}'
+            yield '{"objects":['
+
+        buffer, size = [], 0
+        for chunk in chunks:
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= chunk_size:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+        buffer.append(tail())
+        yield ''.join(buffer)
+
+    mimetype = 'application/x-ndjson' if stream_format == 'ndjson' else 'application/json'
+    return current_app.response_class(stream_with_context(generate()), mimetype=mimetype)
+
+
+def collection(model, name=None, max_per_page=10, exclude=None, base_query=None, filters=None,
+               search=None, joins=()):
     """
     This decorator implements pagination, filtering, sorting and expanding
     for collections. The expected response from the decorated route is a
     SQLAlchemy query.
+
+    ``base_query`` may be a function of the route arguments returning a
+    query of the same rows from the model table alone, which is counted
+    instead of the (joined) collection query.
+
+    ``filters`` is the allow-list of columns which can be filtered on,
+    the indexed columns of the model by default (see
+    :mod:`monetario.views.api.filters`).
+
+    ``search`` is a function of the ``q`` parameter and the database dialect
+    returning the criterion and relevance of a full-text search (see
+    :func:`monetario.search.match`). Unless sorted otherwise, the results
+    are ranked by relevance.
+
+    Collections requested as NDJSON or with ``stream=1`` are streamed from
+    a server-side cursor (see :func:`stream_collection`).
+
+    Only the columns of the requested ``fields`` are loaded, and only the
+    relationships of ``joins`` among them are joined (see
+    :func:`prune_query`), the decorated route returns the query without
+    them.
     """
     if name is None:
         name = model.__tablename__
@@ -75,85 +530,241 @@ def collection(model, name=None, max_per_page=10, exclude=None):
     def decorator(f):
         @functools.wraps(f)
         def wrapped(*args, **kwargs):
-            query = f(*args, **kwargs)
+            query = prune_query(model, f(*args, **kwargs), joins)
+            base = base_query(*args, **kwargs) if base_query is not None else None
 
-            p, meta = get_pagination(model, query, max_per_page, **kwargs)
+            stream_format = get_stream_format()
+
+            try:
+                p, meta = get_pagination(
+                    model, query, max_per_page, base_query=base,
+                    stream=stream_format is not None, filters=filters, search=search, **kwargs
+                )
+            except FilterError as e:
+                return {'errors': {'filter': str(e)}}, 400
 
             expand = request.args.get('expand')
 
             if expand:
-                items = [item.to_json(exclude=exclude).data for item in p.items]
+                fields = get_fields()
+                items = (item.to_json(exclude=exclude, fields=fields).data for item in p.items)
             else:
-                items = [item.resource_url for item in p.items]
-            return {'objects': items, 'meta': meta}
+                items = (item.resource_url for item in p.items)
+
+            if stream_format is not None:
+                return stream_collection(items, meta, stream_format)
+            return {'objects': list(items), 'meta': meta}
             # return {name: items, 'meta': meta}
         return wrapped
     return decorator
 
 
-def get_pagination(model, query, max_per_page=10, **kwargs):
+def advised(f):
+    """
+    Record the shape and latency of the collection queries paginated by
+    ``f`` with the index advisor.
+    """
+    @functools.wraps(f)
+    def wrapped(model, query, *args, **kwargs):
+        started = time.time()
+        result = f(model, query, *args, **kwargs)
+
+        index_advisor.record(
+            model, query, request.args.get('filter'), request.args.get('sort'),
+            time.time() - started
+        )
+        return result
+    return wrapped
+
+
+@advised
+def get_pagination(model, query, max_per_page=10, base_query=None, stream=False, filters=None,
+                   search=None, **kwargs):
+    """
+    Filter, sort and paginate a collection query, returns the page and its
+    meta. With ``stream`` the items of the page are a :class:`StreamedPage`
+    and the meta is a function to call once they have been consumed.
+    Raises :exc:`FilterError` for filters which are not allowed.
+    """
     # filtering and sorting
     filter = request.args.get('filter')
     if filter:
-        query = _filter_query(model, query, filter)
+        if filters is None:
+            filters = indexed_columns(model)
+        criterion = compile_filter(model, tuple(filters), filter)
+
+        query = query.filter(criterion)
+        if base_query is not None:
+            base_query = base_query.filter(criterion)
+
+    q = request.args.get('q')
+    relevance = None
+    if q and search is not None:
+        dialect = query.session.get_bind(model.__mapper__).dialect.name
+        criterion, relevance = search(q, dialect)
+
+        query = query.filter(criterion)
+        if base_query is not None:
+            base_query = base_query.filter(criterion)
     sort = request.args.get('sort')
+
+    if 'cursor' in request.args:
+        return get_cursor_pagination(model, query, max_per_page, stream=stream, **kwargs)
+
     if sort:
         query = _sort_query(model, query, sort)
+    elif relevance is not None:
+        query = query.order_by(relevance.desc(), model.id)
 
     # pagination
     page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', max_per_page,
                                     type=int), max_per_page)
     expand = request.args.get('expand')
+    count = request.args.get('count')
+    if count not in ('estimate', 'none'):
+        count = None
 
-    p = query.paginate(page, per_page)
-    pages = {'page': page, 'per_page': per_page,
-             'total': p.total, 'pages': p.pages}
-    if p.has_prev:
-        pages['prev_url'] = url_for(
-            request.endpoint,
-            filter=filter,
-            sort=sort,
-            page=p.prev_num,
-            per_page=per_page,
-            expand=expand,
-            _external=True,
-            **kwargs
-        )
+    if page < 1 or per_page < 1:
+        abort(404)
+
+    if count == 'none':
+        total = None
+    elif base_query is not None:
+        total = count_query(model, base_query, count or 'exact', base=True)
+    else:
+        total = count_query(model, query, count or 'exact')
+
+    query = query.offset((page - 1) * per_page)
+
+    if stream:
+        items = StreamedPage(query, per_page, current_app.config.get('STREAM_YIELD_PER', 50))
+        p = Pagination(query, page, per_page, total, items)
+    elif count == 'none':
+        # one more row tells whether there is a next page
+        items = query.limit(per_page + 1).all()
+        p = Pagination(query, page, per_page, None, items[:per_page])
+        has_next = len(items) > per_page
     else:
-        pages['prev_url'] = None
-    if p.has_next:
-        pages['next_url'] = url_for(
+        p = Pagination(query, page, per_page, total, query.limit(per_page).all())
+        has_next = p.has_next
+
+    if not p.items and page != 1:
+        abort(404)
+
+    args = dict(link_args(), **kwargs)
+
+    def page_url(page):
+        return url_for(
             request.endpoint,
             filter=filter,
+            q=q,
             sort=sort,
-            page=p.next_num,
+            page=page,
             per_page=per_page,
             expand=expand,
+            count=count,
             _external=True,
-            **kwargs
+            **args
         )
-    else:
-        pages['next_url'] = None
-    pages['first_url'] = url_for(
-        request.endpoint,
-        filter=filter,
-        sort=sort,
-        page=1,
-        per_page=per_page,
-        expand=expand,
-        _external=True,
-        **kwargs
-    )
-    pages['last_url'] = url_for(
-        request.endpoint,
-        filter=filter,
-        sort=sort,
-        page=p.pages or 1,
-        per_page=per_page,
-        expand=expand,
-        _external=True,
-        **kwargs
-    )
 
-    return p, pages
+    def meta(has_next):
+        return {
+            'page': page,
+            'per_page': per_page,
+            'total': p.total,
+            'pages': p.pages if p.total is not None else None,
+            'prev_url': page_url(p.prev_num) if p.has_prev else None,
+            'next_url': page_url(page + 1) if has_next else None,
+            'first_url': page_url(1),
+            'last_url': page_url(p.pages or 1) if p.total is not None else None,
+        }
+
+    if stream:
+        return p, lambda: meta(p.items.has_next)
+    return p, meta(has_next)
+
+
+def get_cursor_pagination(model, query, max_per_page=10, stream=False, **kwargs):
+    """
+    Keyset pagination, opted into by passing ``cursor`` (empty for the first
+    page). Instead of an OFFSET, the query seeks past the sort key and id of
+    the last item of the previous page, so every page costs the same.
+    Sorting by nullable columns is supported, relationships are ignored.
+    Search results are not ranked, they follow the sort of the cursor.
+    """
+    filter = request.args.get('filter')
+    q = request.args.get('q')
+    sort = request.args.get('sort')
+    cursor = request.args.get('cursor')
+    per_page = min(request.args.get('per_page', max_per_page,
+                                    type=int), max_per_page)
+    expand = request.args.get('expand')
+
+    if per_page < 1:
+        abort(404)
+
+    spec = _sort_spec(model, sort)
+
+    if cursor:
+        try:
+            values = load_cursor(spec, cursor)
+        except ValueError:
+            abort(400)
+
+        nulls_high = query.session.get_bind(model.__mapper__).dialect.name == 'postgresql'
+        query = _seek_query(query, spec, values, nulls_high)
+
+    query = query.order_by(*[
+        column.desc() if descending else column.asc() for column, descending in spec
+    ])
+
+    args = dict(link_args(), **kwargs)
+
+    def meta(next_cursor):
+        return {
+            'per_page': per_page,
+            'next_cursor': next_cursor,
+            'next_url': url_for(
+                request.endpoint,
+                filter=filter,
+                q=q,
+                sort=sort,
+                cursor=next_cursor,
+                per_page=per_page,
+                expand=expand,
+                _external=True,
+                **args
+            ) if next_cursor else None,
+            'first_url': url_for(
+                request.endpoint,
+                filter=filter,
+                q=q,
+                sort=sort,
+                cursor='',
+                per_page=per_page,
+                expand=expand,
+                _external=True,
+                **args
+            ),
+        }
+
+    if stream:
+        items = StreamedPage(query, per_page, current_app.config.get('STREAM_YIELD_PER', 50))
+        p = CursorPage(items, None)
+
+        def streamed_meta():
+            if items.has_next:
+                p.next_cursor = dump_cursor(spec, items.last)
+            return meta(p.next_cursor)
+
+        return p, streamed_meta
+
+    items = query.limit(per_page + 1).all()
+    next_cursor = None
+
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = dump_cursor(spec, items[-1])
+
+    return CursorPage(items, next_cursor), meta(next_cursor)
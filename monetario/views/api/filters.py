@@ -0,0 +1,156 @@
+"""
+The ``filter=`` language of collections.
+
+A filter is a ``;`` separated list of ``column,op,value`` terms, ``in``
+taking any number of values (``column,in,1,2,3``). Only columns of the
+allow-list of the collection can be filtered on, which defaults to the
+indexed columns of the model. Values are coerced to the type of the column,
+``null`` stands for NULL with ``eq`` and ``ne``, and ``like`` patterns must
+start with a literal prefix so that they can use an index.
+"""
+import datetime
+import decimal
+import functools
+import re
+
+from marshmallow import fields
+from marshmallow import ValidationError
+from sqlalchemy import and_
+from sqlalchemy.orm import ColumnProperty
+
+
+class FilterError(ValueError):
+    """
+    Raised for filters which are malformed or not allowed.
+    """
+
+
+OPERATORS = {
+    'eq': '__eq__',
+    'ne': '__ne__',
+    'lt': '__lt__',
+    'le': '__le__',
+    'gt': '__gt__',
+    'ge': '__ge__',
+    'in': 'in_',
+    'like': 'like',
+}
+
+FIELDS = {
+    bool: fields.Boolean,
+    int: fields.Integer,
+    float: fields.Float,
+    decimal.Decimal: fields.Decimal,
+    datetime.datetime: fields.DateTime,
+    datetime.date: fields.Date,
+    str: fields.String,
+}
+
+# characters a like pattern must start with before its first wildcard
+LIKE_MIN_PREFIX = 3
+
+
+@functools.lru_cache(maxsize=None)
+def indexed_columns(model):
+    """
+    Names of the columns of ``model`` which lead an index: primary keys,
+    indexed and unique columns and the first columns of table indexes.
+    """
+    table = model.__table__
+    leading = {column.key for column in table.primary_key}
+    leading.update(column.key for column in table.columns if column.index or column.unique)
+
+    for index in table.indexes:
+        leading.add(list(index.columns)[0].key)
+
+    mapper = model.__mapper__
+    return tuple(sorted(
+        prop.key for prop in mapper.column_attrs
+        if any(column.key in leading for column in prop.columns if column.table is table)
+    ))
+
+
+def _python_type(column):
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return str
+
+
+def _coerce(column, value):
+    if value == 'null':
+        return None
+
+    python_type = _python_type(column)
+    field = FIELDS.get(python_type, fields.String)()
+
+    try:
+        return field.deserialize(value)
+    except ValidationError:
+        if python_type is datetime.datetime:
+            # a date stands for its midnight
+            return datetime.datetime.combine(_coerce_date(value), datetime.time())
+        raise FilterError('Invalid value {!r} for {}'.format(value, column.key))
+
+
+def _coerce_date(value):
+    try:
+        return fields.Date().deserialize(value)
+    except ValidationError:
+        raise FilterError('Invalid date {!r}'.format(value))
+
+
+def _term(model, allowed, term):
+    parts = term.split(',')
+
+    if len(parts) < 3:
+        raise FilterError('Malformed filter {!r}'.format(term))
+
+    name, op, values = parts[0], parts[1], parts[2:]
+
+    if name not in allowed:
+        raise FilterError('Filtering on {} is not allowed'.format(name))
+    if op not in OPERATORS:
+        raise FilterError('Unknown filter operator {}'.format(op))
+    if op != 'in' and len(values) != 1:
+        raise FilterError('Malformed filter {!r}'.format(term))
+
+    prop = model.__mapper__.get_property(name)
+    if not isinstance(prop, ColumnProperty):
+        raise FilterError('Filtering on {} is not allowed'.format(name))
+
+    column = getattr(model, name)
+
+    if op == 'in':
+        return column.in_([_coerce(column, value) for value in values])
+
+    if op == 'like':
+        pattern = values[0]
+        prefix = re.split('[%_]', pattern, 1)[0]
+        if _python_type(column) is not str or len(prefix) < LIKE_MIN_PREFIX:
+            raise FilterError(
+                'like patterns must start with at least {} characters'.format(LIKE_MIN_PREFIX)
+            )
+        return column.like(pattern)
+
+    value = _coerce(column, values[0])
+
+    if value is None:
+        if op == 'eq':
+            return column.is_(None)
+        if op == 'ne':
+            return column.isnot(None)
+        raise FilterError('null can only be compared with eq and ne')
+
+    return getattr(column, OPERATORS[op])(value)
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_filter(model, allowed, filter_spec):
+    """
+    The SQL expression of ``filter_spec`` over the ``allowed`` columns of
+    ``model``, cached. Raises :exc:`FilterError`.
+    """
+    return and_(*[
+        _term(model, allowed, term) for term in filter_spec.split(';') if term
+    ])
@@ -1,5 +1,8 @@
 from flask import Blueprint, jsonify, url_for
 
+from monetario.hashing import HashingBusy
+from monetario.throttle import Throttled
+
 bp = Blueprint("api.v1", __name__)
 
 
@@ -39,11 +42,35 @@ def forbidden(message):
     return response
 
 
+def too_many_requests(message, retry_after):
+    response = jsonify({'error': 'too many requests', 'message': message})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def service_unavailable(message, retry_after=1):
+    response = jsonify({'error': 'service unavailable', 'message': message})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
 @bp.errorhandler(ValidationError)
 def validation_error(e):
     return bad_request(e.args[0])
 
 
+@bp.errorhandler(Throttled)
+def throttled(e):
+    return too_many_requests('Too many login attempts, try again later.', e.retry_after)
+
+
+@bp.errorhandler(HashingBusy)
+def hashing_busy(e):
+    return service_unavailable('Too many concurrent logins, try again later.')
+
+
 from . import token
 from . import test_views
 from . import currency
@@ -1,39 +1,49 @@
 
+import datetime
 import json
 
 from flask import request
 from flask_login import login_required
 from flask_login import current_user
 
+from monetario.extensions import balance_index
 from monetario.models import db
 from monetario.models import User
 from monetario.models import Account
 from monetario.models import GroupCurrency
+from monetario.serializers import BalanceSeriesSchema
+from monetario.serializers import DateRangeFilterSchema
 
 from monetario.views.api.v1 import bp
 from monetario.views.api.decorators import jsonify
+from monetario.views.api.decorators import change_marker
 from monetario.views.api.decorators import collection
+from monetario.views.api.decorators import conditional
+
+
+def get_accounts_markers(**kwargs):
+    return [
+        change_marker(Account, Account.user_id == current_user.id),
+        change_marker(User, User.id == current_user.id),
+        change_marker(GroupCurrency, GroupCurrency.group_id == current_user.group_id),
+    ]
 
 
 @bp.route('/accounts/', methods=['GET'])
 @login_required
+@conditional(get_accounts_markers)
 @jsonify()
-@collection(Account)
+@collection(Account, joins=((Account.user, False), (Account.currency, False)))
 def get_accounts():
-    return (
-        Account.query
-        .options(
-            db.contains_eager(Account.user),
-            db.contains_eager(Account.currency),
-        )
-        .join(User, User.id == Account.user_id)
-        .join(GroupCurrency, GroupCurrency.id == Account.currency_id)
-        .filter(Account.user_id == current_user.id)
+    return Account.query.filter(
+        Account.user_id == current_user.id,
+        Account.currency_id.isnot(None),
     )
 
 
 @bp.route('/accounts/<int:account_id>/', methods=['GET'])
 @login_required
+@conditional(get_accounts_markers)
 @jsonify()
 def get_account(account_id):
     return (
@@ -49,6 +59,47 @@ def get_account(account_id):
     )
 
 
+# days of a balance series, at most
+MAX_SERIES_DAYS = 1000
+
+
+@bp.route('/accounts/<int:account_id>/balance_series/', methods=['GET'])
+@login_required
+@jsonify()
+def get_account_balance_series(account_id):
+    """
+    The balance of the account at the end of every day from ``date_from``
+    to ``date_to`` (both included, the last 30 days by default).
+    """
+    account = Account.query.filter(
+        Account.id == account_id, Account.user_id == current_user.id
+    ).first_or_404()
+
+    date_range_filter_schema = DateRangeFilterSchema().load(request.args)
+    if date_range_filter_schema.errors:
+        return {'errors': date_range_filter_schema.errors}, 400
+
+    date_to = date_range_filter_schema.data.get('date_to', datetime.date.today())
+    date_from = date_range_filter_schema.data.get(
+        'date_from', date_to - datetime.timedelta(days=29)
+    )
+
+    if date_from > date_to:
+        return {'errors': {'date_from': 'Must not be after date_to.'}}, 400
+
+    if (date_to - date_from).days >= MAX_SERIES_DAYS:
+        return {'errors': {
+            'date_to': 'At most {} days from date_from.'.format(MAX_SERIES_DAYS)
+        }}, 400
+
+    days = [date_from + datetime.timedelta(days=x) for x in range((date_to - date_from).days + 1)]
+
+    return {'objects': BalanceSeriesSchema().dump([
+        {'date': day, 'balance': balance}
+        for day, balance in zip(days, balance_index.balances(account, days))
+    ], many=True).data}
+
+
 @bp.route('/accounts/<int:account_id>/', methods=['DELETE'])
 @login_required
 @jsonify()
@@ -80,7 +131,7 @@ def add_account():
         return {'errors': {'currency': 'Group currency with this id does not exist'}}, 400
 
     account = Account(**account_schema.data)
-    account.user = current_user
+    account.user_id = current_user.id
 
     db.session.add(account)
     db.session.commit()
@@ -5,6 +5,7 @@ import binascii
 from flask import request
 from flask_login import login_required
 
+from monetario.extensions import login_throttle
 from monetario.models import db
 from monetario.models import App
 from monetario.models import User
@@ -87,6 +88,9 @@ def edit_app(app_id):
 
     db.session.commit()
 
+    if 'login_limit' in app_schema.data or 'login_limit_period' in app_schema.data:
+        login_throttle.set_limit('app', app.id, app.login_throttle_limit)
+
     return app, 200
 
 
@@ -4,22 +4,187 @@ import datetime
 
 from flask import request
 from flask_login import login_required
+from flask_login import current_user
 from sqlalchemy.sql import case
 from sqlalchemy.sql import func
+from sqlalchemy.sql import null
 
+from monetario import rollups
+from monetario.extensions import exchange_rates
 from monetario.models import db
+from monetario.models import GroupCategory
+from monetario.models import GroupCurrency
 from monetario.models import Record
+from monetario.rates import MissingRate
 
 from monetario.serializers import BalanceSchema
 from monetario.serializers import DateRangeFilterSchema
 from monetario.serializers import CashFlowSchema
 from monetario.serializers import ExpenseSchema
 from monetario.serializers import IncomeSchema
+from monetario.serializers import ReportCurrencySchema
 
 from monetario.views.api.v1 import bp
 from monetario.views.api.decorators import jsonify
 
 
+def get_report_currency():
+    """
+    The group currency of the ``currency`` argument to report amounts in,
+    ``None`` without one. Raises ``ValueError`` when it is not one of the
+    group of the current user.
+    """
+    report_currency_schema = ReportCurrencySchema().load(request.args)
+    if report_currency_schema.errors:
+        raise ValueError(report_currency_schema.errors['currency'][0])
+
+    if 'currency' not in report_currency_schema.data:
+        return None
+
+    currency = GroupCurrency.query.filter(
+        GroupCurrency.id == report_currency_schema.data['currency'],
+        GroupCurrency.group_id == current_user.group_id,
+    ).first()
+
+    if not currency:
+        raise ValueError('Group currency with this id does not exist')
+    return currency
+
+
+def filter_report_records(query, date_from=None, date_to=None):
+    query = query.filter(
+        Record.user_id == current_user.id,
+        Record.record_type.in_([Record.RECORD_TYPE_INCOME, Record.RECORD_TYPE_EXPENSE]),
+    )
+
+    if date_from is not None:
+        query = query.filter(Record.date >= date_from)
+
+    if date_to is not None:
+        query = query.filter(Record.date < date_to)
+
+    return query
+
+
+def base_days(date_from=None, date_to=None):
+    """
+    Like :func:`converted_days` in the ``BASE_CURRENCY``, from the
+    ``amount_base`` of the records. ``None`` when some of them have none.
+    """
+    day = func.date(Record.date, type_=db.Date)
+
+    query = filter_report_records(db.session.query(
+        day,
+        Record.record_type,
+        func.sum(Record.amount_base),
+        func.count(Record.id),
+        func.count(Record.amount),
+        func.count(Record.amount_base),
+    ), date_from, date_to).group_by(
+        day,
+        Record.record_type,
+    )
+
+    rows = query.all()
+    if any(amounts != converted for _, _, _, _, amounts, converted in rows):
+        return None
+
+    return [(date, record_type, amount, count) for date, record_type, amount, count, _, _ in rows]
+
+
+def base_balance(date_from, date_to):
+    """
+    The balance of the current user before ``date_from`` and their incomes
+    and expenses from it to ``date_to`` (excluded) in the ``BASE_CURRENCY``,
+    in one query over the ``amount_base`` of the records, as
+    ``(start_balance, income, expense, count)``. ``None`` when some of the
+    records have none.
+    """
+    in_range = Record.date >= date_from
+
+    def in_range_sum(record_type):
+        return func.sum(case(
+            [(in_range & (Record.record_type == record_type), Record.amount_base)], else_=0
+        ))
+
+    start_balance, income, expense, count, amounts, converted = filter_report_records(
+        db.session.query(
+            func.sum(case([(in_range, 0)], else_=Record.amount_base)),
+            in_range_sum(Record.RECORD_TYPE_INCOME),
+            in_range_sum(Record.RECORD_TYPE_EXPENSE),
+            func.sum(case([(in_range, 1)], else_=0)),
+            func.count(Record.amount),
+            func.count(Record.amount_base),
+        ), date_to=date_to
+    ).one()
+
+    if amounts != converted:
+        return None
+
+    return (start_balance or 0, income or 0, expense or 0, count or 0)
+
+
+def converted_days(currency, date_from=None, date_to=None):
+    """
+    The incomes and expenses of the current user from ``date_from`` to
+    ``date_to`` (excluded) summed by day, currency and record type and
+    converted to ``currency`` at the rate of their day, as ``(day,
+    record_type, amount, count)``. Raises ``MissingRate``.
+    """
+    if currency.symbol == exchange_rates.base_currency:
+        days = base_days(date_from, date_to)
+        if days is not None:
+            return days
+
+    day = func.date(Record.date, type_=db.Date)
+
+    query = filter_report_records(db.session.query(
+        GroupCurrency.symbol,
+        day,
+        Record.record_type,
+        func.sum(Record.amount),
+        func.count(Record.id),
+    ).select_from(
+        Record
+    ).join(
+        GroupCurrency, GroupCurrency.id == Record.currency_id
+    ), date_from, date_to).group_by(
+        GroupCurrency.symbol,
+        day,
+        Record.record_type,
+    )
+
+    rows = query.all()
+    amounts = exchange_rates.convert(
+        [(symbol, date, amount) for symbol, date, _, amount, _ in rows], currency.symbol
+    )
+
+    return [
+        (date, record_type, amount, count)
+        for (_, date, record_type, _, count), amount in zip(rows, amounts)
+    ]
+
+
+def converted_month_sums(currency, date_from=None, date_to=None):
+    """
+    Like :func:`monetario.rollups.month_sums`, in ``currency``.
+    """
+    months = {}
+
+    for date, record_type, amount, count in converted_days(currency, date_from, date_to):
+        sums = months.setdefault(rollups.month_of(date), [0, 0, 0])
+        if record_type == Record.RECORD_TYPE_INCOME:
+            sums[0] += amount
+        else:
+            sums[1] += amount
+        sums[2] += count
+
+    return [
+        (month, income, expense, count)
+        for month, (income, expense, count) in sorted(months.items())
+    ]
+
+
 @bp.route('/balance/<int:year>/<int:month>/', methods=['GET'])
 @login_required
 @jsonify()
@@ -27,41 +192,41 @@ def get_balance(year, month):
     (_, day) = calendar.monthrange(year, month)
     start_date = datetime.date(year, month, 1)
     end_date = datetime.date(year, month, day)
+    next_date = end_date + datetime.timedelta(days=1)
     balance_schema = BalanceSchema()
 
-    amounts = db.session.query(
-        func.sum(Record.amount).label("cash_flow"),
-        func.sum(
-            case([(Record.record_type == Record.RECORD_TYPE_INCOME, Record.amount)], else_=0)
-        ).label('income'),
-        func.sum(
-            case([(Record.record_type == Record.RECORD_TYPE_EXPENSE, Record.amount)], else_=0)
-        ).label('expense'),
-        func.date_trunc('month', Record.date).label("date"),
-    ).filter(
-        func.extract('year', Record.date) == year,
-        func.extract('month', Record.date) == month,
-    ).group_by(
-        func.date_trunc('month', Record.date)
-    ).first()
-
-    current_balance = db.session.query(
-        func.sum(
-            case([(Record.date < start_date, Record.amount)], else_=0)
-        ).label('start_balance'),
-        func.sum(Record.amount).label("end_balance")
-    ).filter(
-        Record.date <= end_date
-    ).first()
+    try:
+        currency = get_report_currency()
+    except ValueError as e:
+        return {'errors': {'currency': str(e)}}, 400
+
+    sums = None
+    if currency is not None and currency.symbol == exchange_rates.base_currency:
+        sums = base_balance(start_date, next_date)
+
+    if sums is not None:
+        start_balance, income, expense, count = sums
+        amounts = [(start_date, income, expense, count)] if count else []
+    elif currency is not None:
+        try:
+            amounts = converted_month_sums(currency, start_date, next_date)
+            start_balance = sum(x[2] for x in converted_days(currency, date_to=start_date))
+        except MissingRate as e:
+            return {'errors': {'currency': str(e)}}, 400
+    else:
+        # a row per month from the rollups rather than every record
+        amounts = rollups.month_sums(current_user.id, start_date, next_date)
+        start_balance = rollups.balance_before(current_user.id, start_date)
 
     if amounts:
+        _, income, expense, _ = amounts[0]
         balance = balance_schema.dump({
-            'cash_flow': amounts.cash_flow,
-            'income': amounts.income,
-            'expense': amounts.expense,
-            'date': amounts.date,
-            'start_balance': current_balance.start_balance,
-            'end_balance': current_balance.end_balance,
+            'cash_flow': income + expense,
+            'income': income,
+            'expense': expense,
+            'date': start_date,
+            'start_balance': start_balance,
+            'end_balance': start_balance + income + expense,
         }).data
     else:
         balance = balance_schema.dump({
@@ -69,8 +234,8 @@ def get_balance(year, month):
             'income': 0,
             'expense': 0,
             'date': end_date,
-            'start_balance': current_balance.start_balance,
-            'end_balance': current_balance.end_balance,
+            'start_balance': start_balance,
+            'end_balance': start_balance,
         }).data
 
     return balance
@@ -84,30 +249,114 @@ def get_cash_flows():
     if date_range_filter_schema.errors:
         return {'errors': date_range_filter_schema.errors}, 400
 
+    try:
+        currency = get_report_currency()
+    except ValueError as e:
+        return {'errors': {'currency': str(e)}}, 400
+
     cash_flow_schema = CashFlowSchema()
 
-    amounts = db.session.query(
-        func.sum(Record.amount).label("cash_flow"),
-        func.sum(
-            case([(Record.record_type == Record.RECORD_TYPE_INCOME, Record.amount)], else_=0)
-        ).label('income'),
-        func.sum(
-            case([(Record.record_type == Record.RECORD_TYPE_EXPENSE, Record.amount)], else_=0)
-        ).label('expense'),
-        func.date_trunc('month', Record.date).label("date"),
+    date_from = date_range_filter_schema.data.get('date_from')
+    date_to = date_range_filter_schema.data.get('date_to')
+
+    if currency is not None:
+        try:
+            amounts = converted_month_sums(currency, date_from, date_to)
+        except MissingRate as e:
+            return {'errors': {'currency': str(e)}}, 400
+    else:
+        amounts = rollups.month_sums(current_user.id, date_from, date_to)
+
+    return {'objects': cash_flow_schema.dump([
+        {'cash_flow': income + expense, 'income': income, 'expense': expense, 'date': month}
+        for month, income, expense, count in amounts
+    ], many=True).data}
+
+
+def category_totals(record_type, date_from=None, date_to=None):
+    """
+    The records of ``record_type`` of the current user summed by category
+    and by every ancestor of it, in one query: ``amount`` is the sum of the
+    records of a category itself, ``subtotal`` adds up the records of its
+    descendants too. Records without a category come as a row without one.
+    """
+    sums = db.session.query(
+        Record.category_id.label('category_id'),
+        func.sum(Record.amount).label('amount'),
+    ).filter(
+        Record.user_id == current_user.id,
+        Record.record_type == record_type,
     ).group_by(
-        func.date_trunc('month', Record.date)
-    ).order_by(
-        func.date_trunc('month', Record.date)
+        Record.category_id
+    )
+
+    if date_from is not None:
+        sums = sums.filter(Record.date >= date_from)
+
+    if date_to is not None:
+        sums = sums.filter(Record.date < date_to)
+
+    sums = sums.cte('sums')
+
+    # every category with records and its ancestors; UNION, rather than
+    # UNION ALL, stops at a cycle of parents
+    tree = db.session.query(
+        GroupCategory.id.label('category_id'),
+        GroupCategory.id.label('ancestor_id'),
+    ).filter(
+        GroupCategory.id.in_(db.session.query(sums.c.category_id))
+    ).cte('tree', recursive=True)
+
+    parent = db.aliased(GroupCategory)
+    child = tree.alias()
+    tree = tree.union(
+        db.session.query(
+            child.c.category_id,
+            parent.parent_id,
+        ).join(
+            parent, parent.id == child.c.ancestor_id
+        ).filter(
+            parent.parent_id.isnot(None)
+        )
     )
 
-    if 'date_from' in date_range_filter_schema.data:
-        amounts = amounts.filter(Record.date >= date_range_filter_schema.data['date_from'])
+    categorised = db.session.query(
+        GroupCategory.id.label('category_id'),
+        GroupCategory.name,
+        GroupCategory.colour,
+        GroupCategory.logo,
+        GroupCategory.parent_id,
+        func.sum(
+            case([(tree.c.category_id == tree.c.ancestor_id, sums.c.amount)], else_=0)
+        ).label('amount'),
+        func.sum(sums.c.amount).label('subtotal'),
+    ).select_from(
+        tree
+    ).join(
+        sums, sums.c.category_id == tree.c.category_id
+    ).join(
+        GroupCategory, GroupCategory.id == tree.c.ancestor_id
+    ).group_by(
+        GroupCategory.id,
+        GroupCategory.name,
+        GroupCategory.colour,
+        GroupCategory.logo,
+        GroupCategory.parent_id,
+    )
 
-    if 'date_to' in date_range_filter_schema.data:
-        amounts = amounts.filter(Record.date < date_range_filter_schema.data['date_to'])
+    uncategorised = db.session.query(
+        sums.c.category_id,
+        null().label('name'),
+        null().label('colour'),
+        null().label('logo'),
+        null().label('parent_id'),
+        sums.c.amount,
+        sums.c.amount.label('subtotal'),
+    ).filter(
+        sums.c.category_id.is_(None)
+    )
 
-    return {'objects': cash_flow_schema.dump(amounts, many=True).data}
+    return categorised.union_all(uncategorised)
 
 
 @bp.route('/incomes/', methods=['GET'])
@@ -121,21 +370,12 @@ def get_incomes():
 
     income_schema = IncomeSchema()
 
-    incomes = db.session.query(
-        func.sum(Record.amount).label("amount"),
-        Record.category_id
-    ).filter(
-        Record.record_type == Record.RECORD_TYPE_INCOME,
-    ).group_by(
-        Record.category_id
+    incomes = category_totals(
+        Record.RECORD_TYPE_INCOME,
+        date_range_filter_schema.data.get('date_from'),
+        date_range_filter_schema.data.get('date_to'),
     )
 
-    if 'date_from' in date_range_filter_schema.data:
-        incomes = incomes.filter(Record.date >= date_range_filter_schema.data['date_from'])
-
-    if 'date_to' in date_range_filter_schema.data:
-        incomes = incomes.filter(Record.date < date_range_filter_schema.data['date_to'])
-
     return {'objects': income_schema.dump(incomes, many=True).data}
 
 
@@ -150,19 +390,10 @@ def get_expenses():
 
     expense_schema = ExpenseSchema()
 
-    expenses = db.session.query(
-        func.sum(Record.amount).label("amount"),
-        Record.category_id
-    ).filter(
-        Record.record_type == Record.RECORD_TYPE_EXPENSE,
-    ).group_by(
-        Record.category_id
+    expenses = category_totals(
+        Record.RECORD_TYPE_EXPENSE,
+        date_range_filter_schema.data.get('date_from'),
+        date_range_filter_schema.data.get('date_to'),
     )
 
-    if 'date_from' in date_range_filter_schema.data:
-        expenses = expenses.filter(Record.date >= date_range_filter_schema.data['date_from'])
-
-    if 'date_to' in date_range_filter_schema.data:
-        expenses = expenses.filter(Record.date < date_range_filter_schema.data['date_to'])
-
     return {'objects': expense_schema.dump(expenses, many=True).data}
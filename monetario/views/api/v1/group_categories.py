@@ -11,26 +11,27 @@ from monetario.models import GroupCategory
 
 from monetario.views.api.v1 import bp
 from monetario.views.api.decorators import jsonify
+from monetario.views.api.decorators import change_marker
 from monetario.views.api.decorators import collection
+from monetario.views.api.decorators import conditional
+
+
+def get_group_categories_markers(**kwargs):
+    return [change_marker(GroupCategory, GroupCategory.group_id == current_user.group_id)]
 
 
 @bp.route('/group_categories/', methods=['GET'])
 @login_required
+@conditional(get_group_categories_markers)
 @jsonify()
-@collection(GroupCategory)
+@collection(GroupCategory, joins=((GroupCategory.group, False), ))
 def get_group_categories():
-    return (
-        GroupCategory.query
-        .options(
-            db.contains_eager(GroupCategory.group),
-        )
-        .join(Group, Group.id == GroupCategory.group_id)
-        .filter(GroupCategory.group_id == current_user.group_id)
-    )
+    return GroupCategory.query.filter(GroupCategory.group_id == current_user.group_id)
 
 
 @bp.route('/group_categories/<int:group_category_id>/', methods=['GET'])
 @login_required
+@conditional(get_group_categories_markers)
 @jsonify()
 def get_group_category(group_category_id):
     return (
@@ -79,7 +80,7 @@ def add_group_category():
             return {'errors': {'parent': 'Parent group_category with this id does not exist'}}, 400
 
     group_category = GroupCategory(**group_category_schema.data)
-    group_category.group = current_user.group
+    group_category.group_id = current_user.group_id
 
     db.session.add(group_category)
     db.session.commit()
@@ -11,26 +11,27 @@ from monetario.models import GroupCurrency
 
 from monetario.views.api.v1 import bp
 from monetario.views.api.decorators import jsonify
+from monetario.views.api.decorators import change_marker
 from monetario.views.api.decorators import collection
+from monetario.views.api.decorators import conditional
+
+
+def get_group_currencies_markers(**kwargs):
+    return [change_marker(GroupCurrency, GroupCurrency.group_id == current_user.group_id)]
 
 
 @bp.route('/group_currencies/', methods=['GET'])
 @login_required
+@conditional(get_group_currencies_markers)
 @jsonify()
-@collection(GroupCurrency)
+@collection(GroupCurrency, joins=((GroupCurrency.group, False), ))
 def get_group_currencies():
-    return (
-        GroupCurrency.query
-        .options(
-            db.contains_eager(GroupCurrency.group),
-        )
-        .join(Group, Group.id == GroupCurrency.group_id)
-        .filter(GroupCurrency.group_id == current_user.group_id)
-    )
+    return GroupCurrency.query.filter(GroupCurrency.group_id == current_user.group_id)
 
 
 @bp.route('/group_currencies/<int:group_currency_id>/', methods=['GET'])
 @login_required
+@conditional(get_group_currencies_markers)
 @jsonify()
 def get_group_currency(group_currency_id):
     return (
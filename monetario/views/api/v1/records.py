@@ -5,38 +5,80 @@ from flask import request
 from flask_login import login_required
 from flask_login import current_user
 
+from monetario.extensions import exchange_rates
 from monetario.models import db
 from monetario.models import Record
 from monetario.models import Account
 from monetario.models import GroupCurrency
 from monetario.models import GroupCategory
+from monetario.models import Transaction
+from monetario.models import User
+from monetario.search import match
 
 from monetario.views.api.v1 import bp
 from monetario.views.api.decorators import jsonify
+from monetario.views.api.decorators import change_marker
 from monetario.views.api.decorators import collection
+from monetario.views.api.decorators import conditional
+
+
+# every records query is bounded by the user_id index, amount and
+# record_type are only compared on the rows of the user
+RECORD_FILTERS = (
+    'id', 'date', 'amount', 'record_type', 'description',
+    'account_id', 'currency_id', 'category_id', 'transaction_id',
+)
+
+
+def get_records_base():
+    # the rows of get_records without its joins, to be counted
+    return Record.query.filter(
+        Record.user_id == current_user.id,
+        Record.account_id.isnot(None),
+        Record.currency_id.isnot(None),
+    )
+
+
+def search_records(q, dialect):
+    # records of transactions are found by the description of either
+    record_matches, record_relevance = match(Record, Record.description, q, dialect)
+    transaction_matches, transaction_relevance = match(
+        Transaction, Transaction.description, q, dialect, key=Record.transaction_id
+    )
+
+    if record_relevance is None:
+        return record_matches, None
+    return (
+        db.or_(record_matches, transaction_matches),
+        db.func.coalesce(record_relevance, 0) + db.func.coalesce(transaction_relevance, 0),
+    )
+
+
+def get_records_markers(**kwargs):
+    return [
+        change_marker(Record, Record.user_id == current_user.id),
+        change_marker(Account, Account.user_id == current_user.id),
+        change_marker(User, User.id == current_user.id),
+        change_marker(GroupCurrency, GroupCurrency.group_id == current_user.group_id),
+        change_marker(GroupCategory, GroupCategory.group_id == current_user.group_id),
+    ]
 
 
 @bp.route('/records/', methods=['GET'])
 @login_required
+@conditional(get_records_markers)
 @jsonify()
-@collection(Record, max_per_page=100)
+@collection(Record, max_per_page=100, base_query=get_records_base, filters=RECORD_FILTERS,
+            search=search_records, joins=(
+                (Record.account, False), (Record.currency, False), (Record.category, True),
+            ))
 def get_records():
-    return (
-        Record.query
-        .options(
-            db.contains_eager(Record.account),
-            db.contains_eager(Record.category),
-            db.contains_eager(Record.currency)
-        )
-        .join(Account, Account.id == Record.account_id)
-        .join(GroupCurrency, GroupCurrency.id == Record.currency_id)
-        .outerjoin(GroupCategory, GroupCategory.id == Record.category_id)
-        .filter(Record.user_id == current_user.id)
-    )
+    return get_records_base()
 
 
 @bp.route('/records/<int:record_id>/', methods=['GET'])
 @login_required
+@conditional(get_records_markers)
 @jsonify()
 def get_record(record_id):
     return (
@@ -104,7 +146,8 @@ def add_record():
         return {'errors': {'currency': 'Group currency with this id does not exist'}}, 400
 
     record = Record(**record_data)
-    record.user = current_user
+    record.user_id = current_user.id
+    exchange_rates.set_amount_base(record)
 
     db.session.add(record)
     db.session.commit()
@@ -162,7 +205,8 @@ def edit_record(record_id):
         if hasattr(record, field):
             setattr(record, field, value)
 
-    record.user = current_user
+    record.user_id = current_user.id
+    exchange_rates.set_amount_base(record)
 
     db.session.commit()
 
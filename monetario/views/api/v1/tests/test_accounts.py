@@ -1,8 +1,12 @@
+import datetime
+import decimal
 import json
 
 from flask import url_for
+from sqlalchemy import event
 
 from monetario.app import db
+from monetario.models import Record
 
 from monetario.views.api.v1.tests.fixtures import GroupCurrencyFactory
 from monetario.views.api.v1.tests.fixtures import UserFactory
@@ -191,6 +195,29 @@ class AccountsTest(BaseTestCase):
         )
         self.assertEqual(response.status_code, 404)
 
+    def test_delete_account_with_records(self):
+        db.session.execute('PRAGMA foreign_keys=ON')
+
+        account = self.accounts[0]
+        db.session.add(Record(
+            user=self.user, account=account, currency=self.currency,
+            date=datetime.datetime(2015, 6, 1), amount=decimal.Decimal('100'),
+            record_type=Record.RECORD_TYPE_INCOME
+        ))
+        db.session.commit()
+
+        url = url_for('api.v1.delete_account', account_id=account.id)
+        response = self.client.delete(
+            url, content_type='application/json', headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 204)
+
+        url = url_for('api.v1.delete_user', user_id=self.user.id)
+        response = self.client.delete(
+            url, content_type='application/json', headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 204)
+
     def test_get_account_wrong_token(self):
         response = self.client.get(
             url_for('api.v1.get_accounts'),
@@ -271,6 +298,35 @@ class AccountsTest(BaseTestCase):
         self.assertIn('objects', data)
         self.assertEqual(len(data['objects']), per_page)
 
+    def test_get_accounts_sparse_fields(self):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = self.client.get(
+                url_for('api.v1.get_accounts', per_page=5, expand=1, fields='name,currency',
+                        **{'fields[currency]': 'symbol'}),
+                headers={'Authentication-Token': self.token}
+            )
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(data['objects']), 5)
+        for item in data['objects']:
+            self.assertEqual(set(item), {'id', 'name', 'currency'})
+            self.assertEqual(item['currency'], {'id': self.currency.id, 'symbol': self.currency.symbol})
+
+        statements = [x for x in statements if 'FROM account' in x and 'count(' not in x]
+        self.assertEqual(len(statements), 1)
+        self.assertIn('JOIN group_currency', statements[0])
+        self.assertNotIn('JOIN user', statements[0])
+        self.assertNotIn('group_currency.name', statements[0])
+
     def test_get_accounts_five_per_page(self):
         per_page = 5
         response = self.client.get(
@@ -379,3 +435,64 @@ class AccountsTest(BaseTestCase):
             [x['name'] for x in data['objects']],
             sorted([x.name for x in self.accounts[-5:]], reverse=True)
         )
+
+    def test_get_accounts_not_modified(self):
+        url = url_for('api.v1.get_accounts', expand=1)
+        headers = {'Authentication-Token': self.token}
+
+        response = self.client.get(url, headers=headers)
+        self.assertEqual(response.status_code, 200)
+
+        headers['If-None-Match'] = response.headers['ETag']
+        response = self.client.get(url, headers=headers)
+        self.assertEqual(response.status_code, 304)
+
+        # the ETag is made per user
+        response = self.client.get(url, headers={
+            'Authentication-Token': self.token_another, 'If-None-Match': headers['If-None-Match']
+        })
+        self.assertEqual(response.status_code, 200)
+
+        self.accounts[0].name = 'Renamed'
+        db.session.commit()
+
+        response = self.client.get(url, headers=headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_account_balance_series(self):
+        account = self.accounts[0]
+        for date, amount in (('2015-06-01', '100'), ('2015-06-03', '-30'), ('2015-07-01', '5')):
+            db.session.add(Record(
+                user=self.user, account=account, currency=self.currency,
+                date=datetime.datetime.strptime(date, '%Y-%m-%d'), amount=decimal.Decimal(amount),
+                record_type=Record.RECORD_TYPE_INCOME
+            ))
+        db.session.commit()
+
+        url = url_for(
+            'api.v1.get_account_balance_series', account_id=account.id,
+            date_from='2015-05-31', date_to='2015-06-03'
+        )
+        response = self.client.get(url, headers={'Authentication-Token': self.token})
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([(x['date'], x['balance']) for x in data['objects']], [
+            ('2015-05-31', 0.0), ('2015-06-01', 100.0), ('2015-06-02', 100.0),
+            ('2015-06-03', 70.0),
+        ])
+
+        response = self.client.get(url, headers={'Authentication-Token': self.token_another})
+        self.assertEqual(response.status_code, 404)
+
+    def test_get_account_balance_series_wrong_dates(self):
+        for date_from, date_to in (('2015-06-03', '2015-06-01'), ('2012-01-01', '2015-01-01')):
+            response = self.client.get(
+                url_for(
+                    'api.v1.get_account_balance_series', account_id=self.accounts[0].id,
+                    date_from=date_from, date_to=date_to
+                ),
+                headers={'Authentication-Token': self.token}
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('errors', json.loads(response.data.decode('utf-8')))
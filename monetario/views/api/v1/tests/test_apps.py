@@ -135,6 +135,36 @@ class AppsTest(BaseTestCase):
         self.assertIn('name', data)
         self.assertEqual(data['name'], 'Groceries')
 
+    def test_update_app_wrong_login_limit(self):
+        for limit in (
+            {'login_limit': -1},
+            {'login_limit': 0},
+            {'login_limit': 10 ** 9},
+            {'login_limit_period': 0},
+            {'login_limit_period': 86400 * 365},
+        ):
+            response = self.client.put(
+                url_for('api.v1.edit_app', app_id=self.apps[1].id),
+                data=json.dumps(limit),
+                content_type='application/json',
+                headers={'Authentication-Token': self.token}
+            )
+            self.assertEqual(response.status_code, 400)
+
+            data = json.loads(response.data.decode('utf-8'))
+            self.assertIn(list(limit)[0], data['errors'])
+
+        response = self.client.put(
+            url_for('api.v1.edit_app', app_id=self.apps[1].id),
+            data=json.dumps({'login_limit': 10, 'login_limit_period': 60}),
+            content_type='application/json',
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual((data['login_limit'], data['login_limit_period']), (10, 60))
+
     def test_delete_app_wrong_token(self):
         url = url_for('api.v1.delete_app', app_id=self.apps[0].id)
         response = self.client.delete(
@@ -0,0 +1,282 @@
+import datetime
+import decimal
+import json
+
+from unittest import mock
+
+from flask import url_for
+from pytz import UTC
+
+from monetario.app import db
+from monetario.extensions import exchange_rates
+
+from monetario.models import CurrencyRate
+from monetario.models import Record
+from monetario.views.api.v1 import balance
+from monetario.views.api.v1.tests.fixtures import AccountFactory
+from monetario.views.api.v1.tests.fixtures import GroupCategoryFactory
+from monetario.views.api.v1.tests.fixtures import GroupCurrencyFactory
+from monetario.views.api.v1.tests.fixtures import UserFactory
+from monetario.views.api.v1.tests.fixtures import RecordFactory
+from monetario.tests import BaseTestCase
+
+
+class BalanceTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.currency = GroupCurrencyFactory.create()
+        db.session.add(self.currency)
+
+        self.user = UserFactory.create()
+        db.session.add(self.user)
+
+        self.user_another = UserFactory.create()
+        db.session.add(self.user_another)
+
+        self.account = AccountFactory.create(user=self.user, currency=self.currency)
+        db.session.add(self.account)
+
+        db.session.commit()
+
+        for user, date, amount, record_type in (
+            (self.user, datetime.datetime(2015, 5, 31, 23, 0), '100', Record.RECORD_TYPE_INCOME),
+            (self.user, datetime.datetime(2015, 6, 1), '50', Record.RECORD_TYPE_INCOME),
+            (self.user, datetime.datetime(2015, 6, 30, 18, 0), '-20', Record.RECORD_TYPE_EXPENSE),
+            (self.user, datetime.datetime(2015, 7, 1), '-5', Record.RECORD_TYPE_EXPENSE),
+            (self.user_another, datetime.datetime(2015, 6, 10), '1000',
+             Record.RECORD_TYPE_INCOME),
+        ):
+            db.session.add(RecordFactory.create(
+                user=user, account=self.account, currency=self.currency,
+                date=date.replace(tzinfo=UTC), amount=decimal.Decimal(amount),
+                record_type=record_type
+            ))
+        db.session.commit()
+
+        self.api_app = self.create_api_app(self.user)
+        self.token = self.get_token(self.api_app, self.user)
+
+    def get_balance(self, year, month):
+        response = self.client.get(
+            url_for('api.v1.get_balance', year=year, month=month),
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        return json.loads(response.data.decode('utf-8'))
+
+    def test_get_balance(self):
+        # only the records of the user, up to the end of the last day
+        self.assertEqual(self.get_balance(2015, 6), {
+            'cash_flow': 30.0,
+            'income': 50.0,
+            'expense': -20.0,
+            'date': '2015-06-01',
+            'start_balance': 100.0,
+            'end_balance': 130.0,
+        })
+
+    def test_get_balance_without_records(self):
+        self.assertEqual(self.get_balance(2015, 8), {
+            'cash_flow': 0.0,
+            'income': 0.0,
+            'expense': 0.0,
+            'date': '2015-08-31',
+            'start_balance': 125.0,
+            'end_balance': 125.0,
+        })
+
+    def test_get_cash_flows(self):
+        response = self.client.get(
+            url_for('api.v1.get_cash_flows', date_from='2015-05-15', date_to='2015-07-01'),
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # the partial month of May comes from the records, June from its rollup
+        self.assertEqual([
+            (x['date'], x['income'], x['expense'], x['cash_flow'])
+            for x in json.loads(response.data.decode('utf-8'))['objects']
+        ], [
+            ('2015-05-01', 100.0, 0.0, 100.0),
+            ('2015-06-01', 50.0, -20.0, 30.0),
+        ])
+
+    def test_get_balance_after_backdated_record(self):
+        self.assertEqual(self.get_balance(2015, 7)['start_balance'], 130.0)
+
+        category = GroupCategoryFactory.create()
+        db.session.add(category)
+        db.session.commit()
+
+        response = self.client.post(
+            url_for('api.v1.add_record'),
+            data=json.dumps({
+                'amount': 40,
+                'record_type': Record.RECORD_TYPE_EXPENSE,
+                'currency': self.currency.id,
+                'account': self.account.id,
+                'category': category.id,
+                'date': '2015-04-15T10:00:00+00:00',
+            }),
+            content_type='application/json',
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 201)
+
+        # the checkpoints of the later months moved with it
+        self.assertEqual(self.get_balance(2015, 6)['start_balance'], 60.0)
+        self.assertEqual(self.get_balance(2015, 7)['start_balance'], 90.0)
+
+    def test_get_expenses(self):
+        food = GroupCategoryFactory.create(name='Food', colour='red', logo='food.png')
+        db.session.add(food)
+        db.session.commit()
+        groceries = GroupCategoryFactory.create(
+            name='Groceries', colour='green', logo='groceries.png', parent_id=food.id
+        )
+        db.session.add(groceries)
+        db.session.commit()
+        fruit = GroupCategoryFactory.create(
+            name='Fruit', colour='yellow', logo='fruit.png', parent_id=groceries.id
+        )
+        db.session.add(fruit)
+        db.session.commit()
+
+        for category, amount in ((food, '-1'), (groceries, '-2'), (fruit, '-4'), (fruit, '-8')):
+            db.session.add(RecordFactory.create(
+                user=self.user, account=self.account, currency=self.currency,
+                category_id=category.id, date=datetime.datetime(2015, 6, 10, tzinfo=UTC),
+                amount=decimal.Decimal(amount), record_type=Record.RECORD_TYPE_EXPENSE
+            ))
+        db.session.commit()
+
+        response = self.client.get(
+            url_for('api.v1.get_expenses', date_from='2015-06-01', date_to='2015-07-01'),
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # a row for every level, subtotals with the descendants, the records
+        # of the setup have no category
+        objects = json.loads(response.data.decode('utf-8'))['objects']
+        self.assertEqual(sorted(
+            [
+                (x['name'], x['colour'], x['logo'], x['parent_id'], x['amount'], x['subtotal'])
+                for x in objects
+            ],
+            key=lambda x: x[-1]
+        ), [
+            (None, None, None, None, -20.0, -20.0),
+            ('Food', 'red', 'food.png', None, -1.0, -15.0),
+            ('Groceries', 'green', 'groceries.png', food.id, -2.0, -14.0),
+            ('Fruit', 'yellow', 'fruit.png', groceries.id, -12.0, -12.0),
+        ])
+
+    def test_get_balance_in_currency(self):
+        self.currency.symbol = 'USD'
+        euro = GroupCurrencyFactory.create(symbol='EUR')
+        db.session.add(euro)
+        for day, rate in ((datetime.datetime(2015, 1, 1), '2'),
+                          (datetime.datetime(2015, 6, 15), '4')):
+            db.session.add(CurrencyRate(
+                base_currency='EUR', currency='USD', rate=decimal.Decimal(rate), date_created=day
+            ))
+        db.session.add(RecordFactory.create(
+            user=self.user, account=self.account, currency=euro,
+            date=datetime.datetime(2015, 6, 20, tzinfo=UTC), amount=decimal.Decimal('10'),
+            record_type=Record.RECORD_TYPE_INCOME
+        ))
+        db.session.commit()
+
+        response = self.client.get(
+            url_for('api.v1.get_balance', year=2015, month=6, currency=euro.id),
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # dollars at 2 a euro until June 15th, at 4 after it
+        self.assertEqual(json.loads(response.data.decode('utf-8')), {
+            'cash_flow': 30.0,
+            'income': 35.0,
+            'expense': -5.0,
+            'date': '2015-06-01',
+            'start_balance': 50.0,
+            'end_balance': 80.0,
+        })
+
+    def test_get_cash_flows_in_currency(self):
+        self.currency.symbol = 'USD'
+        db.session.add(CurrencyRate(
+            base_currency='USD', currency='EUR', rate=decimal.Decimal('0.5'),
+            date_created=datetime.datetime(2015, 1, 1)
+        ))
+        euro = GroupCurrencyFactory.create(symbol='EUR')
+        db.session.add(euro)
+        db.session.commit()
+
+        url = url_for(
+            'api.v1.get_cash_flows', date_from='2015-06-01', date_to='2015-07-01',
+            currency=euro.id
+        )
+        response = self.client.get(url, headers={'Authentication-Token': self.token})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['objects'], [
+            {'date': '2015-06-01', 'income': 25.0, 'expense': -10.0, 'cash_flow': 15.0},
+        ])
+
+        for currency in (euro.id + 1, 'euro'):
+            response = self.client.get(
+                url_for('api.v1.get_cash_flows', currency=currency),
+                headers={'Authentication-Token': self.token}
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_get_cash_flows_without_rate(self):
+        euro = GroupCurrencyFactory.create(symbol='EUR')
+        self.currency.symbol = 'USD'
+        db.session.add(euro)
+        db.session.commit()
+
+        response = self.client.get(
+            url_for('api.v1.get_cash_flows', currency=euro.id),
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('currency', json.loads(response.data.decode('utf-8'))['errors'])
+
+    def test_get_balance_in_base_currency(self):
+        self.currency.symbol = 'USD'
+        euro = GroupCurrencyFactory.create(symbol='EUR')
+        db.session.add(euro)
+        rate = CurrencyRate(
+            base_currency='EUR', currency='USD', rate=decimal.Decimal('2'),
+            date_created=datetime.datetime(2015, 1, 1)
+        )
+        db.session.add(rate)
+        db.session.commit()
+
+        url = url_for('api.v1.get_balance', year=2015, month=6, currency=euro.id)
+        expected = {
+            'cash_flow': 15.0,
+            'income': 25.0,
+            'expense': -10.0,
+            'date': '2015-06-01',
+            'start_balance': 50.0,
+            'end_balance': 65.0,
+        }
+
+        # converted on the fly until the records have an amount_base
+        response = self.client.get(url, headers={'Authentication-Token': self.token})
+        self.assertEqual(json.loads(response.data.decode('utf-8')), expected)
+
+        list(exchange_rates.backfill(Record))
+        db.session.delete(rate)
+        db.session.commit()
+
+        # summed in one query without any rate, nor a scan by day
+        with mock.patch.object(balance, 'converted_days', side_effect=AssertionError):
+            response = self.client.get(url, headers={'Authentication-Token': self.token})
+        self.assertEqual(json.loads(response.data.decode('utf-8')), expected)
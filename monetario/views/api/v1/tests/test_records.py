@@ -1,10 +1,17 @@
+import datetime
+import decimal
+import gzip
 import json
 # from pytz import UTC
 
 from flask import url_for
+from sqlalchemy import event
+from werkzeug.urls import url_parse
 
 from monetario.app import db
+from monetario.extensions import count_cache
 
+from monetario.models import CurrencyRate
 from monetario.models import Record
 from monetario.views.api.v1.tests.fixtures import AccountFactory
 from monetario.views.api.v1.tests.fixtures import GroupCurrencyFactory
@@ -245,6 +252,43 @@ class RecordsTest(BaseTestCase):
         self.assertEqual(data['category']['id'], self.category.id)
         self.assertEqual(data['user']['id'], self.user.id)
 
+    def test_create_new_record_amount_base(self):
+        self.currency.symbol = 'GBP'
+        db.session.add(CurrencyRate(
+            base_currency='EUR', currency='GBP', rate=decimal.Decimal('0.5'),
+            date_created=datetime.datetime(2015, 1, 1)
+        ))
+        db.session.commit()
+
+        response = self.client.post(
+            url_for('api.v1.add_record'),
+            data=json.dumps({
+                'amount': 200,
+                'record_type': Record.RECORD_TYPE_EXPENSE,
+                'currency': self.currency.id,
+                'account': self.account.id,
+                'category': self.category.id,
+            }),
+            content_type='application/json',
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 201)
+
+        record = Record.query.get(json.loads(response.data.decode('utf-8'))['id'])
+        self.assertEqual(float(record.amount_base), -400.0)
+        self.assertEqual(float(record.base_rate), 2.0)
+
+        response = self.client.put(
+            url_for('api.v1.edit_record', record_id=record.id),
+            data=json.dumps({'amount': 50, 'record_type': Record.RECORD_TYPE_INCOME}),
+            content_type='application/json',
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        record = Record.query.get(record.id)
+        self.assertEqual(float(record.amount_base), 100.0)
+
     def test_update_record_wrong_currency(self):
         response = self.client.put(
             url_for('api.v1.edit_record', record_id=self.records[1].id),
@@ -659,3 +703,478 @@ class RecordsTest(BaseTestCase):
     #         [x['date'] for x in data['objects']],
     #         sorted([x.date.isoformat() for x in self.records[-5:]], reverse=True)
     #     )
+
+    def get_records_by_cursor(self, per_page, **kwargs):
+        ids = []
+        cursor = ''
+
+        while cursor is not None:
+            response = self.client.get(
+                url_for('api.v1.get_records', per_page=per_page, cursor=cursor, expand=1, **kwargs),
+                content_type='application/json',
+                headers={'Authentication-Token': self.token}
+            )
+            self.assertEqual(response.status_code, 200)
+
+            data = json.loads(response.data.decode('utf-8'))
+
+            self.assertNotIn('page', data['meta'])
+            self.assertLessEqual(len(data['objects']), per_page)
+
+            ids.extend(x['id'] for x in data['objects'])
+            cursor = data['meta']['next_cursor']
+
+        return ids
+
+    def test_get_records_cursor(self):
+        ids = self.get_records_by_cursor(7)
+
+        self.assertEqual(ids, sorted(x.id for x in self.records))
+
+    def test_get_records_cursor_sorting(self):
+        ids = self.get_records_by_cursor(7, sort='date,desc')
+
+        self.assertEqual(
+            ids, [x.id for x in sorted(self.records, key=lambda x: (x.date, x.id), reverse=True)]
+        )
+
+        # many ties, broken by id
+        ids = self.get_records_by_cursor(4, sort='record_type,asc;amount,desc')
+
+        self.assertEqual(
+            ids, [x.id for x in sorted(self.records, key=lambda x: (x.record_type, -x.amount, -x.id))]
+        )
+
+    def test_get_records_cursor_nullable_sorting(self):
+        for record in self.records[::3]:
+            record.description = 'Record {}'.format(record.id % 4)
+        db.session.commit()
+
+        for direction in ('asc', 'desc'):
+            ids = self.get_records_by_cursor(4, sort='description,{}'.format(direction))
+
+            self.assertEqual(len(ids), len(self.records))
+            self.assertEqual(len(set(ids)), len(self.records))
+
+    def test_get_records_wrong_cursor(self):
+        for cursor in ('abc', 'W10', 'WyJhIiwgMV0'):
+            response = self.client.get(
+                url_for('api.v1.get_records', cursor=cursor),
+                content_type='application/json',
+                headers={'Authentication-Token': self.token}
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def get_records_page(self, **kwargs):
+        response = self.client.get(
+            url_for('api.v1.get_records', **kwargs),
+            content_type='application/json',
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        return json.loads(response.data.decode('utf-8'))
+
+    def links(self, data):
+        # the links of the pages of a response, but for the stream argument
+        links = {}
+        for key, value in data['meta'].items():
+            if key.endswith('_url') and value:
+                url = url_parse(value)
+                args = url.decode_query()
+                self.assertEqual(args.poplist('stream'), ['1'] if 'stream' in value else [])
+                value = (url.path, sorted(args.items(multi=True)))
+            links[key] = value
+        return links
+
+    def assertSamePage(self, data, expected):
+        self.assertEqual(data['objects'], expected['objects'])
+        self.assertEqual(self.links(data), self.links(expected))
+
+    def test_get_records_count_none(self):
+        data = self.get_records_page(per_page=10, page=3, count='none')
+
+        self.assertIsNone(data['meta']['total'])
+        self.assertIsNone(data['meta']['pages'])
+        self.assertIsNone(data['meta']['next_url'])
+        self.assertIsNone(data['meta']['last_url'])
+        self.assertIsNotNone(data['meta']['prev_url'])
+        self.assertEqual(len(data['objects']), 10)
+
+        data = self.get_records_page(per_page=10, page=2, count='none')
+
+        self.assertIn('count=none', data['meta']['next_url'])
+
+    def test_get_records_count_estimate(self):
+        data = self.get_records_page(per_page=10, count='estimate')
+
+        self.assertEqual(data['meta']['total'], len(self.records))
+
+        count_cache.set(list(count_cache._entries)[0], 1000)
+
+        data = self.get_records_page(per_page=10, count='estimate')
+
+        self.assertEqual(data['meta']['total'], 1000)
+
+        # writes to the user's records drop the cached count
+        record = RecordFactory.create(account=self.account, currency=self.currency, user=self.user)
+        db.session.add(record)
+        db.session.commit()
+
+        data = self.get_records_page(per_page=10, count='estimate')
+
+        self.assertEqual(data['meta']['total'], len(self.records) + 1)
+
+    def test_get_records_count_without_joins(self):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            data = self.get_records_page(per_page=10, filter='record_type,eq,1')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+        self.assertEqual(
+            data['meta']['total'], len([x for x in self.records if x.record_type == 1])
+        )
+
+        # the ETag markers are read along with max(date_modified)
+        counts = [x for x in statements if 'count(' in x and 'max(' not in x]
+
+        self.assertEqual(len(counts), 1)
+        self.assertNotIn('JOIN', counts[0])
+
+    def get_records_statements(self, **kwargs):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            data = self.get_records_page(**kwargs)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+        return data, [x for x in statements if 'FROM record' in x and 'count(' not in x]
+
+    def test_get_records_sparse_fields(self):
+        data, statements = self.get_records_statements(
+            per_page=5, expand=1, fields='amount,account', **{'fields[account]': 'name'}
+        )
+
+        self.assertEqual(len(data['objects']), 5)
+        for item in data['objects']:
+            self.assertEqual(set(item), {'id', 'amount', 'account'})
+            self.assertEqual(item['account'], {'id': self.account.id, 'name': self.account.name})
+
+        self.assertEqual(len(statements), 1)
+        self.assertIn('JOIN account', statements[0])
+        self.assertNotIn('group_currency', statements[0])
+        self.assertNotIn('group_category', statements[0])
+        self.assertNotIn('record.description', statements[0])
+
+    def test_get_records_fields_links(self):
+        fields = {'fields': 'amount,account', 'fields[account]': 'name'}
+
+        for kwargs in ({'page': 2}, {'cursor': ''}):
+            data = self.get_records_page(per_page=5, expand=1, **dict(fields, **kwargs))
+
+            for key in ('next_url', 'first_url'):
+                args = url_parse(data['meta'][key]).decode_query()
+                self.assertEqual({name: args[name] for name in fields}, fields)
+
+    def test_get_records_nested_fields(self):
+        data = self.get_records_page(per_page=5, expand=1, **{'fields[category]': 'name,parent'})
+
+        for item in data['objects']:
+            self.assertIn('amount', item)
+            # narrowed down, never widened beyond the declared fields
+            self.assertEqual(item['category'], {'id': self.category.id, 'name': self.category.name})
+
+    def test_get_records_urls_only_load_ids(self):
+        data, statements = self.get_records_statements(per_page=5)
+
+        self.assertEqual(len(data['objects']), 5)
+        self.assertEqual(len(statements), 1)
+        self.assertNotIn('JOIN', statements[0])
+        self.assertNotIn('record.amount', statements[0])
+
+    def get_records_stream(self, headers=None, **kwargs):
+        headers = dict(headers or {}, **{'Authentication-Token': self.token})
+        response = self.client.get(url_for('api.v1.get_records', **kwargs), headers=headers)
+        self.assertEqual(response.status_code, 200)
+
+        return response
+
+    def test_get_records_stream(self):
+        for kwargs in (
+            {'per_page': 7},
+            {'per_page': 7, 'page': 2, 'expand': 1},
+            {'per_page': 7, 'page': 5, 'expand': 1, 'sort': 'date,desc'},
+            {'per_page': 10, 'page': 2, 'count': 'none'},
+            {'per_page': 10, 'page': 3, 'count': 'none', 'expand': 1, 'fields': 'amount'},
+            {'per_page': 7, 'cursor': '', 'expand': 1},
+        ):
+            response = self.get_records_stream(stream=1, **kwargs)
+
+            self.assertEqual(response.mimetype, 'application/json')
+            data = json.loads(response.data.decode('utf-8'))
+            self.assertSamePage(data, self.get_records_page(**kwargs))
+
+            # the links stream the pages alike
+            self.assertIn('stream=1', data['meta']['first_url'])
+
+    def test_get_records_stream_cursor(self):
+        ids = []
+        cursor = ''
+
+        while cursor is not None:
+            response = self.get_records_stream(stream=1, per_page=7, cursor=cursor, expand=1)
+            data = json.loads(response.data.decode('utf-8'))
+
+            ids.extend(x['id'] for x in data['objects'])
+            cursor = data['meta']['next_cursor']
+
+        self.assertEqual(ids, sorted(x.id for x in self.records))
+
+    def test_get_records_ndjson(self):
+        response = self.get_records_stream(
+            headers={'Accept': 'application/x-ndjson'}, per_page=7, page=2, expand=1
+        )
+
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+
+        lines = response.data.decode('utf-8').split('\n')
+        self.assertEqual(lines[-1], '')
+
+        lines = [json.loads(x) for x in lines[:-1]]
+        data = self.get_records_page(per_page=7, page=2, expand=1)
+
+        self.assertEqual(lines[:-1], data['objects'])
+        self.assertEqual(lines[-1], {'meta': data['meta']})
+
+    def test_get_records_stream_past_last_page(self):
+        for kwargs in ({}, {'count': 'none'}):
+            response = self.client.get(
+                url_for('api.v1.get_records', stream=1, per_page=10, page=4, **kwargs),
+                headers={'Authentication-Token': self.token}
+            )
+            self.assertEqual(response.status_code, 404)
+
+    def test_get_records_compact(self):
+        response = self.client.get(
+            url_for('api.v1.get_records', per_page=2, expand=1),
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/json')
+
+        body = response.data.decode('utf-8')
+
+        self.assertNotIn('\n', body)
+        self.assertTrue(body.startswith('{"meta":{'))
+
+    def get_records_etag(self, etag=None, **kwargs):
+        headers = {'Authentication-Token': self.token}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+
+        return self.client.get(url_for('api.v1.get_records', **kwargs), headers=headers)
+
+    def test_get_records_not_modified(self):
+        response = self.get_records_etag(per_page=5, expand=1)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response.headers['ETag']
+
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = self.get_records_etag(etag, per_page=5, expand=1)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(len([x for x in statements if 'record' in x]), 1)
+
+    def test_get_records_etag_changes(self):
+        # markers only cover the accounts of the user
+        self.account.user = self.user
+        db.session.commit()
+
+        etag = self.get_records_etag(per_page=5).headers['ETag']
+
+        self.assertNotEqual(self.get_records_etag(per_page=6).headers['ETag'], etag)
+        response = self.get_records_etag(per_page=5, stream=1)
+        response.get_data()
+
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+        for change in (
+            lambda: setattr(self.records[-1], 'description', 'Changed'),
+            lambda: db.session.delete(self.records[0]),
+            lambda: setattr(self.account, 'name', 'Renamed'),
+        ):
+            change()
+            db.session.commit()
+
+            response = self.get_records_etag(etag, per_page=5)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.headers['ETag'], etag)
+
+            etag = response.headers['ETag']
+            self.assertEqual(self.get_records_etag(etag, per_page=5).status_code, 304)
+
+    def test_get_record_not_modified(self):
+        url = url_for('api.v1.get_record', record_id=self.records[0].id)
+        headers = {'Authentication-Token': self.token}
+
+        response = self.client.get(url, headers=headers)
+        self.assertEqual(response.status_code, 200)
+
+        headers['If-None-Match'] = response.headers['ETag']
+        response = self.client.get(url, headers=headers)
+        self.assertEqual(response.status_code, 304)
+
+    def test_get_records_gzip(self):
+        expected = self.get_records_page(per_page=20, expand=1)
+
+        for kwargs in ({}, {'stream': 1}):
+            response = self.client.get(
+                url_for('api.v1.get_records', per_page=20, expand=1, **kwargs),
+                headers={'Authentication-Token': self.token, 'Accept-Encoding': 'gzip'}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertSamePage(json.loads(gzip.decompress(response.data).decode('utf-8')), expected)
+
+            # another representation, another ETag
+            identity = self.get_records_etag(per_page=20, expand=1, **kwargs)
+            identity.get_data()
+
+            self.assertNotEqual(response.headers['ETag'], identity.headers['ETag'])
+
+    def test_get_records_typed_filters(self):
+        amounts = sorted(x.amount for x in self.records)
+        middle = amounts[len(amounts) // 2]
+
+        data = self.get_records_page(per_page=100, filter='amount,ge,{}'.format(middle))
+        self.assertEqual(data['meta']['total'], len([x for x in amounts if x >= middle]))
+
+        dates = sorted(x.date for x in self.records)
+        data = self.get_records_page(
+            per_page=100, filter='date,gt,{};record_type,in,0,1'.format(dates[9].isoformat())
+        )
+        self.assertEqual(data['meta']['total'], len([x for x in dates if x > dates[9]]))
+
+        data = self.get_records_page(per_page=100, filter='category_id,eq,null')
+        self.assertEqual(data['meta']['total'], 0)
+
+    def test_get_records_rejected_filters(self):
+        for filter in (
+            'payment_method,eq,1',
+            'user_id,eq,1',
+            'account,eq,1',
+            'to_json,eq,1',
+            'amount,gt,abc',
+            'date,lt,yesterday',
+            'amount,between,1',
+            'amount,gt',
+            'amount,lt,null',
+            'description,like,%coffee%',
+            'description,like,co%',
+            'amount,like,100%',
+        ):
+            response = self.client.get(
+                url_for('api.v1.get_records', filter=filter),
+                headers={'Authentication-Token': self.token}
+            )
+            self.assertEqual(response.status_code, 400, filter)
+
+            data = json.loads(response.data.decode('utf-8'))
+            self.assertIn('filter', data['errors'])
+
+    def test_get_records_like_prefix(self):
+        self.records[0].description = 'Coffee with milk'
+        db.session.commit()
+
+        data = self.get_records_page(per_page=100, filter='description,like,Coffee%')
+
+        self.assertEqual(data['meta']['total'], 1)
+
+    def test_get_records_search(self):
+        self.records[0].description = 'Groceries for the week, some coffee among them'
+        self.records[1].description = 'Coffee, coffee'
+        self.records[2].description = 'Coffee beans'
+        self.records[3].description = 'Tea'
+        db.session.commit()
+
+        data = self.get_records_page(q='coffee')
+
+        # ranked by relevance
+        self.assertEqual(data['meta']['total'], 3)
+        self.assertEqual(data['objects'][0], self.records[1].resource_url)
+        self.assertEqual(
+            set(data['objects']), {x.resource_url for x in self.records[:3]}
+        )
+
+        data = self.get_records_page(q='COFFEE beans!')
+        self.assertEqual(data['objects'], [self.records[2].resource_url])
+
+        data = self.get_records_page(q='"')
+        self.assertEqual(data['meta']['total'], 0)
+
+    def test_get_records_search_transaction(self):
+        self.transaction.description = 'Rent for March'
+        self.records[5].transaction = self.transaction
+        db.session.commit()
+
+        data = self.get_records_page(q='rent')
+
+        self.assertEqual(data['objects'], [self.records[5].resource_url])
+
+    def test_get_records_search_updates(self):
+        self.records[0].description = 'Coffee'
+        db.session.commit()
+
+        self.records[0].description = 'Tea'
+        db.session.commit()
+
+        self.assertEqual(self.get_records_page(q='coffee')['meta']['total'], 0)
+        self.assertEqual(self.get_records_page(q='tea')['meta']['total'], 1)
+
+        db.session.delete(self.records[0])
+        db.session.commit()
+
+        self.assertEqual(self.get_records_page(q='tea')['meta']['total'], 0)
+
+    def test_get_records_search_filter_sort(self):
+        for record in self.records[:6]:
+            record.description = 'Coffee'
+        db.session.commit()
+
+        data = self.get_records_page(
+            q='coffee', filter='date,le,{}'.format(self.records[3].date.isoformat()),
+            sort='date,desc', per_page=2
+        )
+
+        self.assertEqual(data['meta']['total'], 4)
+        self.assertEqual(
+            data['objects'], [x.resource_url for x in reversed(self.records[2:4])]
+        )
+        self.assertIn('q=coffee', data['meta']['next_url'])
+
+        data = self.get_records_page(q='coffee', sort='date', cursor='', per_page=4)
+
+        self.assertEqual(data['objects'], [x.resource_url for x in self.records[:4]])
+        self.assertIn('q=coffee', data['meta']['next_url'])
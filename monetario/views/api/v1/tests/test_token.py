@@ -1,8 +1,17 @@
 import json
+import threading
 
 from flask import url_for
+from sqlalchemy import event
 
 from monetario.app import db
+from monetario.auth import RevocationSet
+from monetario.auth import token_digest
+from monetario.extensions import auth_cache
+from monetario.extensions import login_throttle
+from monetario.extensions import password_hasher
+from monetario.extensions import token_revocations
+from monetario.models import Token
 
 from monetario.views.api.v1.tests.fixtures import UserFactory
 from monetario.tests import BaseTestCase
@@ -85,6 +94,148 @@ class TokensTest(BaseTestCase):
 
         self.assertEqual(response.status_code, 200)
 
+    def count_statements(self, f):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = f()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+        return response, statements
+
+    def test_get_token_statements(self):
+        user = UserFactory.create()
+        db.session.add(user)
+        db.session.commit()
+
+        data = json.dumps({
+            'email': user.email,
+            'password': '111',
+            'secret': self.api_app.secret,
+        })
+
+        for x in range(2):
+            response, statements = self.count_statements(lambda: self.client.post(
+                url_for('api.v1.get_token'),
+                data=data,
+                content_type='application/json',
+            ))
+            self.assertEqual(response.status_code, 200)
+
+            # one SELECT for app, user and token plus one INSERT or UPDATE
+            self.assertEqual(len(statements), 2)
+            self.assertTrue(statements[0].startswith('SELECT'))
+
+    def test_get_token_upgrades_password_hash(self):
+        password_hasher.method = 'pbkdf2:sha256:2000'
+
+        response = self.client.post(
+            url_for('api.v1.get_token'),
+            data=json.dumps({
+                'email': self.user.email,
+                'password': '111',
+                'secret': self.api_app.secret,
+            }),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+
+        db.session.refresh(self.user)
+
+        self.assertTrue(self.user.password_hash.startswith('pbkdf2:sha256:2000$'))
+        self.assertTrue(self.user.verify_password('111'))
+
+    def test_get_token_hashing_busy(self):
+        password_hasher.init_app(self.app)
+        password_hasher._slots = threading.BoundedSemaphore(0)
+
+        response = self.client.post(
+            url_for('api.v1.get_token'),
+            data=json.dumps({
+                'email': self.user.email,
+                'password': '111',
+                'secret': self.api_app.secret,
+            }),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+    def post_login(self, email, password='111'):
+        return self.client.post(
+            url_for('api.v1.get_token'),
+            data=json.dumps({
+                'email': email,
+                'password': password,
+                'secret': self.api_app.secret,
+            }),
+            content_type='application/json',
+        )
+
+    def test_get_token_throttled_per_email(self):
+        attempts = self.app.config['LOGIN_THROTTLE_LIMITS']['email'][0]
+
+        for x in range(attempts):
+            self.assertEqual(self.post_login(self.user.email.upper(), '1234567').status_code, 400)
+
+        response, statements = self.count_statements(lambda: self.post_login(self.user.email))
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+        self.assertEqual(statements, [])
+        self.assertEqual(login_throttle.stats()['email']['rejected'], 1)
+
+        other = UserFactory.create()
+        db.session.add(other)
+        db.session.commit()
+
+        self.assertEqual(self.post_login(other.email).status_code, 200)
+
+    def test_get_token_throttled_per_app(self):
+        self.api_app.login_limit = 2
+        self.api_app.login_limit_period = 60
+        db.session.add(self.api_app)
+        db.session.commit()
+
+        users = UserFactory.create_batch(3)
+        db.session.add_all(users)
+        db.session.commit()
+
+        self.assertEqual(self.post_login(users[0].email).status_code, 200)
+        self.assertEqual(self.post_login(users[1].email).status_code, 200)
+
+        response = self.post_login(users[2].email)
+        self.assertEqual(response.status_code, 429)
+
+    def test_get_token_app_limit_applies_at_once(self):
+        self.api_app.login_limit = 1
+        self.api_app.login_limit_period = 60
+        db.session.add(self.api_app)
+        db.session.commit()
+
+        user = UserFactory.create()
+        db.session.add(user)
+        db.session.commit()
+
+        # counted against the limit of the app, though no user matches
+        self.assertEqual(self.post_login('nobody@example.com').status_code, 400)
+        self.assertEqual(self.post_login(user.email).status_code, 429)
+
+        # and changed for the next login
+        response = self.client.put(
+            url_for('api.v1.edit_app', app_id=self.api_app.id),
+            data=json.dumps({'login_limit': 5}),
+            content_type='application/json',
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.post_login(user.email).status_code, 200)
+
     def test_refresh_token_missed_token(self):
         response = self.client.put(
             url_for('api.v1.refresh_token'),
@@ -113,6 +264,48 @@ class TokensTest(BaseTestCase):
         self.assertIn('token', data)
         self.assertNotEqual(data['token'], self.token)
 
+    def test_refresh_token_invalidates_cached_token(self):
+        response = self.client.get(
+            url_for('api.v1.get_users'),
+            content_type='application/json',
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.put(
+            url_for('api.v1.refresh_token'),
+            content_type='application/json',
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(
+            url_for('api.v1.get_users'),
+            content_type='application/json',
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_only_token_digest_is_stored(self):
+        token = Token.find(self.token)
+
+        self.assertEqual(token.token_digest, token_digest(self.token))
+        self.assertIsNone(token.token)
+        self.assertNotIn('token', Token.__table__.columns)
+        self.assertIsNone(Token.find(self.token + 'w'))
+
+    def test_authentication_is_cached(self):
+        for x in range(3):
+            response = self.client.get(
+                url_for('api.v1.get_users'),
+                content_type='application/json',
+                headers={'Authentication-Token': self.token}
+            )
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(auth_cache.stats()['misses'], 1)
+        self.assertEqual(auth_cache.stats()['hits'], 2)
+
     def test_delete_token_wrong_token(self):
         response = self.client.delete(
             url_for('api.v1.refresh_token'),
@@ -144,3 +337,112 @@ class TokensTest(BaseTestCase):
         )
 
         self.assertEqual(response.status_code, 401)
+
+
+class StatelessTokensTest(BaseTestCase):
+    def create_app(self):
+        app = super().create_app()
+        app.config['TOKEN_MODE'] = 'stateless'
+        token_revocations.init_app(app)
+        return app
+
+    def setUp(self):
+        super().setUp()
+
+        self.user = UserFactory.create()
+        db.session.add(self.user)
+        db.session.commit()
+
+        self.api_app = self.create_api_app(self.user)
+
+        response = self.client.post(
+            url_for('api.v1.get_token'),
+            data=json.dumps({
+                'email': self.user.email,
+                'password': '111',
+                'secret': self.api_app.secret,
+            }),
+            content_type='application/json',
+        )
+        self.token = json.loads(response.data.decode('utf-8'))['token']
+
+    def get_users(self, token):
+        auth_cache.clear()
+        return self.client.get(
+            url_for('api.v1.get_users'),
+            content_type='application/json',
+            headers={'Authentication-Token': token}
+        )
+
+    def test_token_is_self_describing(self):
+        data, header = Token.load_auth_token(self.token)
+
+        self.assertEqual(data['user_id'], self.user.id)
+        self.assertEqual(data['group_id'], self.user.group_id)
+        self.assertEqual(data['app_id'], self.api_app.id)
+        self.assertEqual(data['gen'], 1)
+
+    def test_token_is_verified_without_token_row(self):
+        Token.query.delete()
+        db.session.commit()
+
+        self.assertEqual(self.get_users(self.token).status_code, 200)
+
+    def test_refresh_token(self):
+        response = self.client.put(
+            url_for('api.v1.refresh_token'),
+            content_type='application/json',
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        token = json.loads(response.data.decode('utf-8'))['token']
+
+        self.assertEqual(self.get_users(self.token).status_code, 401)
+        self.assertEqual(self.get_users(token).status_code, 200)
+
+    def test_revoke_token(self):
+        response = self.client.delete(
+            url_for('api.v1.revoke_token'),
+            content_type='application/json',
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.get_users(self.token).status_code, 401)
+
+    def test_changed_user_token_is_revoked(self):
+        # the token claims the user is inactive
+        response = self.client.put(
+            url_for('api.v1.edit_user', user_id=self.user.id),
+            data=json.dumps({'active': True}),
+            content_type='application/json',
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.get_users(self.token).status_code, 401)
+
+    def test_deleted_user_token_is_revoked(self):
+        response = self.client.delete(
+            url_for('api.v1.delete_user', user_id=self.user.id),
+            content_type='application/json',
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 204)
+
+        self.assertEqual(self.get_users(self.token).status_code, 401)
+
+    def test_revocations_are_reloaded_from_database(self):
+        response = self.client.delete(
+            url_for('api.v1.revoke_token'),
+            content_type='application/json',
+            headers={'Authentication-Token': self.token}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        revocations = RevocationSet(self.app, loader=Token.revocations)
+        revocations.reload()
+
+        self.assertTrue(revocations.is_revoked(self.api_app.id, self.user.id, 1))
+        self.assertFalse(revocations.is_revoked(self.api_app.id, self.user.id, 2))
@@ -2,7 +2,11 @@ import json
 
 from flask import request
 from flask_login import login_required
+from sqlalchemy.exc import IntegrityError
 
+from monetario.extensions import auth_cache
+from monetario.extensions import login_throttle
+from monetario.extensions import token_revocations
 from monetario.models import db
 from monetario.models import App
 from monetario.models import User
@@ -16,28 +20,74 @@ from monetario.views.api.decorators import jsonify
 @jsonify()
 def get_token():
     token_schema = Token.from_json(json.loads(request.data.decode('utf-8')))
-    app = App.verify_auth_token(token_schema.data['secret'])
 
-    if not app or app.secret != token_schema.data['secret']:
+    # throttled before any query or password hashing is done, the app id
+    # only needs the signature of the secret to be checked
+    app_id = App.load_app_id(token_schema.data.get('secret', ''))
+    email = token_schema.data.get('email')
+
+    if app_id is not None and login_throttle.get_limit('app', app_id) is None:
+        # the limit of the app is kept with the throttle counters for a while
+        app = App.query.get(app_id)
+        login_throttle.set_limit('app', app_id, app.login_throttle_limit if app else None)
+
+    login_throttle.limit({
+        'ip': request.remote_addr,
+        'email': email.strip().lower() if email else None,
+        'app': app_id,
+    })
+
+    if app_id is None:
         return {}, 400
 
-    user = User.query.filter_by(email=token_schema.data['email']).first()
-    if user and user.verify_password(token_schema.data['password']):
-        token = Token.query.filter(Token.app_id == app.id, Token.user_id == user.id).first()
-        if not token:
-            token = Token(app_id=app.id, user_id=user.id)
+    # app, user and token are fetched in one statement and the token row is
+    # written together with its signed value in one commit
+    row = (
+        db.session.query(User, Token)
+        .select_from(User)
+        .join(App, db.and_(App.id == app_id, App.secret == token_schema.data['secret']))
+        .outerjoin(Token, db.and_(Token.app_id == App.id, Token.user_id == User.id))
+        .filter(User.email == token_schema.data['email'])
+        .first()
+    )
+
+    if not row:
+        return {}, 400
 
-        db.session.add(token)
-        db.session.commit()
+    user, token = row
 
-        token.token = token.generate_auth_token()
+    if not user.verify_password(token_schema.data['password']):
+        return {}, 400
 
-        db.session.add(token)
+    user.upgrade_password_hash(token_schema.data['password'])
+    user_id = user.id
+
+    if not token:
+        token = Token(app_id=app_id, user_id=user_id, user=user)
+    elif token.token_digest:
+        auth_cache.invalidate_digest(token.token_digest)
+
+    # committing expires the instances, so keep what the response needs
+    value = token.issue()
+    generation = token.generation
+    db.session.add(token)
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # a concurrent login has inserted the token row first
+        db.session.rollback()
+
+        token = Token.query.filter(Token.app_id == app_id, Token.user_id == user_id).one()
+        if token.token_digest:
+            auth_cache.invalidate_digest(token.token_digest)
+        value = token.issue()
+        generation = token.generation
         db.session.commit()
 
-        return {'token': token.token}, 200
+    token_revocations.revoke(app_id, user_id, generation)
 
-    return {}, 400
+    return {'token': value}, 200
 
 
 @bp.route('/token/', methods=['PUT'])
@@ -46,14 +96,17 @@ def refresh_token():
     auth_token = request.headers.get('Authentication-Token')
 
     if auth_token:
-        token = Token.query.filter(Token.token == auth_token).first()
+        token = Token.find(auth_token)
 
         if token:
-            token.token = token.generate_auth_token()
+            auth_cache.invalidate(auth_token)
+            token.issue()
 
             db.session.add(token)
             db.session.commit()
 
+            token_revocations.revoke(token.app_id, token.user_id, token.generation)
+
             return {'token': token.token}, 200
 
     return {}, 400
@@ -65,12 +118,19 @@ def refresh_token():
 def revoke_token():
     auth_token = request.headers.get('Authentication-Token')
     if auth_token:
-        token = Token.query.filter(Token.token == auth_token).first()
+        token = Token.find(auth_token)
 
-        token.token = None
+        auth_cache.invalidate(auth_token)
+
+        if not token:
+            return {}, 400
+
+        token.revoke()
 
         db.session.add(token)
         db.session.commit()
 
+        token_revocations.revoke(token.app_id, token.user_id, token.generation)
+
         return token, 200
     return {}, 400
@@ -7,6 +7,7 @@ from flask import request
 from flask_login import login_required
 from flask_login import current_user
 
+from monetario.extensions import exchange_rates
 from monetario.models import db
 from monetario.models import Account
 from monetario.models import GroupCurrency
@@ -57,6 +58,8 @@ def make_transaction(user: User, source_account_id: int, target_account_id: int,
     )
     db.session.add(target_record)
 
+    exchange_rates.set_amount_base(transaction, source_record, target_record)
+
     db.session.commit()
 
     return transaction
@@ -104,6 +107,8 @@ def update_transaction(transaction: Transaction, user: User, source_account_id:
 
     db.session.add(target_record)
 
+    exchange_rates.set_amount_base(transaction, source_record, target_record)
+
     db.session.commit()
 
     return transaction
@@ -187,7 +192,7 @@ def add_transaction():
         return {'errors': {'currency': 'Group currency with this id does not exist'}}, 400
 
     transaction = make_transaction(
-        user=current_user,
+        user=current_user.user,
         source_account_id=transaction_data['source_account_id'],
         target_account_id=transaction_data['target_account_id'],
         amount=transaction_data['amount'],
@@ -245,7 +250,7 @@ def edit_transaction(transaction_id):
 
     transaction = update_transaction(
         transaction=transaction,
-        user=current_user,
+        user=current_user.user,
         source_account_id=transaction_data['source_account_id'],
         target_account_id=transaction_data['target_account_id'],
         amount=transaction_data['amount'],
@@ -7,7 +7,10 @@ from flask_login import current_user
 from flask_login import login_required
 
 from monetario.models import db
+from monetario.extensions import auth_cache
+from monetario.extensions import token_revocations
 from monetario.models import Group
+from monetario.models import Token
 from monetario.models import User
 
 from monetario.views.api.v1 import bp
@@ -15,16 +18,29 @@ from monetario.views.api.decorators import jsonify
 from monetario.views.api.decorators import collection
 
 
+def revoke_stateless_tokens(user_id):
+    """
+    Stateless tokens carry the group and the active flag of their user and
+    are verified without reading it, so start a new generation of every
+    token of ``user_id`` when those change. Returns the revocations to
+    publish once committed.
+    """
+    if not token_revocations.enabled:
+        return []
+
+    tokens = Token.query.filter(Token.user_id == user_id).all()
+    for token in tokens:
+        token.revoke()
+
+    return [(token.app_id, token.user_id, token.generation) for token in tokens]
+
+
 @bp.route('/users/', methods=['GET'])
 @login_required
 @jsonify()
-@collection(User)
+@collection(User, joins=((User.group, False), ))
 def get_users():
-    return (
-        User.query
-        .options(db.contains_eager(User.group))
-        .join(Group, Group.id == User.group_id)
-    )
+    return User.query.filter(User.group_id.isnot(None))
 
 
 @bp.route('/users/<int:user_id>/', methods=['GET'])
@@ -44,7 +60,7 @@ def get_user(user_id):
 @login_required
 @jsonify()
 def get_current_user():
-    return current_user
+    return current_user.user
 
 
 @bp.route('/users/<int:user_id>/', methods=['DELETE'])
@@ -53,9 +69,18 @@ def get_current_user():
 def delete_user(user_id):
     user = User.query.get_or_404(user_id)
 
+    # the token rows lose their user with it, so other workers only learn of
+    # the revocations through Redis, or when the tokens expire
+    revocations = revoke_stateless_tokens(user_id)
+
     db.session.delete(user)
     db.session.commit()
 
+    for revocation in revocations:
+        token_revocations.revoke(*revocation)
+
+    auth_cache.invalidate_user(user_id)
+
     return {}, 204
 
 
@@ -106,10 +131,21 @@ def edit_user(user_id):
         if email_duplicate_user:
             return {'errors': {'email': 'User with this email is already exists'}}, 400
 
+    claims = (user.group_id, user.active)
+
     for field, value in user_schema.data.items():
         if hasattr(user, field):
             setattr(user, field, value)
 
+    revocations = []
+    if (user.group_id, user.active) != claims:
+        revocations = revoke_stateless_tokens(user_id)
+
     db.session.commit()
 
+    for revocation in revocations:
+        token_revocations.revoke(*revocation)
+
+    auth_cache.invalidate_user(user_id)
+
     return user, 200